@@ -0,0 +1,284 @@
+"""
+Headless batch analysis of a folder of medical images.
+
+Usage:
+    python batch.py IMAGE_DIR --output results.jsonl [--language en] [--no-genai]
+
+Writes one JSON line per image as soon as it completes. Re-running with the
+same output file skips images that already have a successful result.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from config import BATCH_MAX_SIZE
+from models.async_genai import AsyncGeminiClient
+from models.triage import TriageScheduler, provisional_priority, skipped_analysis
+from utils.metrics import metrics
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".dcm", ".dicom")
+
+
+def iter_images(root):
+    """Yield image paths under root in a stable order."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(dirpath, filename)
+
+
+def load_completed(output_path):
+    """
+    Read the paths that already have a successful result.
+
+    Args:
+        output_path: JSONL results file, which may not exist yet
+
+    Returns:
+        set: Image paths to skip
+    """
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Partial line left by a crash
+                continue
+            if "error" not in record:
+                completed.add(record["path"])
+    return completed
+
+
+def load_and_preprocess(path):
+    """Read, decode and preprocess one image; runs in a worker process."""
+    from utils.image_processing import preprocess_image
+
+    with open(path, "rb") as f:
+        image_bytes = f.read()
+    return image_bytes, preprocess_image(image_bytes)
+
+
+def start_event_loop():
+    """Run an asyncio event loop on a daemon thread for the Gemini stage."""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="batch-genai", daemon=True).start()
+    return loop
+
+
+class ResultWriter:
+    """Append JSONL records and report progress and throughput."""
+
+    def __init__(self, output_path, total, progress_every=10):
+        self.total = total
+        self.progress_every = progress_every
+        self.done = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._file = open(output_path, "a", encoding="utf-8")
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            self.done += 1
+            if "error" in record:
+                self.failed += 1
+            if self.done % self.progress_every == 0 or self.done == self.total:
+                self._print_progress()
+
+    def rate(self):
+        elapsed = time.perf_counter() - self.started
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def close(self):
+        self._file.close()
+
+    def _print_progress(self):
+        print(
+            f"[{self.done}/{self.total}] {self.rate():.2f} images/s, {self.failed} failed",
+            file=sys.stderr,
+            flush=True
+        )
+
+
+def run_batch(image_dir, output_path, language="en", use_genai=True, workers=None,
+              batch_size=BATCH_MAX_SIZE, genai_workers=4):
+    """
+    Analyze every image under image_dir and stream results to output_path.
+
+    Decoding and preprocessing run in a process pool, the classifier runs on
+    batches of batch_size images, and Gemini calls go through the async
+    client (rate limited, with timeouts and retries) with at most
+    genai_workers requests in flight. Each free request slot takes the most
+    urgent classified image (see models.triage), and confident normals are
+    deferred or skipped by the triage policy.
+
+    Returns:
+        dict: Counts of processed, failed and skipped images and throughput
+    """
+    from models import registry
+
+    completed = load_completed(output_path)
+    all_paths = list(iter_images(image_dir))
+    paths = [path for path in all_paths if path not in completed]
+    # The output file may also hold results for images outside image_dir
+    skipped = len(all_paths) - len(paths)
+
+    writer = ResultWriter(output_path, len(paths))
+    classifier = registry.get_classifier()
+    genai_helper = registry.get_genai_helper() if use_genai else None
+    client = AsyncGeminiClient(genai_helper, max_concurrency=genai_workers) if use_genai else None
+
+    # Keep the number of images held in memory bounded
+    max_pending = max(batch_size * 2, (workers or os.cpu_count() or 1) * 2)
+    genai_slots = threading.BoundedSemaphore(genai_workers * 2)
+    scheduler = TriageScheduler()
+
+    genai_loop = start_event_loop() if use_genai else None
+    genai_futures = set()
+    turns = None
+
+    async def run_next():
+        nonlocal turns
+        if turns is None:
+            # Created on the loop thread, which runs every coroutine here
+            turns = asyncio.Semaphore(genai_workers)
+        async with turns:
+            # Chosen only once a request slot is free, so the most urgent
+            # image queued by then goes next
+            (path, image_bytes, cv_results), _ = scheduler.get()
+            record = {"path": path, "cv_results": cv_results, "triage": provisional_priority(cv_results)}
+            try:
+                genai_results = await client.analyze_medical_image(image_bytes, cv_results, language=language)
+                record["genai_results"] = genai_results
+                if "error" in genai_results:
+                    record["error"] = genai_results["error"]
+            except Exception as e:
+                record["error"] = str(e)
+            finally:
+                writer.write(record)
+                genai_slots.release()
+
+    def schedule(path, image_bytes, cv_results):
+        if genai_helper is None:
+            writer.write({"path": path, "cv_results": cv_results})
+            return
+        if scheduler.tier(cv_results)[0] is not None:
+            # Block here rather than queueing unbounded Gemini work
+            genai_slots.acquire()
+        tier, priority = scheduler.put((path, image_bytes, cv_results), cv_results)
+        if tier is None:
+            writer.write({
+                "path": path, "cv_results": cv_results, "triage": priority,
+                "genai_results": skipped_analysis(cv_results)
+            })
+            return
+        future = asyncio.run_coroutine_threadsafe(run_next(), genai_loop)
+        genai_futures.add(future)
+        future.add_done_callback(genai_futures.discard)
+
+    def classify(ready):
+        try:
+            results = classifier.detect_anomalies_batch([preprocessed for _, _, preprocessed in ready])
+        except Exception as e:
+            for path, _, _ in ready:
+                writer.write({"path": path, "error": str(e)})
+            return
+        # Errors are recorded per image: earlier images may already be
+        # queued for Gemini and will write their own records
+        for (path, image_bytes, _), cv_results in zip(ready, results):
+            try:
+                schedule(path, image_bytes, cv_results)
+            except Exception as e:
+                writer.write({"path": path, "cv_results": cv_results, "error": str(e)})
+
+    # Spawned, not forked: TensorFlow is loaded and running threads by now,
+    # and a forked child can deadlock on locks those threads held
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as process_pool:
+        remaining = iter(paths)
+        pending = {}
+        ready = []
+        exhausted = False
+
+        while pending or not exhausted or ready:
+            while not exhausted and len(pending) < max_pending:
+                path = next(remaining, None)
+                if path is None:
+                    exhausted = True
+                    break
+                pending[process_pool.submit(load_and_preprocess, path)] = path
+
+            if pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    path = pending.pop(future)
+                    try:
+                        image_bytes, preprocessed = future.result()
+                    except Exception as e:
+                        writer.write({"path": path, "error": str(e)})
+                        continue
+                    ready.append((path, image_bytes, preprocessed))
+
+            # Flush a full batch, or whatever is left once input runs dry
+            if len(ready) >= batch_size or (ready and not pending and exhausted):
+                batch, ready = ready[:batch_size], ready[batch_size:]
+                classify(batch)
+
+    if genai_loop is not None:
+        wait(list(genai_futures))
+        genai_loop.call_soon_threadsafe(genai_loop.stop)
+    writer.close()
+    # Inference and Gemini stages run in this process; preprocessing spans
+    # stay in the worker processes and are not included
+    metrics.write()
+    return {
+        "processed": writer.done,
+        "failed": writer.failed,
+        "skipped": skipped,
+        "images_per_second": writer.rate()
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze a folder of medical images without the UI.")
+    parser.add_argument("image_dir", help="Folder to scan recursively for images")
+    parser.add_argument("--output", "-o", default="results.jsonl", help="JSONL file to append results to")
+    parser.add_argument("--language", choices=["en", "hi", "ta"], default="en")
+    parser.add_argument("--no-genai", action="store_true", help="Only run the computer vision model")
+    parser.add_argument("--workers", type=int, default=None, help="Preprocessing processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_MAX_SIZE)
+    parser.add_argument("--genai-workers", type=int, default=4, help="Concurrent Gemini requests")
+    args = parser.parse_args(argv)
+
+    summary = run_batch(
+        args.image_dir,
+        args.output,
+        language=args.language,
+        use_genai=not args.no_genai,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        genai_workers=args.genai_workers
+    )
+    print(
+        f"Done: {summary['processed']} processed, {summary['failed']} failed, "
+        f"{summary['skipped']} skipped, {summary['images_per_second']:.2f} images/s",
+        file=sys.stderr
+    )
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
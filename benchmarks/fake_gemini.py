@@ -0,0 +1,144 @@
+"""
+Local stand-in for the Gemini model used by GeminiHelper.
+
+Returns a fixed report after an optional delay, so benchmarks measure the
+app's own work (prompt building, payload encoding, report formatting)
+without network calls or an API key. FakeGeminiServer does the same over
+HTTP for the REST transport.
+"""
+
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FAKE_ANALYSIS = """
+1. Hospital Priority: ORANGE - Monitor
+2. Visible features: Bilateral lung fields are visible with normal cardiac silhouette.
+   Mild increased opacity is noted in the right lower zone.
+3. Abnormalities: Patchy opacity in the right lower zone, possibly consolidation.
+4. Possible diagnoses: Early pneumonia; atelectasis.
+5. Recommendations: Clinical correlation, repeat imaging in 48 hours if symptoms persist.
+""" * 4
+
+
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGeminiModel:
+    """
+    Mimic GenerativeModel.generate_content (and its async variant) for
+    text + inline image requests.
+
+    Args:
+        text: Analysis text to return
+        latency: Seconds to sleep per request, to model network time
+        chunk_size: Characters per chunk when streaming
+    """
+
+    def __init__(self, text=FAKE_ANALYSIS, latency=0.0, chunk_size=200):
+        self.text = text
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.calls = 0
+        self.payload_bytes = 0
+
+    def generate_content(self, contents, stream=False):
+        self.calls += 1
+        for part in contents:
+            if isinstance(part, dict):
+                self.payload_bytes += len(part["data"])
+        if self.latency:
+            time.sleep(self.latency)
+        if stream:
+            return [FakeChunk(self.text[i:i + self.chunk_size]) for i in range(0, len(self.text), self.chunk_size)]
+        return FakeChunk(self.text)
+
+    async def generate_content_async(self, contents):
+        self.calls += 1
+        for part in contents:
+            if isinstance(part, dict):
+                self.payload_bytes += len(part["data"])
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return FakeChunk(self.text)
+
+
+class FakeGeminiServer:
+    """
+    Local HTTP stand-in for the Gemini generateContent REST endpoint.
+
+    Answers on 127.0.0.1 with the response shape RestTransport parses, so
+    the async client can be exercised offline. Use as a context manager,
+    or call start() and stop().
+
+    Args:
+        text: Analysis text to return
+        latency: Seconds to wait before answering each request
+        failures: HTTP status codes returned, in order, by the first
+            requests before they start succeeding
+    """
+
+    def __init__(self, text=FAKE_ANALYSIS, latency=0.0, failures=()):
+        self.text = text
+        self.latency = latency
+        self.failures = list(failures)
+        self.calls = 0
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                with fake._lock:
+                    fake.calls += 1
+                    fake.requests.append(body)
+                    status = fake.failures.pop(0) if fake.failures else 200
+                if fake.latency:
+                    time.sleep(fake.latency)
+                if status != 200:
+                    self.send_error(status)
+                    return
+                payload = json.dumps({
+                    "candidates": [{"content": {"parts": [{"text": fake.text}]}}],
+                    # Rough token counts, so usage metrics have something to record
+                    "usageMetadata": {"promptTokenCount": len(json.dumps(body)) // 4,
+                                      "candidatesTokenCount": len(fake.text) // 4},
+                }).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="fake-gemini", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
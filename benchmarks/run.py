@@ -0,0 +1,327 @@
+"""
+Micro-benchmarks for each stage of the analysis pipeline.
+
+Usage:
+    python -m benchmarks.run [--sizes 512 1024 2048 4096 7680] [--repeat 5]
+    python -m benchmarks.run --save-baseline baseline.json
+    python -m benchmarks.run --output results.json --baseline baseline.json
+    python -m benchmarks.run --inference [--batch-sizes 1 4 16]
+
+Every stage runs on a synthetic image at each size (longest side, 4:3).
+Gemini is replaced with a local fake. Timings are wall-clock per call;
+peak memory is the largest Python/NumPy heap growth seen by tracemalloc
+during one extra call (native TensorFlow buffers are not included).
+
+With --baseline, any stage whose median time or peak memory grows by more
+than --threshold (and by more than the absolute noise floor) is reported
+and the exit status is 1. Baselines are machine-specific, so none is
+committed; record one on the machine you compare on.
+
+--inference instead compares per-image latency of the Keras classifier's
+compiled entry point against plain model.predict at each batch size.
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from benchmarks.fake_gemini import FakeGeminiModel
+from utils.image_processing import preprocess_image, draw_anomalies
+from utils.report_generator import generate_report
+
+DEFAULT_SIZES = (512, 1024, 2048, 4096, 7680)
+DEFAULT_BATCH_SIZES = (1, 4, 16)
+CLASSIFIER_STAGES = ("ImageClassifier.preprocess", "ImageClassifier.detect_anomalies")
+
+# Differences below these are treated as noise whatever the ratio
+MIN_TIME_DELTA_MS = 1.0
+MIN_MEMORY_DELTA_MB = 1.0
+
+
+def make_image(size, seed=0):
+    """
+    Build a deterministic BGR test image whose longest side is size.
+
+    A smooth gradient with a few bright blobs and sensor-like noise, so
+    compression and contrast enhancement behave roughly as on real scans.
+    """
+    width, height = size, size * 3 // 4
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = 60 + 80 * (x / width) + 40 * (y / height)
+    for cx, cy, r in ((0.3, 0.4, 0.08), (0.65, 0.55, 0.12), (0.5, 0.2, 0.05)):
+        base += 90 * np.exp(-(((x - cx * width) ** 2 + (y - cy * height) ** 2) / (2 * (r * width) ** 2)))
+    base += rng.normal(0, 6, base.shape).astype(np.float32)
+    gray = np.clip(base, 0, 255).astype(np.uint8)
+    return cv2.merge([gray, gray, gray])
+
+
+def make_cv_results(image):
+    """Detection results with a few regions placed relative to the image size."""
+    height, width = image.shape[:2]
+    return {
+        "has_anomaly": True,
+        "confidence": 0.87,
+        "class_index": 1,
+        "regions": [
+            {"x": int(width * fx), "y": int(height * fy),
+             "width": int(width * fw), "height": int(height * fh), "score": score}
+            for fx, fy, fw, fh, score in (
+                (0.25, 0.3, 0.1, 0.15, 0.93), (0.6, 0.5, 0.15, 0.12, 0.81), (0.45, 0.15, 0.08, 0.08, 0.66)
+            )
+        ],
+    }
+
+
+def build_stages(classifier, helper):
+    """
+    Return the benchmarked stages as (name, callable(image, context)) pairs.
+
+    Stages whose dependency could not be built are left out.
+    """
+    stages = [
+        ("preprocess_image", lambda image, ctx: preprocess_image(image)),
+    ]
+    if classifier is not None:
+        stages += [
+            ("ImageClassifier.preprocess", lambda image, ctx: classifier.preprocess(image)),
+            ("ImageClassifier.detect_anomalies", lambda image, ctx: classifier.detect_anomalies(image)),
+        ]
+    if helper is not None:
+        stages += [
+            ("GeminiHelper.encode_payload", lambda image, ctx: helper.encode_payload(image)),
+            ("GeminiHelper.analyze_medical_image", lambda image, ctx: helper.analyze_medical_image(
+                image, ctx["cv_results"], use_cache=False)),
+        ]
+    stages += [
+        ("draw_anomalies", lambda image, ctx: draw_anomalies(image, ctx["cv_results"])),
+        ("generate_report", lambda image, ctx: generate_report(
+            "benchmark.png", ctx["cv_results"], ctx["genai_results"])),
+    ]
+    return stages
+
+
+def measure(func, repeat):
+    """
+    Time a callable and record its peak memory.
+
+    Returns:
+        dict: median/min/mean milliseconds and peak heap growth in MB
+    """
+    # One untimed call so lazy initialisation is not charged to the stage
+    func()
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "median_ms": round(statistics.median(times), 3),
+        "min_ms": round(min(times), 3),
+        "mean_ms": round(statistics.fmean(times), 3),
+        "peak_mb": round(peak / 1e6, 3),
+    }
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, repeat=5, stages=None, classifier=None, helper=None, log=None):
+    """
+    Run every stage at every size.
+
+    Args:
+        sizes: Longest image sides to test
+        repeat: Timed calls per stage and size
+        stages: Optional stage names to restrict the run to
+        classifier: ImageClassifier, or None to skip its stages
+        helper: GeminiHelper around a fake model, or None to skip its stages
+        log: Optional callable for progress lines
+
+    Returns:
+        dict: Run metadata and results keyed "stage@size"
+    """
+    selected = [(name, func) for name, func in build_stages(classifier, helper)
+                if stages is None or name in stages]
+    fake_genai = {"analysis": FakeGeminiModel().text, "confidence": 0.85}
+
+    results = {}
+    for size in sizes:
+        image = make_image(size)
+        context = {"cv_results": make_cv_results(image), "genai_results": fake_genai}
+        for name, func in selected:
+            key = f"{name}@{size}"
+            results[key] = measure(lambda: func(image, context), repeat)
+            if log:
+                log(f"{key:<45} {results[key]['median_ms']:>10.2f} ms {results[key]['peak_mb']:>9.1f} MB")
+        del image
+
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "repeat": repeat,
+            "sizes": list(sizes),
+        },
+        "results": results,
+    }
+
+
+def benchmark_inference(classifier, batch_sizes=DEFAULT_BATCH_SIZES, repeat=20, log=None):
+    """
+    Compare the compiled inference path with Keras model.predict.
+
+    Args:
+        classifier: Keras-backend ImageClassifier built with compiled=True
+        batch_sizes: Images per forward pass to test
+        repeat: Timed calls per path and batch size
+        log: Optional callable for progress lines
+
+    Returns:
+        dict: Timings keyed "path@batch_size", with per_image_ms added
+    """
+    model = classifier.cam_model or classifier.model
+    classifier.warm_up(max(batch_sizes))
+    paths = {
+        "model.predict": lambda batch: model.predict(classifier.to_float(batch), verbose=0),
+        "compiled": classifier.predict_with_features,
+    }
+
+    results = {}
+    for batch_size in batch_sizes:
+        batch = classifier.preprocess_batch([make_image(512, seed) for seed in range(batch_size)])
+        for name, func in paths.items():
+            key = f"{name}@{batch_size}"
+            timing = measure(lambda: func(batch), repeat)
+            timing["per_image_ms"] = round(timing["median_ms"] / batch_size, 3)
+            results[key] = timing
+            if log:
+                log(f"{key:<25} {timing['per_image_ms']:>10.2f} ms/image")
+    return results
+
+
+def compare(results, baseline, threshold=0.2):
+    """
+    Compare results against a baseline.
+
+    Args:
+        results: Output of run_benchmarks
+        baseline: Earlier output of run_benchmarks
+        threshold: Allowed relative growth, e.g. 0.2 for +20%
+
+    Returns:
+        list: Regression dicts with key, metric, baseline, current and ratio
+    """
+    regressions = []
+    for key, current in results["results"].items():
+        previous = baseline.get("results", {}).get(key)
+        if previous is None:
+            continue
+        for metric, floor in (("median_ms", MIN_TIME_DELTA_MS), ("peak_mb", MIN_MEMORY_DELTA_MB)):
+            before, after = previous[metric], current[metric]
+            if after - before > floor and after > before * (1 + threshold):
+                regressions.append({
+                    "key": key,
+                    "metric": metric,
+                    "baseline": before,
+                    "current": after,
+                    "ratio": round(after / before, 2) if before else None,
+                })
+    return regressions
+
+
+def _load_classifier(backend, model_path):
+    from models.classifier import ImageClassifier
+
+    try:
+        return ImageClassifier(model_path=model_path, backend=backend)
+    except Exception as e:
+        print(f"Skipping classifier stages: {e}", file=sys.stderr)
+        return None
+
+
+def main(argv=None):
+    from models.genai_helper import GeminiHelper
+    from utils.image_encoding import PayloadEncoder
+
+    parser = argparse.ArgumentParser(description="Benchmark each pipeline stage and check for regressions.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="Longest image sides")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed calls per stage and size")
+    parser.add_argument("--stages", nargs="+", help="Only run these stages")
+    parser.add_argument("--backend", default=None, help="Classifier backend (defaults to config)")
+    parser.add_argument("--model-path", default=None, help="Custom classifier model")
+    parser.add_argument("--no-classifier", action="store_true", help="Skip the classifier stages")
+    parser.add_argument("--output", help="Write the JSON results here")
+    parser.add_argument("--baseline", help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed relative regression (0.2 = 20%%)")
+    parser.add_argument("--save-baseline", help="Write the results as a new baseline here")
+    parser.add_argument("--inference", action="store_true",
+                        help="Compare compiled inference with model.predict instead")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=list(DEFAULT_BATCH_SIZES),
+                        help="Batch sizes for --inference")
+    args = parser.parse_args(argv)
+
+    if args.inference:
+        classifier = _load_classifier("keras", args.model_path)
+        if classifier is None or not classifier.compiled:
+            sys.exit("--inference needs the Keras backend with COMPILED_INFERENCE enabled")
+        results = benchmark_inference(classifier, args.batch_sizes, args.repeat,
+                                      log=lambda line: print(line, file=sys.stderr))
+        print(json.dumps(results, indent=2))
+        return
+
+    classifier = None
+    wants_classifier = args.stages is None or any(stage in CLASSIFIER_STAGES for stage in args.stages)
+    if wants_classifier and not args.no_classifier:
+        backend = args.backend
+        if backend is None:
+            from config import MODEL_BACKEND
+            backend = MODEL_BACKEND
+        classifier = _load_classifier(backend, args.model_path)
+
+    helper = GeminiHelper(cache=False, model=FakeGeminiModel())
+    # Encode on every call so the encode_payload and analyze stages measure
+    # the encoder, not its memo
+    helper.encoder = PayloadEncoder(cache_size=0)
+
+    results = run_benchmarks(args.sizes, args.repeat, args.stages, classifier, helper,
+                             log=lambda line: print(line, file=sys.stderr))
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(results, f, indent=2)
+    if not args.output and not args.save_baseline:
+        print(json.dumps(results, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for r in regressions:
+            print(f"REGRESSION {r['key']} {r['metric']}: {r['baseline']} -> {r['current']} (x{r['ratio']})",
+                  file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
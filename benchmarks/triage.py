@@ -0,0 +1,116 @@
+"""
+Simulated comparison of Gemini triage against first in, first out.
+
+Usage:
+    python -m benchmarks.triage [--cases 200] [--workers 4] [--latency 0.05]
+        [--red-share 0.1] [--normal-share 0.5] [--seed 0]
+
+A backlog of classified cases is handed to a pool of Gemini workers that
+call a local fake with a fixed latency. Each case gets random CV results:
+red-share are confident anomalies, normal-share confident normals (a
+high normal-class score) and the rest borderline. The same cases are run
+through a TriageScheduler with triage off, and on with each policy for
+confident normals, and the median and 95th percentile time-to-answer per
+provisional priority is printed with the number of Gemini calls made.
+"""
+
+import argparse
+import random
+import statistics
+import threading
+import time
+
+from benchmarks.fake_gemini import FakeGeminiModel
+from models.triage import TriageScheduler, provisional_priority
+
+
+def make_cases(count, red_share=0.1, normal_share=0.5, seed=0):
+    """Build deterministic CV results for a simulated backlog."""
+    rng = random.Random(seed)
+    cases = []
+    for _ in range(count):
+        draw = rng.random()
+        if draw < red_share:
+            cv_results = {"has_anomaly": True, "confidence": rng.uniform(0.8, 1.0)}
+        elif draw < red_share + normal_share:
+            # Top class is the normal one
+            normal = rng.uniform(0.95, 1.0)
+            cv_results = {"has_anomaly": False, "confidence": normal, "normal_confidence": normal}
+        else:
+            cv_results = {"has_anomaly": rng.random() < 0.5, "confidence": rng.uniform(0.3, 0.79),
+                          "normal_confidence": rng.uniform(0.0, 0.7)}
+        cases.append(cv_results)
+    return cases
+
+
+def simulate(cases, enabled, normal_policy="run", workers=4, latency=0.05):
+    """
+    Run every case through a scheduler and a fake Gemini worker pool.
+
+    Returns:
+        dict: Time-to-answer in seconds per provisional priority, Gemini
+            calls made and cases skipped
+    """
+    scheduler = TriageScheduler(enabled=enabled, normal_policy=normal_policy)
+    model = FakeGeminiModel(text="1. Hospital Priority: GREEN", latency=latency)
+    answered = {}
+    lock = threading.Lock()
+    started = time.perf_counter()
+
+    for cv_results in cases:
+        tier, priority = scheduler.put(provisional_priority(cv_results), cv_results)
+        if tier is None:
+            # Answered at once from the CV result
+            answered.setdefault(priority, []).append(0.0)
+
+    def work():
+        while True:
+            item, _ = scheduler.get()
+            if item is None:
+                return
+            model.generate_content(["prompt"])
+            with lock:
+                answered.setdefault(item, []).append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=work, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    scheduler.close(workers)
+    for thread in threads:
+        thread.join()
+    return {"answered": answered, "calls": model.calls, "skipped": scheduler.stats()["skipped"]}
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare Gemini triage with first in, first out on a simulated backlog.")
+    parser.add_argument("--cases", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent Gemini requests")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per fake Gemini call")
+    parser.add_argument("--red-share", type=float, default=0.1)
+    parser.add_argument("--normal-share", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    cases = make_cases(args.cases, args.red_share, args.normal_share, args.seed)
+    runs = [("fifo", False, "run"), ("triage/run", True, "run"),
+            ("triage/defer", True, "defer"), ("triage/skip", True, "skip")]
+
+    print(f"{'mode':<14} {'priority':<8} {'cases':>6} {'median ms':>10} {'p95 ms':>10}")
+    for name, enabled, policy in runs:
+        result = simulate(cases, enabled, policy, args.workers, args.latency)
+        for priority in ("RED", "ORANGE", "GREEN"):
+            times = result["answered"].get(priority)
+            if not times:
+                continue
+            print(f"{name:<14} {priority:<8} {len(times):>6} "
+                  f"{statistics.median(times) * 1000:>10.0f} {_percentile(times, 0.95) * 1000:>10.0f}")
+        print(f"{name:<14} {'calls':<8} {result['calls']:>6}  ({result['skipped']} skipped)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import json
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from config import ANALYSIS_SERVER_URL
+
+
+class ServerError(Exception):
+    """Raised when the analysis server rejects a request or a job fails."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class AnalysisClient:
+    """
+    Thin client for the local analysis server started with server.py.
+
+    Holds no models; images are uploaded and results polled over HTTP, so
+    a UI using it starts instantly and shares the server's models.
+    """
+
+    def __init__(self, base_url=ANALYSIS_SERVER_URL, timeout=30, poll_interval=0.25):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+
+    def _request(self, method, path, data=None, content_type=None):
+        request = urllib.request.Request(self.base_url + path, data=data, method=method)
+        if content_type:
+            request.add_header("Content-Type", content_type)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get("error", e.reason)
+            except ValueError:
+                message = e.reason
+            raise ServerError(message, status=e.code)
+        except urllib.error.URLError as e:
+            raise ServerError(f"Analysis server unavailable: {e.reason}")
+
+    def health(self):
+        return self._request("GET", "/health")
+
+    def submit(self, image_bytes, language="en", priority="normal", use_genai=True, image_name=None):
+        """
+        Upload an image for analysis.
+
+        Returns:
+            str: Job id to poll
+        """
+        params = {"language": language, "priority": priority, "genai": "1" if use_genai else "0"}
+        if image_name:
+            params["name"] = image_name
+        path = "/jobs?" + urllib.parse.urlencode(params)
+        return self._request("POST", path, bytes(image_bytes), "application/octet-stream")["id"]
+
+    def status(self, job_id):
+        """Return the job's status, stage, report so far and results."""
+        return self._request("GET", f"/jobs/{job_id}")
+
+    def cancel(self, job_id):
+        return self._request("DELETE", f"/jobs/{job_id}")
+
+    def stream(self, job_id, on_status=None):
+        """
+        Follow a job until it finishes.
+
+        Args:
+            job_id: Id returned by submit
+            on_status: Optional callable receiving each status dict, e.g.
+                to show the CV results as soon as they are available
+
+        Returns:
+            JobStream: Iterable of new report text; its result attribute
+                holds the final status dict once exhausted
+        """
+        return JobStream(self, job_id, on_status)
+
+    def analyze(self, image_bytes, language="en", priority="normal", use_genai=True, image_name=None):
+        """
+        Submit an image and wait for the finished job.
+
+        Returns:
+            dict: Final job status with cv_results, genai_results and report
+        """
+        stream = self.stream(self.submit(image_bytes, language, priority, use_genai, image_name))
+        for _ in stream:
+            pass
+        return stream.result
+
+
+class JobStream:
+    """Iterable of report text from a server job that records the final status."""
+
+    def __init__(self, client, job_id, on_status=None):
+        self.client = client
+        self.job_id = job_id
+        self.on_status = on_status
+        self.result = None
+
+    def __iter__(self):
+        sent = 0
+        while True:
+            job = self.client.status(self.job_id)
+            if self.on_status is not None:
+                self.on_status(job)
+            report = job["report"]
+            if len(report) > sent:
+                yield report[sent:]
+                sent = len(report)
+            if job["status"] in ("done", "failed", "cancelled"):
+                self.result = job
+                if job["status"] == "failed":
+                    raise ServerError(job["error"] or "Analysis failed")
+                return
+            time.sleep(self.client.poll_interval)
+
+
+def get_client():
+    """Return a client for the configured server, or None to analyse in-process."""
+    if not ANALYSIS_SERVER_URL:
+        return None
+    return AnalysisClient()
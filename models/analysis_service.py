@@ -0,0 +1,267 @@
+import itertools
+import queue
+import threading
+import time
+import uuid
+
+from config import SERVER_WORKERS, SERVER_MAX_QUEUED, SERVER_JOB_TTL_SECONDS
+from models.triage import TriageScheduler, skipped_analysis
+from utils.metrics import metrics
+
+# Lower values are served first
+PRIORITIES = {"urgent": 0, "high": 1, "normal": 2, "low": 3}
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+
+def parse_priority(priority):
+    """Accept a priority name or number and return its numeric value."""
+    if isinstance(priority, str) and not priority.lstrip("-").isdigit():
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        return PRIORITIES[priority]
+    return int(priority)
+
+
+class AnalysisJob:
+    """One queued analysis and everything known about it so far."""
+
+    def __init__(self, image_bytes, language="en", priority=PRIORITIES["normal"], use_genai=True, image_name=None):
+        self.id = uuid.uuid4().hex
+        self.image_bytes = image_bytes
+        self.language = language
+        self.priority = priority
+        self.use_genai = use_genai
+        self.image_name = image_name
+
+        self.status = QUEUED
+        self.stage = QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cv_results = None
+        self.triage = None
+        self.genai_results = None
+        # Untranslated analysis, for reports in another language
+        self.base_results = None
+        self.report_parts = []
+        self.error = None
+
+    def to_dict(self):
+        """Return the job's public state; the report holds whatever has streamed in so far."""
+        return {
+            "id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "priority": self.priority,
+            "language": self.language,
+            "image_name": self.image_name,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "cv_results": self.cv_results,
+            "triage": self.triage,
+            "genai_results": self.genai_results,
+            "base_results": self.base_results,
+            "report": "".join(self.report_parts),
+            "error": self.error,
+        }
+
+
+class AnalysisService:
+    """
+    Priority job queue in front of the shared classifier and Gemini helper.
+
+    Jobs run in two stages. Detection workers take the most urgent job
+    first (oldest first within a priority) and run the cheap CV pass
+    through the shared MicroBatcher, so concurrent jobs share forward
+    passes. The result gives each job a provisional RED/ORANGE/GREEN
+    priority, and a TriageScheduler hands RED cases to the Gemini workers
+    first and defers or skips confident normals by policy. Finished jobs
+    are kept for ttl_seconds for polling.
+    """
+
+    def __init__(self, workers=SERVER_WORKERS, max_queued=SERVER_MAX_QUEUED, ttl_seconds=SERVER_JOB_TTL_SECONDS,
+                 genai_workers=None, triage=None):
+        self.max_queued = max_queued
+        self.ttl_seconds = ttl_seconds
+        self.triage = triage or TriageScheduler()
+
+        self._jobs = {}
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._running = True
+        self._threads = [
+            threading.Thread(target=self._run, name=f"analysis-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        self._genai_threads = [
+            threading.Thread(target=self._run_genai, name=f"analysis-genai-{i}", daemon=True)
+            for i in range(genai_workers or workers)
+        ]
+        for thread in self._threads + self._genai_threads:
+            thread.start()
+
+    def submit(self, image_bytes, language="en", priority="normal", use_genai=True, image_name=None):
+        """
+        Queue an analysis.
+
+        Args:
+            image_bytes: Encoded image file contents
+            language: Report language code
+            priority: Name from PRIORITIES or a number, lower is sooner
+            use_genai: Set to False for computer vision results only
+            image_name: Name shown in the report
+
+        Returns:
+            AnalysisJob: The queued job
+        """
+        if not self._running:
+            raise RuntimeError("AnalysisService has been stopped")
+        job = AnalysisJob(image_bytes, language, parse_priority(priority), use_genai, image_name)
+        with self._lock:
+            self._prune()
+            if self.queued() >= self.max_queued:
+                raise QueueFullError(f"{self.max_queued} jobs already queued")
+            self._jobs[job.id] = job
+        self._queue.put((job.priority, next(self._sequence), job.id))
+        return job
+
+    def get(self, job_id):
+        """Return a job by id, or None if it is unknown or expired."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """
+        Cancel a job that has not started yet.
+
+        Returns:
+            bool: True if the job was cancelled
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != QUEUED:
+                return False
+            job.status = job.stage = CANCELLED
+            job.finished_at = time.time()
+            job.image_bytes = None
+            return True
+
+    def queued(self):
+        return sum(1 for job in self._jobs.values() if job.status == QUEUED)
+
+    def stats(self):
+        """Return job counts by status, queue depth by priority and triage queue state."""
+        with self._lock:
+            by_status, by_priority = {}, {}
+            for job in self._jobs.values():
+                by_status[job.status] = by_status.get(job.status, 0) + 1
+                if job.status == QUEUED:
+                    by_priority[job.priority] = by_priority.get(job.priority, 0) + 1
+        return {"jobs": by_status, "queued_by_priority": by_priority, "triage": self.triage.stats()}
+
+    def stop(self, timeout=None):
+        """Stop the workers once their current jobs finish."""
+        self._running = False
+        for _ in self._threads:
+            self._queue.put((float("inf"), next(self._sequence), None))
+        for thread in self._threads:
+            thread.join(timeout)
+        # Detection has stopped, so nothing more reaches the Gemini queue
+        self.triage.close(len(self._genai_threads))
+        for thread in self._genai_threads:
+            thread.join(timeout)
+
+    def _prune(self):
+        # Called with the lock held
+        cutoff = time.time() - self.ttl_seconds
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.status in FINISHED and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def _run(self):
+        while True:
+            _, _, job_id = self._queue.get()
+            if job_id is None:
+                return
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None or job.status != QUEUED:
+                    continue
+                job.status = RUNNING
+                job.started_at = time.time()
+            try:
+                if self._detect(job):
+                    self._finish(job, DONE)
+            except Exception as e:
+                job.error = str(e)
+                self._finish(job, FAILED)
+
+    def _run_genai(self):
+        while True:
+            job, _ = self.triage.get()
+            if job is None:
+                return
+            try:
+                self._generate(job)
+                self._finish(job, DONE)
+            except Exception as e:
+                job.error = str(e)
+                self._finish(job, FAILED)
+
+    def _finish(self, job, status):
+        job.status = job.stage = status
+        job.finished_at = time.time()
+        # The upload is not needed once the job has finished
+        job.image_bytes = None
+        if status == DONE and job.triage is not None:
+            metrics.observe("time_to_answer_seconds", job.triage, job.finished_at - job.created_at)
+        metrics.flush()
+
+    def _detect(self, job):
+        """Run the CV pass and triage; returns True when the job needs no Gemini call."""
+        # Imported here so creating the service does not load the models
+        from models import registry
+        from utils.image_processing import preprocess_image
+        from utils.report_generator import generate_report
+
+        job.stage = "preprocessing"
+        preprocessed = preprocess_image(job.image_bytes)
+
+        job.stage = "detecting"
+        job.cv_results = registry.get_batcher().submit(preprocessed).result()
+
+        if not job.use_genai:
+            job.report_parts.append(generate_report(job.image_bytes, job.cv_results, {}, image_name=job.image_name))
+            return True
+
+        job.stage = "triaged"
+        tier, job.triage = self.triage.put(job, job.cv_results, rank=job.priority)
+        if tier is None:
+            job.genai_results = job.base_results = skipped_analysis(job.cv_results)
+            job.report_parts.append(generate_report(
+                job.image_bytes, job.cv_results, job.genai_results, image_name=job.image_name
+            ))
+            return True
+        return False
+
+    def _generate(self, job):
+        from models import registry
+        from utils.report_generator import generate_report_stream
+
+        job.stage = "analyzing"
+        stream = registry.get_genai_helper().stream_medical_image_analysis(
+            job.image_bytes, job.cv_results, language=job.language
+        )
+        for piece in generate_report_stream(job.image_bytes, job.cv_results, stream, image_name=job.image_name):
+            job.report_parts.append(piece)
+        job.genai_results = stream.result
+        job.base_results = stream.base_result
@@ -0,0 +1,288 @@
+import asyncio
+import base64
+import json
+import random
+import time
+import urllib.error
+import urllib.request
+import weakref
+from types import SimpleNamespace
+
+from config import (
+    GEMINI_API_KEY,
+    GEMINI_MODEL_NAME,
+    GEMINI_REQUESTS_PER_MINUTE,
+    GEMINI_MAX_CONCURRENCY,
+    GEMINI_TIMEOUT_SECONDS,
+    GEMINI_MAX_RETRIES,
+)
+from models.genai_helper import ANALYSIS_LANGUAGE
+from utils.analysis_cache import hash_image
+from utils.metrics import metrics
+
+# google.api_core exception names worth retrying; matched by name so this
+# module does not need the SDK to be importable
+RETRYABLE_ERROR_NAMES = {
+    "ResourceExhausted",
+    "ServiceUnavailable",
+    "DeadlineExceeded",
+    "InternalServerError",
+    "TooManyRequests",
+}
+
+
+class TransportError(Exception):
+    """A failed request to the Gemini endpoint."""
+
+    def __init__(self, message, status=None, retryable=False):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+
+
+def is_retryable(error):
+    """Return True if a failed request should be retried."""
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    if isinstance(error, TransportError):
+        return error.retryable
+    return type(error).__name__ in RETRYABLE_ERROR_NAMES
+
+
+class TokenBucket:
+    """
+    Async token-bucket rate limiter.
+
+    Tokens refill continuously at rate per second up to capacity; acquire()
+    waits until a token is available.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class SdkTransport:
+    """Send requests through the google-generativeai SDK model."""
+
+    def __init__(self, model):
+        self.model = model
+
+    async def generate(self, prompt, mime_type=None, data=None):
+        contents = [prompt]
+        if data is not None:
+            contents.append({'mime_type': mime_type, 'data': data})
+        response = await self.model.generate_content_async(contents)
+        text = response.text
+        metrics.record_usage(response)
+        return text
+
+
+class RestTransport:
+    """
+    Send requests to a Gemini-compatible REST endpoint.
+
+    Point base_url at a local fake server to exercise the client offline.
+    """
+
+    def __init__(self, base_url="https://generativelanguage.googleapis.com",
+                 api_key=GEMINI_API_KEY, model_name=GEMINI_MODEL_NAME, timeout=GEMINI_TIMEOUT_SECONDS):
+        self.url = f"{base_url.rstrip('/')}/v1beta/models/{model_name}:generateContent?key={api_key}"
+        # Enforced on the socket too: wait_for only abandons the executor
+        # thread, which would otherwise stay blocked on a hung request
+        self.timeout = timeout
+
+    async def generate(self, prompt, mime_type=None, data=None):
+        parts = [{"text": prompt}]
+        if data is not None:
+            parts.append({"inline_data": {"mime_type": mime_type, "data": base64.b64encode(data).decode("ascii")}})
+        body = json.dumps({"contents": [{"parts": parts}]}).encode("utf-8")
+        loop = asyncio.get_running_loop()
+        payload = await loop.run_in_executor(None, self._post, body)
+        parts = payload["candidates"][0]["content"]["parts"]
+        text = "".join(part.get("text", "") for part in parts)
+        # Same fields as the SDK's usage_metadata, in the REST casing
+        usage = payload.get("usageMetadata") or {}
+        metrics.record_usage(SimpleNamespace(usage_metadata=SimpleNamespace(
+            prompt_token_count=usage.get("promptTokenCount"),
+            candidates_token_count=usage.get("candidatesTokenCount"),
+        )))
+        return text
+
+    def _post(self, body):
+        request = urllib.request.Request(
+            self.url, data=body, headers={"Content-Type": "application/json"}, method="POST"
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise TransportError(
+                f"HTTP {e.code}: {e.reason}", status=e.code, retryable=e.code == 429 or e.code >= 500
+            )
+        except urllib.error.URLError as e:
+            raise TransportError(str(e.reason), retryable=True)
+        except TimeoutError as e:
+            raise TransportError(str(e) or "Request timed out", retryable=True)
+
+
+class AsyncGeminiClient:
+    """
+    Concurrent Gemini client with rate limiting, timeouts and retries.
+
+    Prompt building, image encoding and caching are delegated to a
+    GeminiHelper so results match the blocking analyze_medical_image.
+    """
+
+    def __init__(self, helper, transport=None,
+                 requests_per_minute=GEMINI_REQUESTS_PER_MINUTE,
+                 max_concurrency=GEMINI_MAX_CONCURRENCY,
+                 timeout=GEMINI_TIMEOUT_SECONDS,
+                 max_retries=GEMINI_MAX_RETRIES,
+                 backoff_base=1.0, backoff_max=30.0):
+        self.helper = helper
+        self.transport = transport if transport is not None else SdkTransport(helper.model)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.requests_per_minute = requests_per_minute
+        self.max_concurrency = max_concurrency
+
+        # Semaphore and rate limiter per event loop: asyncio primitives are
+        # bound to the loop that first waits on them, and one client may be
+        # used from several asyncio.run calls
+        self._loop_primitives = weakref.WeakKeyDictionary()
+
+    def _primitives(self):
+        loop = asyncio.get_running_loop()
+        primitives = self._loop_primitives.get(loop)
+        if primitives is None:
+            primitives = self._loop_primitives[loop] = (
+                asyncio.Semaphore(self.max_concurrency),
+                TokenBucket(self.requests_per_minute / 60.0, capacity=self.max_concurrency),
+            )
+        return primitives
+
+    async def analyze_medical_image(self, image, detection_results=None, language="en", use_cache=True):
+        """
+        Analyze a medical image with Gemini without blocking the event loop.
+
+        Cancelling the awaiting task cancels the request in flight. As with
+        GeminiHelper, other languages are a cached text-only translation of
+        one analysis in ANALYSIS_LANGUAGE. Hashing, encoding and cache
+        lookups run in worker threads so they do not stall other requests.
+
+        Args:
+            image: File path, encoded image bytes, or numpy array
+            detection_results: Optional results from the CV model
+            language: Response language code ("en", "hi" or "ta")
+            use_cache: Set to False to bypass the analysis cache
+
+        Returns:
+            dict: Analysis text and confidence, or an error description
+                including the number of attempts made
+        """
+        helper = self.helper
+
+        image_hash = await asyncio.to_thread(hash_image, image)
+        use_cache = use_cache and helper.cache is not None
+        key = None
+        if use_cache:
+            key = helper.cache_key(image, detection_results, language, image_hash=image_hash)
+            cached = await asyncio.to_thread(helper.cache.get, key)
+            if cached is not None:
+                return cached
+
+        base_key = helper.cache_key(image, detection_results, image_hash=image_hash) if use_cache else None
+        result = None
+        if base_key is not None and base_key != key:
+            result = await asyncio.to_thread(helper.cache.get, base_key)
+        if result is None:
+            payload = await asyncio.to_thread(helper.encode_payload, image, image_hash)
+            result = await self._generate(
+                helper.build_prompt(detection_results), "gemini_generate", payload['mime_type'], payload['data']
+            )
+            if "error" in result:
+                return result
+            result["language"] = ANALYSIS_LANGUAGE
+            if base_key is not None:
+                await asyncio.to_thread(helper.cache.put, base_key, result)
+        if language == ANALYSIS_LANGUAGE:
+            return result
+
+        translated = await self._generate(
+            helper.build_translation_prompt(result["analysis"], language), "gemini_translate"
+        )
+        if "error" in translated:
+            return translated
+        translated = dict(result, analysis=translated["analysis"], language=language)
+        if key is not None:
+            await asyncio.to_thread(helper.cache.put, key, translated)
+        return translated
+
+    async def _generate(self, prompt, stage, mime_type=None, data=None):
+        # One request with retries; returns a result dict or an error dict
+        semaphore, limiter = self._primitives()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                async with semaphore:
+                    await limiter.acquire()
+                    with metrics.span(stage):
+                        text = await asyncio.wait_for(
+                            self.transport.generate(prompt, mime_type, data), self.timeout
+                        )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt <= self.max_retries and is_retryable(e):
+                    await asyncio.sleep(self._backoff(attempt))
+                    continue
+                return {
+                    "error": str(e) or type(e).__name__,
+                    "analysis": "An error occurred during medical image analysis.",
+                    "confidence": 0,
+                    "attempts": attempt
+                }
+
+            return {
+                "analysis": text,
+                "confidence": 0.85
+            }
+
+    async def analyze_many(self, jobs, language="en"):
+        """
+        Analyze several images concurrently within the configured limits.
+
+        Args:
+            jobs: Iterable of (image, detection_results) pairs
+            language: Response language code
+
+        Returns:
+            list: One result dict per job, in order
+        """
+        return await asyncio.gather(*[
+            self.analyze_medical_image(image, detection_results, language=language)
+            for image, detection_results in jobs
+        ])
+
+    def _backoff(self, attempt):
+        # Exponential backoff with full jitter
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        return random.uniform(0, delay)
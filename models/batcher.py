@@ -0,0 +1,136 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from config import BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS
+
+
+class MicroBatcher:
+    """
+    Collect detection requests from many callers and run them as one batch.
+
+    A background thread waits for the first pending image, then keeps
+    collecting until either max_batch_size images are queued or max_wait_ms
+    has passed, and runs them through detect_anomalies_batch together.
+    """
+
+    def __init__(self, classifier, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS):
+        self.classifier = classifier
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batch_count = 0
+        self._image_count = 0
+        self._max_batch_seen = 0
+        self._total_wait = 0.0
+        self._max_wait_seen = 0.0
+
+        # Held while checking _running and queueing, so nothing can be
+        # queued behind the stop marker and never be resolved
+        self._submit_lock = threading.Lock()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, image):
+        """
+        Queue one image for detection.
+
+        Args:
+            image: Image as numpy array
+
+        Returns:
+            concurrent.futures.Future: Resolves to the detection result dict
+        """
+        future = Future()
+        with self._submit_lock:
+            if not self._running:
+                raise RuntimeError("MicroBatcher has been stopped")
+            self._queue.put((image, future, time.perf_counter()))
+        return future
+
+    def submit_many(self, images):
+        """Queue several images and return one future per image."""
+        return [self.submit(image) for image in images]
+
+    def stats(self):
+        """
+        Return batch-size and queue-wait statistics.
+
+        Returns:
+            dict: Counters and averages since the batcher started
+        """
+        with self._stats_lock:
+            batches = self._batch_count
+            images = self._image_count
+            return {
+                "batches": batches,
+                "images": images,
+                "avg_batch_size": images / batches if batches else 0.0,
+                "max_batch_size": self._max_batch_seen,
+                "avg_queue_wait_ms": self._total_wait / images * 1000 if images else 0.0,
+                "max_queue_wait_ms": self._max_wait_seen * 1000,
+                "pending": self._queue.qsize(),
+            }
+
+    def stop(self, timeout=None):
+        """Stop the background thread after draining queued work."""
+        with self._submit_lock:
+            self._running = False
+            self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _collect(self):
+        item = self._queue.get()
+        if item is None:
+            return []
+        batch = [item]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Keep the stop marker for the outer loop
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if not batch:
+                if not self._running and self._queue.empty():
+                    return
+                continue
+
+            started = time.perf_counter()
+            images = [image for image, _, _ in batch]
+            futures = [future for _, future, _ in batch]
+            waits = [started - queued_at for _, _, queued_at in batch]
+
+            # Skip callers that cancelled while queued
+            live = [i for i, future in enumerate(futures) if future.set_running_or_notify_cancel()]
+            if live:
+                try:
+                    results = self.classifier.detect_anomalies_batch([images[i] for i in live])
+                    for i, result in zip(live, results):
+                        futures[i].set_result(result)
+                except Exception as e:
+                    for i in live:
+                        futures[i].set_exception(e)
+
+            with self._stats_lock:
+                self._batch_count += 1
+                self._image_count += len(batch)
+                self._max_batch_seen = max(self._max_batch_seen, len(batch))
+                self._total_wait += sum(waits)
+                self._max_wait_seen = max(self._max_wait_seen, max(waits))
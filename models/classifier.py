@@ -1,49 +1,328 @@
+import os
+import time
+
 import cv2
 import numpy as np
-import tensorflow as tf
+
+from config import (MODEL_BACKEND, TFLITE_NUM_THREADS, ANOMALY_CONFIDENCE_THRESHOLD, BATCH_MAX_SIZE,
+                    COMPILED_INFERENCE, XLA_JIT_COMPILE, NORMAL_CLASS_INDEX)
+from models.localization import class_activation_maps, heatmap_to_regions
+from models.tflite_backend import TFLiteModel, default_model_path, cam_weights_path
+from utils.image_processing import load_image
+from utils.metrics import metrics
+
+BACKENDS = ("keras", "tflite-float16", "tflite-int8")
+
+
+def model_input_scale(keras_model):
+    """
+    Return the factor uint8 pixels are multiplied by before a Keras model sees them.
+    
+    Models with a Rescaling layer (EfficientNet and anything built on it)
+    take 0-255 input; others are assumed to be trained on 0-1 input.
+    """
+    import tensorflow as tf
+    
+    layers = list(keras_model.layers)
+    while layers:
+        layer = layers.pop()
+        if isinstance(layer, tf.keras.layers.Rescaling):
+            return 1.0
+        layers.extend(getattr(layer, "layers", ()))
+    return 1 / 255.0
+
 
 class ImageClassifier:
-    def __init__(self, model_path=None):
+    def __init__(self, model_path=None, backend=MODEL_BACKEND, num_threads=TFLITE_NUM_THREADS,
+                 compiled=COMPILED_INFERENCE, jit_compile=XLA_JIT_COMPILE, normal_class=NORMAL_CLASS_INDEX):
+        """
+        Args:
+            model_path: Custom Keras model, or a .tflite file; None uses
+                EfficientNetB0 with ImageNet weights
+            backend: "keras", "tflite-float16" or "tflite-int8"
+            num_threads: Interpreter threads for the TFLite backends
+            compiled: Run the Keras backend through a traced tf.function
+                instead of model.predict
+            jit_compile: Compile that function with XLA
+            normal_class: Output index meaning "normal", or None when the
+                model has no such class
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown model backend: {backend}")
+        self.backend = backend
+        self.normal_class = normal_class
+        self.model = None
+        self.tflite_model = None
+        self.jit_compile = jit_compile
+        self._infer = None
+        
+        # Last conv features and the classifier kernel, for activation maps
+        self.cam_model = None
+        self.cam_weights = None
+        
+        if backend != "keras":
+            quantization = backend.split("-", 1)[-1]
+            if model_path is not None and model_path.endswith(".tflite"):
+                tflite_path = model_path
+            else:
+                tflite_path = default_model_path(quantization, model_path)
+                if not os.path.exists(tflite_path):
+                    if quantization == "int8":
+                        raise FileNotFoundError(
+                            f"No int8 export at {tflite_path}; int8 needs calibration images, so export it with "
+                            "python -m models.tflite_backend export --quantization int8 --calibration IMAGE ..."
+                            + (f" --model-path {model_path}" if model_path else "")
+                        )
+                    # Export once from the Keras model, then drop it
+                    ImageClassifier(model_path, backend="keras").export_tflite(tflite_path, quantization)
+            self.tflite_model = TFLiteModel(tflite_path, num_threads=num_threads)
+            self.input_scale = self.tflite_model.input_scale
+            if self.tflite_model.has_features and os.path.exists(cam_weights_path(tflite_path)):
+                self.cam_weights = np.load(cam_weights_path(tflite_path))
+        else:
+            self.model = self._load_keras_model(model_path)
+            self.input_scale = model_input_scale(self.model)
+            self._build_cam_model()
+            if compiled:
+                self._infer = self._compile_inference(jit_compile)
+    
+    @property
+    def compiled(self):
+        """True when Keras inference runs through the compiled tf.function."""
+        return self._infer is not None
+    
+    def _load_keras_model(self, model_path):
+        # TensorFlow is only needed for the Keras backend or a first export
+        import tensorflow as tf
+        
         # If model_path is None, use a pre-trained model
         if model_path is None:
             # Use a lightweight model suitable for portable applications
-            self.model = tf.keras.applications.EfficientNetB0(
+            # For real application, you would fine-tune this on medical data
+            return tf.keras.applications.EfficientNetB0(
                 input_shape=(224, 224, 3),
                 include_top=True,
                 weights='imagenet'
                 )
-            # For real application, you would fine-tune this on medical data
-        else:
-            self.model = tf.keras.models.load_model(model_path)
+        return tf.keras.models.load_model(model_path)
+    
+    def _build_cam_model(self):
+        # Expose the last conv block alongside the predictions so one forward
+        # pass gives both; custom models without these layers skip localisation
+        import tensorflow as tf
+        
+        try:
+            features = self.model.get_layer("top_activation").output
+            self.cam_weights = self.model.get_layer("predictions").get_weights()[0]
+        except ValueError:
+            return
+        self.cam_model = tf.keras.Model(self.model.inputs, [features, self.model.output])
+    
+    def _compile_inference(self, jit_compile):
+        # One traced graph for any batch of uint8 images; the cast inside is
+        # the only float conversion the input goes through
+        import tensorflow as tf
+        
+        model = self.cam_model or self.model
+        scale = self.input_scale
+        
+        @tf.function(input_signature=[tf.TensorSpec((None, 224, 224, 3), tf.uint8)], jit_compile=jit_compile)
+        def infer(images):
+            inputs = tf.cast(images, tf.float32)
+            if scale != 1.0:
+                inputs = inputs * scale
+            return model(inputs, training=False)
+        
+        return infer
+    
+    def _padded_size(self, count):
+        # XLA compiles once per concrete shape, so batches are padded to a
+        # power of two to keep the number of compilations small
+        if not self.jit_compile:
+            return count
+        size = 1
+        while size < count:
+            size *= 2
+        return size
+    
+    def warm_up(self, max_batch_size=BATCH_MAX_SIZE):
+        """
+        Trace (and with XLA, compile) inference before the first real call.
+        
+        With XLA every padded batch size up to max_batch_size is compiled;
+        otherwise one call traces the graph for all batch sizes.
+        
+        Returns:
+            dict: Seconds spent per batch size
+        """
+        sizes = [1]
+        if self._infer is not None and self.jit_compile:
+            while sizes[-1] < max_batch_size:
+                sizes.append(sizes[-1] * 2)
+        timings = {}
+        for size in sizes:
+            start = time.perf_counter()
+            self.predict_with_features(np.zeros((size, 224, 224, 3), dtype=np.uint8))
+            timings[size] = time.perf_counter() - start
+        return timings
+    
+    def export_tflite(self, path, quantization="float16", representative_images=None):
+        """
+        Export this Keras classifier to a quantized TFLite file.
+        
+        When activation maps are available the exported model also outputs
+        the last conv features, and the classifier kernel is saved next to it.
+        
+        Args:
+            path: Output .tflite path
+            quantization: "float16" or "int8"
+            representative_images: Optional preprocess_batch output for int8 calibration
+            
+        Returns:
+            str: The output path
+        """
+        from models.tflite_backend import export_tflite
+        
+        if representative_images is not None:
+            representative_images = self.to_float(representative_images)
+        export_tflite(self.cam_model or self.model, path, quantization, representative_images, self.input_scale)
+        if self.cam_weights is not None:
+            np.save(cam_weights_path(path), self.cam_weights)
+        return path
     
     def preprocess(self, image):
-        # Resize and normalize image
-        image = cv2.resize(image, (224, 224))
-        image = image / 255.0
+        # Resize only; scaling happens in the single float conversion
+        image = cv2.resize(load_image(image), (224, 224))
         return np.expand_dims(image, axis=0)
     
+    def preprocess_batch(self, images):
+        """
+        Resize a list of images into one uint8 model input batch.
+        
+        Args:
+            images: List of images as numpy arrays or encoded bytes
+            
+        Returns:
+            numpy.ndarray: Uint8 array of shape (N, 224, 224, 3)
+        """
+        batch = np.empty((len(images), 224, 224, 3), dtype=np.uint8)
+        for i, image in enumerate(images):
+            batch[i] = cv2.resize(load_image(image), (224, 224))
+        return batch
+    
+    def to_float(self, batch):
+        """Convert a uint8 batch to the float32 input the model expects, in one pass."""
+        if self.input_scale == 1.0:
+            return batch.astype(np.float32)
+        return np.multiply(batch, np.float32(self.input_scale), dtype=np.float32)
+    
+    def predict(self, batch):
+        """
+        Run the selected backend on a preprocessed batch.
+        
+        Args:
+            batch: Uint8 array of shape (N, 224, 224, 3)
+            
+        Returns:
+            numpy.ndarray: Model outputs of shape (N, classes)
+        """
+        return self.predict_with_features(batch)[1]
+    
+    def predict_with_features(self, batch):
+        """
+        Run one forward pass returning conv features and predictions.
+        
+        Args:
+            batch: Uint8 array of shape (N, 224, 224, 3)
+            
+        Returns:
+            tuple: (features of shape (N, H, W, K) or None, predictions)
+        """
+        if self.tflite_model is not None:
+            features, predictions = self.tflite_model.predict_with_features(self.to_float(batch))
+            if self.cam_weights is None:
+                features = None
+            return features, predictions
+        if self._infer is not None:
+            return self._predict_compiled(batch)
+        if self.cam_model is not None:
+            features, predictions = self.cam_model.predict(self.to_float(batch), verbose=0)
+            return features, predictions
+        return None, self.model.predict(self.to_float(batch), verbose=0)
+    
+    def _predict_compiled(self, batch):
+        count = len(batch)
+        size = self._padded_size(count)
+        if size != count:
+            padding = np.zeros((size - count,) + batch.shape[1:], dtype=batch.dtype)
+            batch = np.concatenate([batch, padding])
+        outputs = self._infer(batch)
+        if self.cam_model is not None:
+            features, predictions = outputs
+            return features.numpy()[:count], predictions.numpy()[:count]
+        return None, outputs.numpy()[:count]
+    
     def detect_anomalies(self, image):
         """
         Detect potential anomalies in medical images.
         
+        Args:
+            image: Image as numpy array or encoded bytes
+            
         Returns:
             dict: Dictionary with detection results
         """
-        processed_image = self.preprocess(image)
-        predictions = self.model.predict(processed_image)
-        
-        # In a real application, you would have medical-specific outputs
-        # For now, we'll return a placeholder result
-        return {
-            "has_anomaly": True if np.random.random() > 0.5 else False,
-            "confidence": float(np.random.random() * 0.5 + 0.5),
-            "regions": [
-                {
-                    "x": int(np.random.random() * 100),
-                    "y": int(np.random.random() * 100),
-                    "width": int(np.random.random() * 50),
-                    "height": int(np.random.random() * 50),
-                    "score": float(np.random.random())
-                }
-            ]
-        } 
+        return self.detect_anomalies_batch([image])[0]
+    
+    def detect_anomalies_batch(self, images):
+        """
+        Detect potential anomalies in several images with one forward pass.
+        
+        Args:
+            images: List of images as numpy arrays or encoded bytes
+            
+        Returns:
+            list: One detection result dict per input image, in order
+        """
+        if len(images) == 0:
+            return []
+        
+        images = [load_image(image) for image in images]
+        with metrics.span("model_input"):
+            processed_images = self.preprocess_batch(images)
+        with metrics.span("inference"):
+            features, predictions = self.predict_with_features(processed_images)
+        
+        with metrics.span("localization"):
+            top_classes = predictions.argmax(axis=1)
+            heatmaps = None
+            if features is not None:
+                heatmaps = class_activation_maps(features, self.cam_weights, top_classes)
+            
+            results = []
+            for i, image in enumerate(images):
+                height, width = image.shape[:2]
+                heatmap = heatmaps[i] if heatmaps is not None else None
+                results.append(self._build_result(predictions[i], top_classes[i], heatmap, (width, height)))
+        return results
+    
+    def _build_result(self, prediction, top_class, heatmap, image_size):
+        # In a real application, you would have medical-specific outputs;
+        # with the ImageNet model the top-class probability stands in for
+        # anomaly confidence and its activation map localises it
+        confidence = float(prediction[top_class])
+        regions = []
+        if heatmap is not None:
+            regions = heatmap_to_regions(heatmap, image_size)
+        result = {
+            "has_anomaly": bool(top_class != self.normal_class and confidence >= ANOMALY_CONFIDENCE_THRESHOLD),
+            "confidence": confidence,
+            "class_index": int(top_class),
+            "regions": regions,
+            "heatmap": np.round(heatmap, 4).tolist() if heatmap is not None else None
+        }
+        if self.normal_class is not None:
+            # Only a model with a normal class can say an image is normal;
+            # a low top-class probability just means it is unsure
+            result["normal_confidence"] = float(prediction[self.normal_class])
+        return result
@@ -1,38 +1,62 @@
-import google.generativeai as genai
-import os
-import base64
-from PIL import Image
-import io
-from config import GEMINI_API_KEY
+import time
+from config import GEMINI_API_KEY, GEMINI_MODEL_NAME, ANALYSIS_CACHE_ENABLED
+from utils.analysis_cache import AnalysisCache, hash_image, make_cache_key
+from utils.image_encoding import PayloadEncoder
+from utils.metrics import metrics
+
+# Bump whenever the prompt text changes so cached analyses are not reused
+PROMPT_VERSION = 2
+
+# Images are analysed once in this language; other languages are
+# text-only translations of that analysis, cached separately
+ANALYSIS_LANGUAGE = "en"
+LANGUAGE_NAMES = {"en": "English", "hi": "Hindi", "ta": "Tamil"}
 
 class GeminiHelper:
-    def __init__(self, api_key=None):
-        if api_key is None:
-            api_key = GEMINI_API_KEY
+    def __init__(self, api_key=None, cache=None, model=None):
+        if model is None:
+            # Imported here so a helper built around another model (e.g. a
+            # local fake in benchmarks) does not need the SDK installed
+            import google.generativeai as genai
+            
+            if api_key is None:
+                api_key = GEMINI_API_KEY
+            
+            # Configure the Gemini API
+            genai.configure(api_key=api_key)
+            
+            # FIX: Store model properly
+            model = genai.GenerativeModel(model_name=GEMINI_MODEL_NAME)
+        self.model = model
         
-        # Configure the Gemini API
-        genai.configure(api_key=api_key)
+        # Persistent cache of analyses keyed on image content; pass
+        # cache=False to disable it regardless of config
+        if cache is None and ANALYSIS_CACHE_ENABLED:
+            cache = AnalysisCache()
+        self.cache = cache or None
         
-        # FIX: Store model properly
-        self.model = genai.GenerativeModel(model_name='gemini-1.5-flash')  
-
-    def encode_image(self, image):
-        """Encode an image to base64 for Gemini API."""
-        if isinstance(image, str):  # If image is a file path
-            with open(image, "rb") as image_file:
-                return base64.b64encode(image_file.read()).decode('utf-8')
-        else:  # If image is a numpy array
-            # Convert numpy array to PIL Image
-            if len(image.shape) == 3:
-                image = Image.fromarray(image)
-            # Convert PIL Image to bytes
-            buffered = io.BytesIO()
-            image.save(buffered, format="JPEG")
-            return base64.b64encode(buffered.getvalue()).decode('utf-8')
-
-    def analyze_medical_image(self, image_path, detection_results=None, language="en"):
-        try:
-            prompt = """
+        # Downscales and compresses uploads, memoized per image
+        self.encoder = PayloadEncoder()
+
+    def encode_payload(self, image, image_hash=None):
+        """
+        Encode an image as a size-capped upload payload.
+
+        Args:
+            image: File path, encoded image bytes, or numpy array
+            image_hash: Optional precomputed hash_image(image)
+
+        Returns:
+            dict: Inline image part with raw bytes, as accepted by the SDK
+        """
+        with metrics.span("gemini_encode"):
+            mime_type, data = self.encoder.encode(image, image_hash=image_hash)
+        metrics.observe("payload_bytes", "gemini_upload", len(data))
+        return {'mime_type': mime_type, 'data': data}
+
+    def build_prompt(self, detection_results=None):
+        """Build the image analysis prompt for optional CV results."""
+        prompt = """
             You are a medical image analysis expert. Analyze this medical image and provide:
             1. Hospital Priority (RED/ORANGE/GREEN) and action (Immediate/Monitor/Home Care).
             2. Detailed description of visible features.
@@ -40,27 +64,92 @@ class GeminiHelper:
             4. Possible diagnoses.
             5. Recommendations.
             """
-            #Add language instruction
-            if language == "hi":
-                prompt += "\n\nRespond in Hindi language only."
-            elif language == "ta":
-                prompt += "\n\nRespond in Tamil language only."
-            else:
-                prompt += "\n\nRespond in English language."
-            
-            if detection_results:
-                prompt += f"\n\nComputer vision model detected anomalies with {detection_results['confidence']*100:.1f}% confidence."
+        prompt += f"\n\nRespond in {LANGUAGE_NAMES[ANALYSIS_LANGUAGE]} language."
+        
+        if detection_results:
+            prompt += f"\n\nComputer vision model detected anomalies with {self.summarize_detection(detection_results)} confidence."
+        
+        return prompt
 
-            # Now call Gemini
-            response = self.model.generate_content([
-                prompt,
-                {'mime_type': 'image/jpeg', 'data': self.encode_image(image_path)}
-            ])
+    def build_translation_prompt(self, analysis, language):
+        """Build the text-only prompt translating an analysis into a language."""
+        return (
+            f"Translate this medical image analysis into {LANGUAGE_NAMES[language]}. "
+            "Keep the Markdown structure, numbers and the priority words RED, ORANGE and GREEN unchanged. "
+            "Respond with the translation only.\n\n"
+            f"{analysis}"
+        )
 
-            return {
-                "analysis": response.text,
-                "confidence": 0.85
-            }
+    def summarize_detection(self, detection_results):
+        """Return the part of the CV results that is sent to Gemini."""
+        if not detection_results:
+            return ""
+        return f"{detection_results['confidence']*100:.1f}%"
+
+    def cache_key(self, image, detection_results=None, language=ANALYSIS_LANGUAGE, image_hash=None):
+        """Build the cache key for an image, language and detection summary."""
+        if image_hash is None:
+            image_hash = hash_image(image)
+        return make_cache_key(
+            image_hash,
+            language,
+            PROMPT_VERSION,
+            self.summarize_detection(detection_results)
+        )
+
+    def translate(self, result, language, image_hash=None, detection_results=None, use_cache=True):
+        """
+        Translate an analysis with a text-only request; no image is uploaded.
+
+        Args:
+            result: Analysis dict in ANALYSIS_LANGUAGE
+            language: Target language code
+            image_hash, detection_results: Identify the analysis for caching;
+                without image_hash the translation is not cached
+            use_cache: Set to False to bypass the analysis cache
+
+        Returns:
+            dict: The result with its analysis text translated
+        """
+        if language == ANALYSIS_LANGUAGE or "error" in result:
+            return result
+        key = None
+        if use_cache and self.cache is not None and image_hash is not None:
+            key = self.cache_key(None, detection_results, language, image_hash=image_hash)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        with metrics.span("gemini_translate"):
+            response = self.model.generate_content([self.build_translation_prompt(result["analysis"], language)])
+            text = response.text
+        metrics.record_usage(response)
+
+        translated = dict(result, analysis=text, language=language)
+        if key is not None:
+            self.cache.put(key, translated)
+        return translated
+
+    def analyze_medical_image(self, image, detection_results=None, language="en", use_cache=True):
+        """
+        Analyze a medical image with Gemini.
+
+        The image is analysed once in ANALYSIS_LANGUAGE; other languages are
+        a cached text-only translation of that analysis.
+
+        Args:
+            image: File path, encoded image bytes, or numpy array
+            detection_results: Optional results from the CV model
+            language: Response language code ("en", "hi" or "ta")
+            use_cache: Set to False to bypass the analysis cache
+
+        Returns:
+            dict: Analysis text and confidence, plus "error" on failure
+        """
+        try:
+            image_hash = hash_image(image)
+            result = self._analyze_image(image, detection_results, image_hash, use_cache)
+            return self.translate(result, language, image_hash, detection_results, use_cache)
 
         except Exception as e:
             return {
@@ -68,3 +157,135 @@ class GeminiHelper:
                 "analysis": "An error occurred during medical image analysis.",
                 "confidence": 0
             }
+
+    def _analyze_image(self, image, detection_results, image_hash, use_cache):
+        # The multimodal request, always in ANALYSIS_LANGUAGE
+        key = None
+        if use_cache and self.cache is not None:
+            key = self.cache_key(image, detection_results, image_hash=image_hash)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        prompt = self.build_prompt(detection_results)
+
+        # Now call Gemini
+        payload = self.encode_payload(image, image_hash=image_hash)
+        with metrics.span("gemini_generate"):
+            response = self.model.generate_content([prompt, payload])
+            text = response.text
+        metrics.record_usage(response)
+
+        result = {
+            "analysis": text,
+            "confidence": 0.85,
+            "language": ANALYSIS_LANGUAGE
+        }
+        if key is not None:
+            self.cache.put(key, result)
+        return result
+
+    def stream_medical_image_analysis(self, image, detection_results=None, language="en", use_cache=True):
+        """
+        Analyze a medical image with Gemini, yielding text as it arrives.
+
+        Args:
+            image: File path, encoded image bytes, or numpy array
+            detection_results: Optional results from the CV model
+            language: Response language code ("en", "hi" or "ta")
+            use_cache: Set to False to bypass the analysis cache
+
+        Returns:
+            AnalysisStream: Iterable of text chunks; its result attribute
+                holds the same dict as analyze_medical_image once exhausted,
+                and base_result the untranslated analysis
+        """
+        return AnalysisStream(self, image, detection_results, language, use_cache)
+
+
+class AnalysisStream:
+    """
+    Iterable of Gemini text chunks that records the final result.
+
+    For ANALYSIS_LANGUAGE the image analysis itself is streamed. For other
+    languages the analysis is fetched (usually from the cache) and its
+    text-only translation is streamed instead. base_result holds that
+    untranslated analysis, also on a cache hit while it is still cached.
+    """
+
+    def __init__(self, helper, image, detection_results, language, use_cache):
+        self.helper = helper
+        self.image = image
+        self.detection_results = detection_results
+        self.language = language
+        self.use_cache = use_cache
+        self.result = None
+        self.base_result = None
+
+    def __iter__(self):
+        helper = self.helper
+        chunks = []
+        try:
+            image_hash = hash_image(self.image)
+            key = None
+            if self.use_cache and helper.cache is not None:
+                key = helper.cache_key(self.image, self.detection_results, self.language, image_hash=image_hash)
+                cached = helper.cache.get(key)
+                if cached is not None:
+                    self.result = cached
+                    if self.language == ANALYSIS_LANGUAGE:
+                        self.base_result = cached
+                    else:
+                        # The analysis a translation was made from, so a later
+                        # language switch can translate it again
+                        self.base_result = helper.cache.get(
+                            helper.cache_key(self.image, self.detection_results, image_hash=image_hash)
+                        )
+                    yield cached["analysis"]
+                    return
+
+            if self.language == ANALYSIS_LANGUAGE:
+                prompt = helper.build_prompt(self.detection_results)
+                contents = [prompt, helper.encode_payload(self.image, image_hash=image_hash)]
+                stage = "gemini_generate"
+            else:
+                self.base_result = helper._analyze_image(self.image, self.detection_results, image_hash, self.use_cache)
+                contents = [helper.build_translation_prompt(self.base_result["analysis"], self.language)]
+                stage = "gemini_translate"
+
+            start = time.perf_counter()
+            response = helper.model.generate_content(contents, stream=True)
+
+            for chunk in response:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Chunks without text parts (e.g. safety metadata)
+                    continue
+                if not chunks:
+                    metrics.observe("stage_seconds", "gemini_first_chunk", time.perf_counter() - start)
+                chunks.append(text)
+                yield text
+            # Time spent in the consumer between chunks is included
+            metrics.observe("stage_seconds", stage, time.perf_counter() - start)
+            metrics.record_usage(response)
+
+            self.result = {
+                "analysis": "".join(chunks),
+                "confidence": 0.85,
+                "language": self.language
+            }
+            if self.base_result is None:
+                self.base_result = self.result
+            if key is not None:
+                helper.cache.put(key, self.result)
+
+        except Exception as e:
+            message = "An error occurred during medical image analysis."
+            if not chunks:
+                yield message
+            self.result = {
+                "error": str(e),
+                "analysis": "".join(chunks) or message,
+                "confidence": 0
+            }
@@ -0,0 +1,73 @@
+import cv2
+import numpy as np
+
+from config import CAM_THRESHOLD, CAM_MIN_REGION_AREA, MAX_REGIONS
+
+# Longest side of the grid heatmaps are thresholded on before boxes are
+# scaled back to image coordinates
+_WORK_SIZE = 256
+
+
+def class_activation_maps(features, weights, class_indices):
+    """
+    Compute class activation maps from the last convolutional features.
+
+    Args:
+        features: Array of shape (N, H, W, K) from the last conv block
+        weights: Classifier kernel of shape (K, classes)
+        class_indices: Class to explain for each image, shape (N,)
+
+    Returns:
+        numpy.ndarray: Maps of shape (N, H, W) scaled to [0, 1] per image
+    """
+    cams = np.einsum("nhwk,kn->nhw", features, weights[:, class_indices])
+    np.maximum(cams, 0, out=cams)
+    peaks = cams.max(axis=(1, 2), keepdims=True)
+    np.divide(cams, peaks, out=cams, where=peaks > 0)
+    return cams
+
+
+def heatmap_to_regions(heatmap, image_size, threshold=CAM_THRESHOLD,
+                       min_area=CAM_MIN_REGION_AREA, max_regions=MAX_REGIONS):
+    """
+    Threshold a heatmap into bounding boxes in image coordinates.
+
+    Args:
+        heatmap: 2D array in [0, 1] covering the whole image
+        image_size: (width, height) of the image the boxes refer to
+        threshold: Minimum activation for a pixel to belong to a region
+        min_area: Smallest region kept, as a fraction of the image area
+        max_regions: Most regions returned, strongest first
+
+    Returns:
+        list: Region dicts with x, y, width, height and score
+    """
+    width, height = image_size
+    scale = min(1.0, _WORK_SIZE / max(width, height))
+    work_width, work_height = max(1, round(width * scale)), max(1, round(height * scale))
+
+    heat = cv2.resize(heatmap.astype(np.float32), (work_width, work_height), interpolation=cv2.INTER_LINEAR)
+    mask = (heat >= threshold).astype(np.uint8)
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    if count <= 1:
+        return []
+
+    # Peak activation per component in one pass
+    scores = np.zeros(count, dtype=np.float32)
+    np.maximum.at(scores, labels.ravel(), heat.ravel())
+
+    keep = np.flatnonzero(stats[1:, cv2.CC_STAT_AREA] >= min_area * work_width * work_height) + 1
+    keep = keep[np.argsort(-scores[keep], kind="stable")][:max_regions]
+
+    x_scale, y_scale = width / work_width, height / work_height
+    regions = []
+    for label in keep:
+        x, y, w, h = stats[label, :4]
+        regions.append({
+            "x": int(x * x_scale),
+            "y": int(y * y_scale),
+            "width": int(round(w * x_scale)),
+            "height": int(round(h * y_scale)),
+            "score": round(float(scores[label]), 4)
+        })
+    return regions
@@ -0,0 +1,131 @@
+import threading
+import time
+
+from config import MODEL_PATH
+
+# Model modules pull in TensorFlow, OpenCV and the Gemini SDK, so they are
+# imported inside the getters rather than at module load
+
+# Process-wide model instances, built lazily on first use
+_classifier = None
+_genai_helper = None
+_batcher = None
+_warmed_up = False
+_warm_up_thread = None
+
+# Seconds spent importing and building each component, for startup reports
+timings = {}
+
+# Guards construction so concurrent sessions never build a model twice
+_lock = threading.RLock()
+# Separate from _lock so starting warm-up never waits on a build in progress
+_warm_up_lock = threading.Lock()
+
+
+def get_classifier():
+    """
+    Return the shared ImageClassifier, building it on first use.
+
+    Returns:
+        ImageClassifier: Process-wide classifier instance
+    """
+    global _classifier
+    if _classifier is None:
+        with _lock:
+            if _classifier is None:
+                start = time.perf_counter()
+                from models.classifier import ImageClassifier
+                _classifier = ImageClassifier(model_path=MODEL_PATH)
+                timings["classifier"] = time.perf_counter() - start
+    return _classifier
+
+
+def get_genai_helper():
+    """
+    Return the shared GeminiHelper, configuring the API on first use.
+
+    Returns:
+        GeminiHelper: Process-wide Gemini helper instance
+    """
+    global _genai_helper
+    if _genai_helper is None:
+        with _lock:
+            if _genai_helper is None:
+                start = time.perf_counter()
+                from models.genai_helper import GeminiHelper
+                _genai_helper = GeminiHelper()
+                timings["genai_helper"] = time.perf_counter() - start
+    return _genai_helper
+
+
+def get_batcher():
+    """
+    Return the shared MicroBatcher wrapping the shared classifier.
+
+    Returns:
+        MicroBatcher: Process-wide batcher; its thread starts on first use
+    """
+    global _batcher
+    if _batcher is None:
+        with _lock:
+            if _batcher is None:
+                from models.batcher import MicroBatcher
+                _batcher = MicroBatcher(get_classifier())
+    return _batcher
+
+
+def warm_up():
+    """
+    Build all shared models, compile the classifier's inference function and
+    run one dummy detection through it.
+
+    The first call to a Keras model traces its graph (and with XLA compiles
+    it), so doing this once at startup keeps that cost out of the first
+    user-facing analysis. Repeated calls are no-ops.
+    """
+    global _warmed_up
+    if _warmed_up:
+        return
+    with _lock:
+        if _warmed_up:
+            return
+        import numpy as np
+
+        classifier = get_classifier()
+        get_genai_helper()
+        start = time.perf_counter()
+        classifier.warm_up()
+        classifier.detect_anomalies(np.zeros((224, 224, 3), dtype=np.uint8))
+        timings["warm_up_inference"] = time.perf_counter() - start
+        _warmed_up = True
+
+
+def start_background_warm_up():
+    """
+    Run warm_up() on a daemon thread so the UI can render immediately.
+
+    Getters called before it finishes simply wait for the shared build.
+
+    Returns:
+        threading.Thread: The warm-up thread (the same one on repeat calls)
+    """
+    global _warm_up_thread
+    with _warm_up_lock:
+        if _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(target=warm_up, name="model-warm-up", daemon=True)
+            _warm_up_thread.start()
+    return _warm_up_thread
+
+
+def reset():
+    """Drop the shared instances so the next access rebuilds them."""
+    global _classifier, _genai_helper, _batcher, _warmed_up, _warm_up_thread
+    with _lock:
+        if _batcher is not None:
+            _batcher.stop()
+        _batcher = None
+        _classifier = None
+        _genai_helper = None
+        _warmed_up = False
+        _warm_up_thread = None
+        timings.clear()
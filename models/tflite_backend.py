@@ -0,0 +1,267 @@
+"""
+TensorFlow Lite inference backend for ImageClassifier.
+
+Usage:
+    python -m models.tflite_backend export --quantization float16
+    python -m models.tflite_backend compare IMAGE [IMAGE ...] --quantization int8
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from config import TFLITE_MODEL_DIR, TFLITE_NUM_THREADS
+
+QUANTIZATIONS = ("float16", "int8")
+
+
+def _interpreter_class():
+    # The standalone runtime is far smaller than full TensorFlow when present
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+def model_id(model_path=None):
+    """
+    Identify the Keras model an export is made from.
+
+    Custom models are identified by their absolute path and modification
+    time, so retraining in place gets a fresh export.
+    """
+    if model_path is None:
+        return "efficientnetb0"
+    path = os.path.abspath(model_path)
+    digest = hashlib.sha256(f"{path}\x1f{os.path.getmtime(path)}".encode("utf-8")).hexdigest()[:12]
+    name = os.path.splitext(os.path.basename(path.rstrip(os.sep)))[0] or "model"
+    return f"{name}_{digest}"
+
+
+def default_model_path(quantization, model_path=None, model_dir=TFLITE_MODEL_DIR):
+    """Return where the export of a Keras model for a quantization mode is cached."""
+    # v3 exports record their input scale next to them; earlier ones did
+    # not and must not be picked up
+    return os.path.join(model_dir, f"{model_id(model_path)}_{quantization}_v3.tflite")
+
+
+def cam_weights_path(model_path):
+    """Return where the classifier kernel for activation maps is stored."""
+    return os.path.splitext(model_path)[0] + ".cam.npy"
+
+
+def metadata_path(model_path):
+    """Return where the input scale of an export is stored."""
+    return os.path.splitext(model_path)[0] + ".json"
+
+
+def read_input_scale(model_path):
+    """
+    Return the factor uint8 pixels are multiplied by before the model sees them.
+
+    The scale cannot be read back from the converted graph (EfficientNet's
+    own rescaling is folded into its first ops), so it is taken from the
+    metadata written at export.
+    """
+    try:
+        with open(metadata_path(model_path), encoding="utf-8") as f:
+            return float(json.load(f)["input_scale"])
+    except FileNotFoundError:
+        raise ValueError(
+            f"No input scale recorded for {model_path}; re-export it with python -m models.tflite_backend export, "
+            f'or write {{"input_scale": 1.0}} (0-255 input) or {{"input_scale": 0.00392156862745098}} (0-1 input) '
+            f"to {metadata_path(model_path)}"
+        ) from None
+
+
+def export_tflite(keras_model, path, quantization="float16", representative_images=None, input_scale=1.0):
+    """
+    Convert a Keras model to a quantized TFLite file.
+
+    Args:
+        keras_model: Model to convert
+        path: Output .tflite path
+        quantization: "float16" or "int8"
+        representative_images: (N, 224, 224, 3) float32 batch as the model
+            receives it, used to calibrate int8 activations; required for int8
+        input_scale: Factor the model's uint8 input is multiplied by,
+            recorded in the metadata next to the export
+
+    Returns:
+        str: The output path
+    """
+    import tensorflow as tf
+
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization: {quantization}")
+    if quantization == "int8" and representative_images is None:
+        # Without calibration the converter silently produces a
+        # dynamic-range model, which is not what "int8" promises
+        raise ValueError("int8 export needs representative images for calibration")
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    else:
+        def representative_dataset():
+            for image in representative_images:
+                yield [np.expand_dims(image, axis=0).astype(np.float32)]
+        converter.representative_dataset = representative_dataset
+
+    tflite_model = converter.convert()
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(tflite_model)
+    with open(metadata_path(path), "w", encoding="utf-8") as f:
+        json.dump({"input_scale": input_scale}, f)
+    return path
+
+
+class TFLiteModel:
+    """
+    Wrap a TFLite interpreter behind a predict(batch) call.
+
+    The input tensor is resized to the batch size on demand and kept at that
+    size until a different batch size arrives. Models exported with conv
+    features have a second, rank-4 output that is told apart by its shape.
+    The input scale comes from the export's metadata.
+    """
+
+    def __init__(self, path, num_threads=TFLITE_NUM_THREADS):
+        self.path = path
+        self.input_scale = read_input_scale(path)
+        self.interpreter = _interpreter_class()(model_path=path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = None
+        self._features = None
+        for detail in self.interpreter.get_output_details():
+            if len(detail["shape"]) == 4:
+                self._features = detail
+            else:
+                self._output = detail
+        self.has_features = self._features is not None
+        self._batch_size = self._input["shape"][0]
+        # The interpreter holds mutable tensors; one inference at a time
+        self._lock = threading.Lock()
+
+    def predict(self, batch):
+        """
+        Run inference on a preprocessed batch.
+
+        Args:
+            batch: Float32 array of shape (N, 224, 224, 3)
+
+        Returns:
+            numpy.ndarray: Model outputs of shape (N, classes)
+        """
+        return self.predict_with_features(batch)[1]
+
+    def predict_with_features(self, batch):
+        """
+        Run inference returning conv features (if exported) and predictions.
+
+        Args:
+            batch: Float32 array of shape (N, 224, 224, 3)
+
+        Returns:
+            tuple: (features or None, predictions)
+        """
+        with self._lock:
+            if batch.shape[0] != self._batch_size:
+                self.interpreter.resize_tensor_input(self._input["index"], batch.shape)
+                self.interpreter.allocate_tensors()
+                self._batch_size = batch.shape[0]
+            self.interpreter.set_tensor(self._input["index"], batch.astype(self._input["dtype"], copy=False))
+            self.interpreter.invoke()
+            features = None
+            if self._features is not None:
+                features = self.interpreter.get_tensor(self._features["index"]).copy()
+            return features, self.interpreter.get_tensor(self._output["index"]).copy()
+
+
+def compare_backends(images, reference, candidate):
+    """
+    Compare a candidate classifier against a reference on the same images.
+
+    Args:
+        images: List of images accepted by ImageClassifier.preprocess_batch
+        reference: Classifier used as ground truth, normally the Keras one
+        candidate: Classifier under test, normally a TFLite one
+
+    Returns:
+        dict: Top-1 / top-5 agreement, output error and per-image latency
+    """
+    batch = reference.preprocess_batch(images)
+
+    start = time.perf_counter()
+    expected = reference.predict(batch)
+    reference_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = candidate.predict(batch)
+    candidate_time = time.perf_counter() - start
+
+    top1_expected = expected.argmax(axis=1)
+    top5_actual = np.argsort(actual, axis=1)[:, -5:]
+    return {
+        "images": len(images),
+        "top1_agreement": float(np.mean(top1_expected == actual.argmax(axis=1))),
+        "top5_agreement": float(np.mean([e in row for e, row in zip(top1_expected, top5_actual)])),
+        "max_abs_error": float(np.max(np.abs(expected - actual))),
+        "mean_abs_error": float(np.mean(np.abs(expected - actual))),
+        "reference_ms_per_image": reference_time / len(images) * 1000,
+        "candidate_ms_per_image": candidate_time / len(images) * 1000,
+    }
+
+
+def main(argv=None):
+    from models.classifier import ImageClassifier
+    from utils.image_processing import preprocess_image
+
+    parser = argparse.ArgumentParser(description="Export or evaluate the TFLite classifier backend.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export the Keras model to TFLite")
+    export_parser.add_argument("--quantization", choices=QUANTIZATIONS, default="float16")
+    export_parser.add_argument("--calibration", nargs="*", default=[],
+                               help="Images for int8 calibration (required for int8)")
+    export_parser.add_argument("--model-path", default=None, help="Custom Keras model (default EfficientNetB0)")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare TFLite against Keras")
+    compare_parser.add_argument("images", nargs="+")
+    compare_parser.add_argument("--quantization", choices=QUANTIZATIONS, default="float16")
+    compare_parser.add_argument("--model-path", default=None, help="Custom Keras model (default EfficientNetB0)")
+
+    args = parser.parse_args(argv)
+    if args.command == "export" and args.quantization == "int8" and not args.calibration:
+        parser.error("int8 export needs --calibration images")
+    keras_classifier = ImageClassifier(args.model_path, backend="keras")
+
+    if args.command == "export":
+        calibration = None
+        if args.calibration:
+            calibration = keras_classifier.preprocess_batch([preprocess_image(p) for p in args.calibration])
+        path = keras_classifier.export_tflite(default_model_path(args.quantization, args.model_path),
+                                              args.quantization, calibration)
+        print(f"Exported {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+    else:
+        tflite_classifier = ImageClassifier(args.model_path, backend=f"tflite-{args.quantization}")
+        images = [preprocess_image(p) for p in args.images]
+        for name, value in compare_backends(images, keras_classifier, tflite_classifier).items():
+            print(f"{name}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import itertools
+import queue
+import threading
+import time
+
+from config import TRIAGE_ENABLED, TRIAGE_RED_CONFIDENCE, TRIAGE_NORMAL_CONFIDENCE, TRIAGE_NORMAL_POLICY
+from utils.metrics import metrics
+
+# Gemini work is served in this order; DEFERRED holds confident normals
+# when the policy defers them
+TIERS = ("RED", "ORANGE", "GREEN", "DEFERRED")
+NORMAL_POLICIES = ("run", "defer", "skip")
+
+
+def provisional_priority(cv_results, red_confidence=TRIAGE_RED_CONFIDENCE):
+    """Return RED, ORANGE or GREEN from the classifier output alone."""
+    if not cv_results.get("has_anomaly", False):
+        return "GREEN"
+    return "RED" if cv_results.get("confidence", 0) >= red_confidence else "ORANGE"
+
+
+def is_confident_normal(cv_results, normal_confidence=TRIAGE_NORMAL_CONFIDENCE):
+    """
+    Return True when the classifier scores an image as normal with confidence.
+
+    That needs a normal-class probability ("normal_confidence"). Without
+    one, as with the ImageNet model, a low anomaly confidence only means
+    the model is unsure, so nothing counts as a confident normal.
+    """
+    normal = cv_results.get("normal_confidence")
+    return normal is not None and not cv_results.get("has_anomaly", False) and normal >= normal_confidence
+
+
+def skipped_analysis(cv_results):
+    """
+    Stand-in Gemini result for a case the triage policy did not send.
+
+    Names the GREEN priority so reports and the history still carry it.
+    """
+    return {
+        "analysis": (
+            "1. Hospital Priority: GREEN (provisional, from the computer vision model). Action: Home Care.\n\n"
+            f"AI analysis was skipped: the image was scored normal "
+            f"(confidence {cv_results.get('normal_confidence', 0) * 100:.1f}%). "
+            "Request a full analysis if symptoms suggest otherwise."
+        ),
+        "confidence": 0,
+        "skipped": True
+    }
+
+
+class TriageScheduler:
+    """
+    Order Gemini work by the classifier's provisional priority.
+
+    Items are put in after their CV pass. get() hands out RED work first,
+    then ORANGE, GREEN and finally deferred normals; within a tier the
+    caller's rank (e.g. a requested priority) and then arrival order
+    decide. Confident normals are run, deferred or skipped by policy.
+    With enabled=False the queue is first in, first out and nothing is
+    skipped, which is the baseline triage is measured against.
+
+    Queue depth per tier is kept live, and wait times (put to get) are
+    recorded in metrics as triage_wait_seconds.
+    """
+
+    def __init__(self, enabled=TRIAGE_ENABLED, normal_policy=TRIAGE_NORMAL_POLICY):
+        if normal_policy not in NORMAL_POLICIES:
+            raise ValueError(f"Unknown triage policy for normals: {normal_policy}")
+        self.enabled = enabled
+        self.normal_policy = normal_policy
+
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._depth = {tier: 0 for tier in TIERS}
+        self._sent = {tier: 0 for tier in TIERS}
+        self._skipped = 0
+
+    def tier(self, cv_results):
+        """
+        Return the tier a result is queued in, or None when Gemini is skipped.
+
+        Returns:
+            tuple: (tier or None, provisional priority)
+        """
+        priority = provisional_priority(cv_results)
+        if not self.enabled or not is_confident_normal(cv_results):
+            return priority, priority
+        if self.normal_policy == "skip":
+            return None, priority
+        if self.normal_policy == "defer":
+            return "DEFERRED", priority
+        return priority, priority
+
+    def put(self, item, cv_results, rank=0):
+        """
+        Queue an item for Gemini according to its CV results.
+
+        Args:
+            item: Anything; returned unchanged by get()
+            cv_results: Detection result used for the provisional priority
+            rank: Secondary ordering within a tier, lower first
+
+        Returns:
+            tuple: (tier, provisional priority); tier is None when the
+                item was skipped and not queued
+        """
+        tier, priority = self.tier(cv_results)
+        if tier is None:
+            with self._lock:
+                self._skipped += 1
+            metrics.increment("genai_skipped_total", priority)
+            return None, priority
+
+        key = (TIERS.index(tier), rank) if self.enabled else (0, 0)
+        with self._lock:
+            self._depth[tier] += 1
+        self._queue.put((key, next(self._sequence), time.perf_counter(), tier, item))
+        return tier, priority
+
+    def get(self, timeout=None):
+        """
+        Take the most urgent item, blocking until one is available.
+
+        Returns:
+            tuple: (item, tier)
+
+        Raises:
+            queue.Empty: If timeout passes with nothing queued
+        """
+        _, _, queued_at, tier, item = self._queue.get(timeout=timeout)
+        if tier is not None:
+            with self._lock:
+                self._depth[tier] -= 1
+                self._sent[tier] += 1
+            metrics.observe("triage_wait_seconds", tier, time.perf_counter() - queued_at)
+        return item, tier
+
+    def close(self, consumers=1):
+        """Wake consumers blocked in get(); each receives (None, None) after the queued work."""
+        for _ in range(consumers):
+            self._queue.put(((len(TIERS), 0), next(self._sequence), time.perf_counter(), None, None))
+
+    def stats(self):
+        """Return queue depth and Gemini calls sent per tier, and calls skipped."""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "normal_policy": self.normal_policy,
+                "queued": dict(self._depth),
+                "sent": dict(self._sent),
+                "skipped": self._skipped,
+            }
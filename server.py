@@ -0,0 +1,138 @@
+"""
+Local analysis server shared by every UI session on a machine.
+
+Usage:
+    python server.py [--host 127.0.0.1] [--port 8765] [--workers 4]
+
+Owns the only copy of the classifier and the Gemini client, and serves
+analyses through a priority job queue:
+
+    POST   /jobs?language=en&priority=high&genai=1&name=scan.png   body: image file
+    GET    /jobs/<id>        status, stage, partial report and results
+    DELETE /jobs/<id>        cancel a queued job
+    GET    /health           queue depth and job counts
+    GET    /metrics          pipeline metrics in Prometheus text format
+
+Set ANALYSIS_SERVER_URL in config.py to make the UIs thin clients of it.
+"""
+
+import argparse
+import json
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from config import SERVER_HOST, SERVER_PORT, SERVER_WORKERS, SERVER_MAX_UPLOAD_MB
+from models.analysis_service import AnalysisService, QueueFullError
+from utils.metrics import metrics
+
+
+class AnalysisRequestHandler(BaseHTTPRequestHandler):
+    # Set on the class by make_server
+    service = None
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _job_id(self):
+        parts = urlparse(self.path).path.strip("/").split("/")
+        return parts[1] if len(parts) == 2 and parts[0] == "jobs" else None
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/jobs":
+            return self._send_json(404, {"error": "Not found"})
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0:
+            return self._send_json(400, {"error": "Request body must be the image file"})
+        if length > SERVER_MAX_UPLOAD_MB * 1024 * 1024:
+            return self._send_json(413, {"error": f"Images are limited to {SERVER_MAX_UPLOAD_MB} MB"})
+        image_bytes = self.rfile.read(length)
+
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            job = self.service.submit(
+                image_bytes,
+                language=params.get("language", "en"),
+                priority=params.get("priority", "normal"),
+                use_genai=params.get("genai", "1") != "0",
+                image_name=params.get("name"),
+            )
+        except ValueError as e:
+            return self._send_json(400, {"error": str(e)})
+        except QueueFullError as e:
+            return self._send_json(503, {"error": str(e)})
+        self._send_json(202, {"id": job.id, "status": job.status})
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/health":
+            return self._send_json(200, dict(self.service.stats(), status="ok"))
+        if path == "/metrics":
+            data = metrics.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        job = self.service.get(self._job_id())
+        if job is None:
+            return self._send_json(404, {"error": "Unknown job"})
+        self._send_json(200, job.to_dict())
+
+    def do_DELETE(self):
+        job_id = self._job_id()
+        if self.service.get(job_id) is None:
+            return self._send_json(404, {"error": "Unknown job"})
+        if not self.service.cancel(job_id):
+            return self._send_json(409, {"error": "Job has already started"})
+        self._send_json(200, {"id": job_id, "status": "cancelled"})
+
+    def log_request(self, code="-", size="-"):
+        # Status polling is frequent; only log failed requests
+        if str(getattr(code, "value", code)).startswith(("4", "5")):
+            super().log_request(code, size)
+
+
+def make_server(host=SERVER_HOST, port=SERVER_PORT, service=None):
+    """Build the HTTP server around an AnalysisService."""
+    service = service or AnalysisService()
+    handler = type("Handler", (AnalysisRequestHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.service = service
+    return server
+
+
+def main(argv=None):
+    from models import registry
+
+    parser = argparse.ArgumentParser(description="Serve analyses to local UI sessions from one set of models.")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="Jobs analysed concurrently")
+    args = parser.parse_args(argv)
+
+    # Load the models before accepting jobs so the first request is not slow
+    registry.warm_up()
+
+    server = make_server(args.host, args.port, AnalysisService(workers=args.workers))
+    print(f"Analysis server listening on http://{args.host}:{args.port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.service.stop(timeout=5)
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
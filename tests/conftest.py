@@ -0,0 +1,11 @@
+import pytest
+
+from utils.metrics import metrics
+
+
+@pytest.fixture(autouse=True)
+def metrics_file(tmp_path, monkeypatch):
+    """Export pipeline metrics to a temporary file instead of data/metrics.prom."""
+    path = tmp_path / "metrics.prom"
+    monkeypatch.setattr(metrics, "path", str(path))
+    return path
@@ -0,0 +1,96 @@
+"""Tests for analysis cache expiry, LRU eviction and image hashing."""
+
+import json
+
+import numpy as np
+import pytest
+
+from utils import analysis_cache
+from utils.analysis_cache import AnalysisCache, hash_image, make_cache_key
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(analysis_cache, "time", clock)
+    return clock
+
+
+def entry(size):
+    # A result whose stored JSON is exactly size bytes
+    result = {"analysis": ""}
+    result["analysis"] = "x" * (size - len(json.dumps(result)))
+    return result
+
+
+def test_entries_expire_after_ttl(tmp_path, clock):
+    cache = AnalysisCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=60)
+    cache.put("a", {"analysis": "A"})
+
+    clock.now += 59
+    assert cache.get("a") == {"analysis": "A"}
+    clock.now += 2
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+
+
+def test_zero_ttl_never_expires(tmp_path, clock):
+    cache = AnalysisCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=0)
+    cache.put("a", {"analysis": "A"})
+
+    clock.now += 10 * 365 * 24 * 3600
+    assert cache.get("a") == {"analysis": "A"}
+    cache.close()
+
+
+def test_evicts_least_recently_used_past_max_bytes(tmp_path, clock):
+    cache = AnalysisCache(str(tmp_path / "cache.sqlite3"), max_bytes=300, ttl_seconds=0)
+    for key in ("a", "b", "c"):
+        cache.put(key, entry(100))
+        clock.now += 1
+    # Reading "a" makes "b" the least recently used
+    assert cache.get("a") is not None
+    clock.now += 1
+
+    cache.put("d", entry(100))
+
+    assert cache.get("b") is None
+    assert all(cache.get(key) is not None for key in ("a", "c", "d"))
+    assert cache.stats()["bytes"] == 300
+    cache.close()
+
+
+def test_entries_survive_reopening(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = AnalysisCache(path)
+    cache.put("a", {"analysis": "नमस्ते"})
+    cache.close()
+
+    cache = AnalysisCache(path)
+    assert cache.get("a") == {"analysis": "नमस्ते"}
+    cache.close()
+
+
+def test_hash_image_tells_apart_layouts_of_the_same_bytes():
+    image = np.arange(24, dtype=np.uint8)
+
+    assert hash_image(image.reshape(4, 6)) != hash_image(image.reshape(6, 4))
+    assert hash_image(image.reshape(4, 6)) != hash_image(image.view(np.int8).reshape(4, 6))
+    assert hash_image(image.reshape(4, 6)) == hash_image(image.reshape(4, 6).copy())
+    assert hash_image(bytes(image)) != hash_image(image)
+
+
+def test_cache_key_depends_on_every_part():
+    assert make_cache_key("h", "en", 1) == make_cache_key("h", "en", 1)
+    assert make_cache_key("h", "en", 1) != make_cache_key("h", "hi", 1)
+    assert make_cache_key("h", "en", 1) != make_cache_key("h", "en", 2)
@@ -0,0 +1,148 @@
+"""Offline tests for the async Gemini client against a local fake endpoint."""
+
+import asyncio
+
+import cv2
+import numpy as np
+
+from benchmarks.fake_gemini import FakeGeminiModel, FakeGeminiServer
+from models.async_genai import AsyncGeminiClient, RestTransport
+from models.genai_helper import GeminiHelper
+from utils.analysis_cache import AnalysisCache
+from utils.metrics import metrics
+
+
+def make_image_bytes(value=128):
+    ok, encoded = cv2.imencode(".png", np.full((64, 64, 3), value, np.uint8))
+    assert ok
+    return encoded.tobytes()
+
+
+def make_client(server, cache=False, **kwargs):
+    helper = GeminiHelper(model=FakeGeminiModel(), cache=cache)
+    transport = RestTransport(server.base_url, api_key="test", timeout=2)
+    options = dict(requests_per_minute=6000, max_concurrency=4, timeout=2, max_retries=2, backoff_base=0.01)
+    options.update(kwargs)
+    return AsyncGeminiClient(helper, transport=transport, **options)
+
+
+def test_analyze_uploads_image_and_returns_text():
+    with FakeGeminiServer(text="1. Hospital Priority: GREEN") as server:
+        result = asyncio.run(make_client(server).analyze_medical_image(make_image_bytes()))
+
+    assert result["analysis"] == "1. Hospital Priority: GREEN"
+    assert server.calls == 1
+    parts = server.requests[0]["contents"][0]["parts"]
+    assert parts[1]["inline_data"]["mime_type"].startswith("image/")
+
+
+def test_retries_retryable_errors():
+    with FakeGeminiServer(failures=[503, 429]) as server:
+        result = asyncio.run(make_client(server).analyze_medical_image(make_image_bytes()))
+
+    assert "error" not in result
+    assert server.calls == 3
+
+
+def test_gives_up_after_max_retries():
+    with FakeGeminiServer(failures=[500] * 5) as server:
+        result = asyncio.run(make_client(server, max_retries=1).analyze_medical_image(make_image_bytes()))
+
+    assert result["attempts"] == 2
+    assert server.calls == 2
+
+
+def test_client_errors_are_not_retried():
+    with FakeGeminiServer(failures=[400]) as server:
+        result = asyncio.run(make_client(server).analyze_medical_image(make_image_bytes()))
+
+    assert result["attempts"] == 1
+    assert server.calls == 1
+
+
+def test_timeout_is_retried():
+    with FakeGeminiServer(latency=0.5) as server:
+        client = make_client(server, timeout=0.1, max_retries=1)
+        result = asyncio.run(client.analyze_medical_image(make_image_bytes()))
+
+    assert result["attempts"] == 2
+
+
+def test_analyze_many_caps_concurrency_and_keeps_order():
+    images = [make_image_bytes(value) for value in range(0, 240, 30)]
+    with FakeGeminiServer(latency=0.05) as server:
+        client = make_client(server, max_concurrency=2)
+        active, peak = 0, 0
+        generate = client.transport.generate
+
+        async def counting_generate(*args):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            try:
+                return await generate(*args)
+            finally:
+                active -= 1
+
+        client.transport.generate = counting_generate
+        results = asyncio.run(client.analyze_many([(image, None) for image in images]))
+
+    assert len(results) == len(images)
+    assert all("error" not in result for result in results)
+    assert peak == 2
+
+
+def test_client_can_be_reused_across_event_loops():
+    images = [make_image_bytes(value) for value in (10, 20, 30)]
+    with FakeGeminiServer(latency=0.02) as server:
+        client = make_client(server, max_concurrency=1)
+        for _ in range(2):
+            results = asyncio.run(client.analyze_many([(image, None) for image in images]))
+            assert all("error" not in result for result in results), results
+
+    assert server.calls == 6
+
+
+def token_count(kind):
+    return metrics.snapshot()["series"].get("gemini_tokens", {}).get(kind, {}).get("count", 0)
+
+
+def test_records_token_usage():
+    prompt, output = token_count("prompt"), token_count("output")
+    with FakeGeminiServer() as server:
+        asyncio.run(make_client(server).analyze_medical_image(make_image_bytes()))
+
+    assert token_count("prompt") == prompt + 1
+    assert token_count("output") == output + 1
+
+
+def test_cached_analysis_is_translated_without_upload(tmp_path):
+    cache = AnalysisCache(str(tmp_path / "cache.sqlite3"))
+    image = make_image_bytes()
+    with FakeGeminiServer() as server:
+        client = make_client(server, cache=cache)
+        asyncio.run(client.analyze_medical_image(image))
+        asyncio.run(client.analyze_medical_image(image, language="hi"))
+        asyncio.run(client.analyze_medical_image(image, language="hi"))
+
+    assert server.calls == 2
+    assert "inline_data" not in str(server.requests[1])
+    cache.close()
+
+
+def test_cached_translation_stream_keeps_its_base_analysis(tmp_path):
+    cache = AnalysisCache(str(tmp_path / "cache.sqlite3"))
+    helper = GeminiHelper(model=FakeGeminiModel(text="1. Hospital Priority: GREEN"), cache=cache)
+    image = make_image_bytes()
+    first = helper.stream_medical_image_analysis(image, language="hi")
+    "".join(first)
+    calls = helper.model.calls
+
+    hit = helper.stream_medical_image_analysis(image, language="hi")
+    "".join(hit)
+
+    assert helper.model.calls == calls
+    assert hit.result == first.result
+    assert hit.base_result == first.base_result
+    assert hit.base_result["language"] == "en"
+    cache.close()
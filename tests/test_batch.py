@@ -0,0 +1,34 @@
+"""Tests for resuming batch runs, with a stand-in classifier."""
+
+import json
+
+import cv2
+import numpy as np
+
+import batch
+from models import registry
+
+
+class ConstantClassifier:
+    def detect_anomalies_batch(self, images):
+        return [{"has_anomaly": False, "confidence": 0.1, "class_index": 0, "regions": [], "heatmap": None}
+                for _ in images]
+
+
+def test_resume_counts_only_this_runs_images(tmp_path, monkeypatch, metrics_file):
+    monkeypatch.setattr(registry, "get_classifier", ConstantClassifier)
+    image_dir = tmp_path / "images"
+    image_dir.mkdir()
+    for name in ("a.png", "b.png", "c.png"):
+        cv2.imwrite(str(image_dir / name), np.full((32, 32, 3), 90, np.uint8))
+    output = tmp_path / "results.jsonl"
+    with open(output, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"path": str(image_dir / "a.png"), "cv_results": {}}) + "\n")
+        f.write(json.dumps({"path": str(tmp_path / "elsewhere" / "x.png"), "cv_results": {}}) + "\n")
+
+    summary = batch.run_batch(str(image_dir), str(output), use_genai=False, workers=2, batch_size=2)
+
+    assert (summary["processed"], summary["failed"], summary["skipped"]) == (2, 0, 1)
+    paths = [json.loads(line)["path"] for line in output.read_text(encoding="utf-8").splitlines()]
+    assert sorted(paths[2:]) == [str(image_dir / "b.png"), str(image_dir / "c.png")]
+    assert metrics_file.exists()
@@ -0,0 +1,51 @@
+"""Tests for the micro-batcher's batching and shutdown."""
+
+import threading
+
+import pytest
+
+from models.batcher import MicroBatcher
+
+
+class EchoClassifier:
+    def __init__(self):
+        self.batches = []
+
+    def detect_anomalies_batch(self, images):
+        self.batches.append(len(images))
+        return [{"image": image} for image in images]
+
+
+def test_batches_concurrent_submissions():
+    classifier = EchoClassifier()
+    batcher = MicroBatcher(classifier, max_batch_size=4, max_wait_ms=200)
+    futures = batcher.submit_many(range(4))
+
+    assert [future.result(timeout=5)["image"] for future in futures] == [0, 1, 2, 3]
+    assert classifier.batches == [4]
+    batcher.stop(timeout=5)
+
+
+def test_every_submission_racing_stop_resolves_or_is_refused():
+    batcher = MicroBatcher(EchoClassifier(), max_batch_size=8, max_wait_ms=1)
+    futures, refused = [], []
+
+    def submit():
+        for i in range(200):
+            try:
+                futures.append(batcher.submit(i))
+            except RuntimeError:
+                refused.append(i)
+
+    threads = [threading.Thread(target=submit) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    batcher.stop(timeout=5)
+    for thread in threads:
+        thread.join()
+
+    for future in futures:
+        future.result(timeout=5)
+    assert len(futures) + len(refused) == 800
+    with pytest.raises(RuntimeError):
+        batcher.submit(0)
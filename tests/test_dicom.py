@@ -0,0 +1,137 @@
+"""Tests for the native DICOM reader on fixture files built in code."""
+
+import struct
+
+import numpy as np
+import pytest
+
+from utils.dicom import (EXPLICIT_VR_BE, EXPLICIT_VR_LE, IMPLICIT_VR_LE, DicomFile, apply_window, is_dicom,
+                         read_dicom)
+
+_LONG_VRS = (b"OB", b"OW", b"SQ", b"UN", b"UT")
+_UNDEFINED = 0xFFFFFFFF
+
+# Signed 16-bit, three frames of 4x5, spanning both sides of zero
+PIXELS = (np.arange(60, dtype=np.int16) * 40 - 1200).reshape(3, 4, 5)
+
+
+def element(tag, vr, value, explicit, endian="<", length=None):
+    if isinstance(value, str):
+        value = value.encode("latin-1")
+    if len(value) % 2:
+        value += b"\x00" if vr in (b"UI", b"OB") else b" "
+    length = len(value) if length is None else length
+    head = struct.pack(endian + "HH", tag >> 16, tag & 0xFFFF)
+    if not explicit or tag >> 16 == 0xFFFE:
+        head += struct.pack(endian + "I", length)
+    elif vr in _LONG_VRS:
+        head += vr + b"\x00\x00" + struct.pack(endian + "I", length)
+    else:
+        head += vr + struct.pack(endian + "H", length)
+    return head + value
+
+
+def us(tag, value, explicit, endian="<"):
+    return element(tag, b"US", struct.pack(endian + "H", value), explicit, endian)
+
+
+def undefined_sequence(explicit, endian="<"):
+    # Sequence and item both of undefined length, with a nested sequence and
+    # a Rows element inside that must not be taken for the image's own
+    inner = element(0x00081150, b"UI", "1.2.3", explicit, endian)
+    inner += us(0x00280010, 999, explicit, endian)
+    inner += element(0x00081155, b"SQ", b"", explicit, endian, length=_UNDEFINED)
+    inner += element(0xFFFEE000, None, b"", explicit, endian, length=_UNDEFINED)
+    inner += element(0x00080100, b"SH", "T-1", explicit, endian)
+    inner += element(0xFFFEE00D, None, b"", explicit, endian)
+    inner += element(0xFFFEE0DD, None, b"", explicit, endian)
+    body = element(0xFFFEE000, None, b"", explicit, endian, length=_UNDEFINED)
+    body += inner + element(0xFFFEE00D, None, b"", explicit, endian)
+    body += element(0xFFFEE0DD, None, b"", explicit, endian)
+    return element(0x00081140, b"SQ", b"", explicit, endian, length=_UNDEFINED) + body
+
+
+def make_dicom(syntax=EXPLICIT_VR_LE, pixels=PIXELS, window=("0", "2400"), preamble=True):
+    explicit = syntax != IMPLICIT_VR_LE
+    endian = ">" if syntax == EXPLICIT_VR_BE else "<"
+    frames, rows, columns = pixels.shape
+
+    dataset = element(0x00080060, b"CS", "CT", explicit, endian)
+    dataset += undefined_sequence(explicit, endian)
+    dataset += element(0x0020000E, b"UI", "1.2.826.0.1.7", explicit, endian)
+    dataset += element(0x00200013, b"IS", "4", explicit, endian)
+    dataset += us(0x00280002, 1, explicit, endian)
+    dataset += element(0x00280004, b"CS", "MONOCHROME2", explicit, endian)
+    dataset += element(0x00280008, b"IS", str(frames), explicit, endian)
+    dataset += us(0x00280010, rows, explicit, endian)
+    dataset += us(0x00280011, columns, explicit, endian)
+    dataset += us(0x00280100, 16, explicit, endian)
+    dataset += us(0x00280101, 16, explicit, endian)
+    dataset += us(0x00280103, 1, explicit, endian)
+    if window:
+        dataset += element(0x00281050, b"DS", window[0], explicit, endian)
+        dataset += element(0x00281051, b"DS", window[1], explicit, endian)
+    dataset += element(0x7FE00010, b"OW", pixels.astype(endian + "i2").tobytes(), explicit, endian)
+
+    if not preamble:
+        return dataset
+    meta = element(0x00020010, b"UI", syntax, True)
+    group_length = element(0x00020000, b"UL", struct.pack("<I", len(meta)), True)
+    return b"\x00" * 128 + b"DICM" + group_length + meta + dataset
+
+
+@pytest.mark.parametrize("syntax", [EXPLICIT_VR_LE, IMPLICIT_VR_LE, EXPLICIT_VR_BE])
+def test_header_skips_undefined_length_sequences(syntax):
+    dicom = DicomFile(make_dicom(syntax))
+
+    assert dicom.transfer_syntax == syntax
+    assert (dicom.rows, dicom.columns, dicom.frames) == (4, 5, 3)
+    assert dicom.values["Modality"] == "CT"
+    assert dicom.series_uid == "1.2.826.0.1.7"
+    assert dicom.instance_number == 4
+    assert dicom.window() == (0.0, 2400.0)
+    assert not dicom.compressed
+
+
+@pytest.mark.parametrize("syntax", [EXPLICIT_VR_LE, IMPLICIT_VR_LE, EXPLICIT_VR_BE])
+def test_signed_multi_frame_pixels(syntax, tmp_path):
+    path = tmp_path / "series.dcm"
+    path.write_bytes(make_dicom(syntax))
+
+    for source in (make_dicom(syntax), str(path)):
+        dicom = DicomFile(source)
+        assert dicom.pixels.dtype.kind == "i"
+        np.testing.assert_array_equal(dicom.pixels, PIXELS)
+        frames = [frame for _, frame in dicom.iter_frames()]
+        assert len(frames) == 3
+        for stored, frame in zip(PIXELS, frames):
+            # The 16-bit lookup table must agree with the float path
+            expected = apply_window(stored.astype(np.int32), 0.0, 2400.0)
+            assert frame.shape == (4, 5, 3)
+            np.testing.assert_array_equal(frame[..., 0], expected)
+
+
+def test_bare_implicit_dataset_without_preamble():
+    data = make_dicom(IMPLICIT_VR_LE, preamble=False)
+
+    assert not is_dicom(data)
+    dicom = DicomFile(data)
+    assert dicom.transfer_syntax == IMPLICIT_VR_LE
+    np.testing.assert_array_equal(dicom.pixels, PIXELS)
+
+
+def test_window_from_pixel_range_when_header_has_none():
+    data = make_dicom(window=None)
+
+    assert is_dicom(data)
+    dicom = DicomFile(data)
+    assert dicom.window() == (float(PIXELS.min() + PIXELS.max()) / 2, float(PIXELS.max() - PIXELS.min()))
+    image = read_dicom(data)
+    np.testing.assert_array_equal(image, dicom.frame(1))
+    # The window spans every frame, so the first and last reach black and white
+    assert dicom.frame(0).min() == 0 and dicom.frame(2).max() == 255
+
+
+def test_rejects_non_dicom():
+    with pytest.raises(ValueError):
+        DicomFile(b"\x89PNG\r\n\x1a\n" + b"\x00" * 64)
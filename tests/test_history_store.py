@@ -0,0 +1,93 @@
+"""Tests for the history store: priority extraction, filters and pagination."""
+
+from datetime import datetime
+
+import pytest
+
+from utils.history_store import HistoryStore, extract_priority
+
+
+@pytest.mark.parametrize("analysis, expected", [
+    ("1. Hospital Priority: RED - Immediate", "RED"),
+    ("1. **Hospital Priority:** ORANGE (Monitor)", "ORANGE"),
+    ("**Hospital Priority**: **GREEN** - Home Care", "GREEN"),
+    ("Hospital Priority - RED", "RED"),
+    ("Findings mention RED areas\n1. अस्पताल प्राथमिकता: ORANGE", "ORANGE"),
+    ("Not RED; GREEN", None),
+    ("1. Hospital Priority: not RED, GREEN", None),
+    ("", None),
+    (None, None),
+])
+def test_extract_priority_reads_the_priority_line(analysis, expected):
+    assert extract_priority(analysis) == expected
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.sqlite3"))
+    records = [
+        # (day, hour, district, priority, patient, report text)
+        (1, 9, "Pune", "RED", "Asha", "consolidation in the right lung"),
+        (1, 9, "pune", "GREEN", "Ravi", "clear fields"),
+        (1, 9, "Nashik", "ORANGE", "Meena", 'possible "fracture" of the radius'),
+        (2, 10, "Pune", "GREEN", "asha", "clear fields, no consolidation"),
+        (3, 8, "Nashik", "RED", "Kiran", "pleural effusion"),
+        (3, 8, "Pune", "ORANGE", "Dev", "nodule in the upper lobe"),
+        (4, 12, "Thane", "GREEN", "Asha", "normal study"),
+    ]
+    for day, hour, district, priority, patient, text in records:
+        store.add(
+            f"{text}\n\n1. Hospital Priority: {priority}",
+            patient={"patient_name": patient, "district": district},
+            genai_results={"analysis": f"1. Hospital Priority: {priority}"},
+            created_at=datetime(2026, 1, day, hour),
+        )
+    yield store
+    store.close()
+
+
+def test_query_pages_newest_first_without_overlap(store):
+    pages = [store.query(page=page, page_size=3) for page in (1, 2, 3, 4)]
+
+    ids = [record["id"] for page in pages for record in page]
+    assert [len(page) for page in pages] == [3, 3, 1, 0]
+    assert ids == [7, 6, 5, 4, 3, 2, 1]
+    assert "report" not in pages[0][0]
+    assert "report" in store.query(page_size=1, with_reports=True)[0]
+
+
+def test_filters(store):
+    def ids(**filters):
+        return sorted(record["id"] for record in store.query(page_size=50, **filters))
+
+    assert ids(district="PUNE") == [1, 2, 4, 6]
+    assert ids(priority="RED") == [1, 5]
+    assert ids(patient_name="asha") == [1, 4, 7]
+    assert ids(date_from="2026-01-02", date_to="2026-01-03") == [4, 5, 6]
+    assert ids(search="consolidation") == [1, 4]
+    assert ids(search='"fracture"') == [3]
+    assert ids(search="Asha", district="Pune", priority="GREEN") == [4]
+    assert store.count(district="Nashik") == 2
+    assert store.districts() == ["Nashik", "Pune", "pune", "Thane"]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 100])
+def test_iter_records_keyset_pages_through_ties(store, chunk_size):
+    # Records 1-3 and 5-6 share a timestamp, so chunks must break ties by id
+    expected = [record["id"] for record in store.query(page_size=50)]
+
+    assert [record["id"] for record in store.iter_records(chunk_size=chunk_size)] == expected
+    assert [record["id"] for record in store.iter_records(chunk_size=chunk_size, district="pune")] == [6, 4, 2, 1]
+
+
+def test_delete_removes_record_from_search(store):
+    store.delete(4)
+
+    assert [record["id"] for record in store.query(search="consolidation")] == [1]
+    assert store.get(4) is None
+
+
+def test_phash_round_trips_through_signed_storage(store):
+    record_id = store.add("report", phash=0xFFFF_0000_0000_0001)
+
+    assert dict(store.iter_phashes(chunk_size=1))[record_id] == 0xFFFF_0000_0000_0001
@@ -0,0 +1,27 @@
+"""Tests for the desktop job queue's event snapshots."""
+
+from models.analysis_service import DONE, QUEUED, RUNNING
+from ui.job_queue import DesktopJob, JobQueue
+
+
+def test_updates_drained_after_the_job_finished_keep_their_own_state():
+    updates = []
+
+    def run_job(job):
+        queue.set_stage(job, "detecting", 0.3)
+        queue.set_stage(job, "analyzing", 0.6)
+        job.results = {"report": "done"}
+
+    queue = JobQueue(run_job, lambda job, state: updates.append(state), workers=1)
+    job = queue.submit(DesktopJob("scan.png"))
+    queue.stop()
+    queue._threads[0].join(timeout=5)
+    assert job.status == DONE
+
+    # Nothing was drained while the job ran
+    queue.drain()
+    assert updates == [(QUEUED, QUEUED, 0.0), (RUNNING, "detecting", 0.3),
+                       (RUNNING, "analyzing", 0.6), (DONE, DONE, 1.0)]
+    assert [state[0] for state in updates].count(DONE) == 1
+    assert job.label(updates[1]) == "scan.png - detecting (30%)"
+
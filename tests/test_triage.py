@@ -0,0 +1,111 @@
+"""Tests for triage ordering, the confident-normal policies and JSON-safe detection results."""
+
+import json
+
+import numpy as np
+import pytest
+
+from models.triage import TriageScheduler, is_confident_normal, provisional_priority, skipped_analysis
+
+RED = {"has_anomaly": True, "confidence": 0.9}
+ORANGE = {"has_anomaly": True, "confidence": 0.6}
+GREEN = {"has_anomaly": False, "confidence": 0.3}
+UNSURE = {"has_anomaly": False, "confidence": 0.05}
+NORMAL = {"has_anomaly": False, "confidence": 0.97, "normal_confidence": 0.97}
+
+
+def drain(scheduler):
+    scheduler.close()
+    items = []
+    while True:
+        item, _ = scheduler.get(timeout=1)
+        if item is None:
+            return items
+        items.append(item)
+
+
+def test_provisional_priority():
+    assert [provisional_priority(r) for r in (RED, ORANGE, GREEN, NORMAL)] == ["RED", "ORANGE", "GREEN", "GREEN"]
+
+
+def test_only_a_normal_class_score_makes_a_confident_normal():
+    assert is_confident_normal(NORMAL)
+    assert not is_confident_normal(UNSURE)
+    assert not is_confident_normal({"has_anomaly": False, "confidence": 0.5, "normal_confidence": 0.5})
+    assert not is_confident_normal({"has_anomaly": True, "confidence": 0.97, "normal_confidence": 0.97})
+
+
+def test_serves_by_tier_then_rank_then_arrival():
+    scheduler = TriageScheduler(enabled=True, normal_policy="run")
+    for name, cv_results, rank in [("green", GREEN, 0), ("orange-low", ORANGE, 1), ("red", RED, 0),
+                                   ("orange-1", ORANGE, 0), ("orange-2", ORANGE, 0)]:
+        scheduler.put(name, cv_results, rank)
+
+    assert drain(scheduler) == ["red", "orange-1", "orange-2", "orange-low", "green"]
+
+
+def test_disabled_is_first_in_first_out_and_skips_nothing():
+    scheduler = TriageScheduler(enabled=False, normal_policy="skip")
+    for name, cv_results in [("normal", NORMAL), ("green", GREEN), ("red", RED)]:
+        assert scheduler.put(name, cv_results)[0] is not None
+
+    assert drain(scheduler) == ["normal", "green", "red"]
+    assert scheduler.stats()["skipped"] == 0
+
+
+def test_defer_runs_confident_normals_after_other_work():
+    scheduler = TriageScheduler(enabled=True, normal_policy="defer")
+    assert scheduler.put("normal", NORMAL) == ("DEFERRED", "GREEN")
+    assert scheduler.put("unsure", UNSURE) == ("GREEN", "GREEN")
+    scheduler.put("orange", ORANGE)
+
+    assert scheduler.stats()["queued"]["DEFERRED"] == 1
+    assert drain(scheduler) == ["orange", "unsure", "normal"]
+    assert scheduler.stats()["sent"]["DEFERRED"] == 1
+
+
+def test_skip_only_skips_confident_normals():
+    scheduler = TriageScheduler(enabled=True, normal_policy="skip")
+
+    assert scheduler.put("normal", NORMAL) == (None, "GREEN")
+    assert scheduler.put("unsure", UNSURE) == ("GREEN", "GREEN")
+    assert drain(scheduler) == ["unsure"]
+    assert scheduler.stats()["skipped"] == 1
+    assert skipped_analysis(NORMAL)["skipped"]
+
+
+def test_rejects_unknown_policy():
+    with pytest.raises(ValueError):
+        TriageScheduler(normal_policy="drop")
+
+
+@pytest.fixture(scope="module")
+def normal_class_classifier(tmp_path_factory):
+    # A tiny model whose class 0 is "normal" and wins for bright images
+    tf = pytest.importorskip("tensorflow")
+    from models.classifier import ImageClassifier
+
+    inputs = tf.keras.Input((224, 224, 3))
+    pooled = tf.keras.layers.GlobalAveragePooling2D()(inputs)
+    outputs = tf.keras.layers.Dense(2, activation="softmax")(pooled)
+    model = tf.keras.Model(inputs, outputs)
+    model.layers[-1].set_weights([np.array([[20.0, -20.0]] * 3, np.float32), np.array([-10.0, 10.0], np.float32)])
+    path = str(tmp_path_factory.mktemp("model") / "normal.keras")
+    model.save(path)
+    return ImageClassifier(path, backend="keras", normal_class=0)
+
+
+def test_normal_class_results_are_json_serialisable_and_skipped(normal_class_classifier):
+    bright = np.full((64, 64, 3), 250, np.uint8)
+    dark = np.zeros((64, 64, 3), np.uint8)
+    normal, abnormal = normal_class_classifier.detect_anomalies_batch([bright, dark])
+
+    assert normal["has_anomaly"] is False and normal["normal_confidence"] > 0.95
+    assert abnormal["has_anomaly"] is True and abnormal["normal_confidence"] < 0.05
+    assert json.loads(json.dumps(normal))["has_anomaly"] is False
+    json.dumps(abnormal)
+
+    scheduler = TriageScheduler(enabled=True, normal_policy="skip")
+    assert scheduler.put("bright", normal) == (None, "GREEN")
+    assert scheduler.put("dark", abnormal)[0] == "RED"
+    json.dumps({"cv_results": normal, "genai_results": skipped_analysis(normal)})
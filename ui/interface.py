@@ -2,31 +2,67 @@ import tkinter as tk
 from tkinter import filedialog, messagebox
 from PIL import Image, ImageTk
 import os
-import threading
+import time
 import cv2
 import numpy as np
 
-from models.classifier import ImageClassifier
-from models.genai_helper import GeminiHelper
-from utils.image_processing import preprocess_image, draw_anomalies
-from utils.report_generator import generate_report
+from models import registry
+from models.analysis_client import ServerError, get_client
+from models.analysis_service import DONE, FAILED, CANCELLED, FINISHED
+from config import DUPLICATE_DETECTION_ENABLED, DESKTOP_POLL_MS
+from ui.job_queue import DesktopJob, JobCancelled, JobQueue
+from utils.analysis_cache import hash_image
+from utils.duplicate_index import DuplicateIndex, phash
+from utils.image_processing import load_image, preprocess_image, draw_anomalies, scale_regions
+from utils.metrics import metrics
+from utils.preview_cache import get_preview_cache
+from utils.report_generator import generate_report_stream
+from utils.tiling import is_large_image, open_tiled, build_overview, process_tiled
 
 class ApplicationUI(tk.Frame):
     def __init__(self, master=None):
         super().__init__(master)
         self.master = master
         
-        # Initialize models
-        self.classifier = ImageClassifier()
-        self.genai = GeminiHelper()
+        # Analyses run on the local analysis server when one is configured
+        self.client = get_client()
+        
+        # Otherwise build shared models in the background so the window shows at once
+        if self.client is None:
+            registry.start_background_warm_up()
         
         # Track current image and analysis
         self.current_image_path = None
+        self.current_image_bytes = None
         self.current_image = None
+        self.current_image_hash = None
+        self.current_is_large = False
+        self.current_preprocessed = None
+        self.current_phash = None
         self.current_results = None
         
+        # Results analysed in this session, looked up by perceptual hash
+        self.duplicates = DuplicateIndex()
+        
+        # Analyses run on a small worker pool; the job whose results are
+        # on screen is shown_job
+        self.jobs = JobQueue(self.run_job, self.update_job)
+        self.job_list = []
+        self.shown_job = None
+        
         # Create UI
         self.create_widgets()
+        self.poll_events()
+    
+    @property
+    def classifier(self):
+        """Shared classifier; waits for the background build if needed."""
+        return registry.get_classifier()
+    
+    @property
+    def genai(self):
+        """Shared Gemini helper; waits for the background build if needed."""
+        return registry.get_genai_helper()
     
     def create_widgets(self):
         # Top frame for buttons
@@ -50,6 +86,22 @@ class ApplicationUI(tk.Frame):
         )
         self.analyze_button.pack(side="left", padx=10)
         
+        # Queue several images at once
+        self.queue_button = tk.Button(
+            self.top_frame,
+            text="Queue Images",
+            command=self.queue_images
+        )
+        self.queue_button.pack(side="left", padx=10)
+        
+        # Cancel the selected job
+        self.cancel_button = tk.Button(
+            self.top_frame,
+            text="Cancel",
+            command=self.cancel_job
+        )
+        self.cancel_button.pack(side="left", padx=10)
+        
         # Save report button
         self.save_button = tk.Button(
             self.top_frame,
@@ -59,6 +111,26 @@ class ApplicationUI(tk.Frame):
         )
         self.save_button.pack(side="left", padx=10)
         
+        # Pipeline timings debug panel
+        self.timings_button = tk.Button(
+            self.top_frame,
+            text="Timings",
+            command=self.show_timings
+        )
+        self.timings_button.pack(side="right", padx=10)
+        
+        # Analysis queue; selecting a job shows its results
+        self.queue_frame = tk.Frame(self)
+        self.queue_frame.pack(fill="x", padx=10)
+        
+        self.job_listbox = tk.Listbox(self.queue_frame, height=4)
+        self.job_listbox.pack(side="left", fill="x", expand=True)
+        self.job_listbox.bind("<<ListboxSelect>>", self.select_job)
+        
+        queue_scrollbar = tk.Scrollbar(self.queue_frame, command=self.job_listbox.yview)
+        queue_scrollbar.pack(side="right", fill="y")
+        self.job_listbox.config(yscrollcommand=queue_scrollbar.set)
+        
         # Middle frame for image display
         self.image_frame = tk.Frame(self)
         self.image_frame.pack(fill="both", expand=True, pady=10)
@@ -92,7 +164,7 @@ class ApplicationUI(tk.Frame):
         file_path = filedialog.askopenfilename(
             title="Select Medical Image",
             filetypes=[
-                ("Image files", "*.jpg *.jpeg *.png *.bmp *.tif *.tiff")
+                ("Image files", "*.jpg *.jpeg *.png *.bmp *.tif *.tiff *.dcm")
             ]
         )
         
@@ -100,30 +172,77 @@ class ApplicationUI(tk.Frame):
             return
         
         try:
-            # Load and display the image
+            self.current_is_large = is_large_image(file_path)
+            if self.current_is_large:
+                # Very large scans are never held in memory whole; keep an
+                # overview for display and process tiles at analysis time
+                self.current_image = build_overview(open_tiled(file_path))
+                self.current_image_bytes = None
+            else:
+                # Read and decode the file once; every stage reuses these buffers
+                with open(file_path, "rb") as f:
+                    image_bytes = f.read()
+                self.current_image = load_image(image_bytes)
+                self.current_image_bytes = image_bytes
             self.current_image_path = file_path
-            self.display_image(file_path)
+            # Hashed once here so preview lookups on every redraw do not
+            # rehash the full-resolution image
+            self.current_image_hash = hash_image(
+                self.current_image if self.current_image_bytes is None else self.current_image_bytes
+            )
+            
+            # Preprocess once on load; the analysis and the duplicate check
+            # share the output. Large scans use their overview for the hash.
+            self.current_preprocessed = None if self.current_is_large else preprocess_image(self.current_image)
+            self.current_phash = None
+            if DUPLICATE_DETECTION_ENABLED:
+                self.current_phash = phash(
+                    self.current_image if self.current_is_large else self.current_preprocessed
+                )
+            
+            self.display_image(self.current_image, self.current_image_hash)
             self.analyze_button.config(state="normal")
             self.status_var.set(f"Loaded: {os.path.basename(file_path)}")
             
-            # Clear previous results
+            # Clear previous results; queued jobs keep running in the background
+            self.shown_job = None
+            self.job_listbox.selection_clear(0, tk.END)
             self.results_text.delete(1.0, tk.END)
             self.save_button.config(state="disabled")
+            
+            self.offer_previous_result()
         
         except Exception as e:
             messagebox.showerror("Error", f"Could not load image: {str(e)}")
     
-    def display_image(self, image_path):
-        """Display the image in the UI."""
-        # Load image with PIL
-        img = Image.open(image_path)
-        
-        # Resize image to fit display area while maintaining aspect ratio
-        display_width = 600
-        width, height = img.size
-        ratio = display_width / width
-        new_size = (display_width, int(height * ratio))
-        img = img.resize(new_size, Image.LANCZOS)
+    def offer_previous_result(self):
+        """Offer the earlier result when the loaded image was already analysed."""
+        if self.current_phash is None:
+            return
+        match = self.duplicates.find(self.current_phash)
+        if match is None:
+            return
+        previous = match[1]
+        if messagebox.askyesno(
+            "Possible Duplicate",
+            "This image closely matches one already analysed in this session.\n"
+            "Show the previous result instead of analysing it again?"
+        ):
+            self.shown_job = None
+            self.current_results = previous
+            image, display_cv_results, image_hash = previous["displayed"]
+            self.display_results(image, display_cv_results, previous["report"], image_hash)
+    
+    def remember_result(self, job):
+        """Index a finished analysis so a repeat upload can reuse it."""
+        if job.phash is not None:
+            self.duplicates.add(job.phash, dict(job.results, displayed=job.displayed))
+    
+    def display_image(self, image, image_hash=None):
+        """Display the image in the UI; pass image_hash when it is already known."""
+        # Display-size level of the preview pyramid, resized once per image
+        preview = get_preview_cache().get(image, "display", image_hash)
+        img = Image.fromarray(cv2.cvtColor(preview, cv2.COLOR_BGR2RGB))
         
         # Convert to PhotoImage for Tkinter
         photo = ImageTk.PhotoImage(img)
@@ -133,85 +252,273 @@ class ApplicationUI(tk.Frame):
         self.image_label.image = photo  # Keep a reference
     
     def analyze_image(self):
-        """Analyze the loaded image with CV and GenAI."""
+        """Queue the loaded image for analysis with CV and GenAI."""
         if not self.current_image_path:
             return
         
-        # Disable analyze button during processing
+        job = DesktopJob(
+            self.current_image_path,
+            image=self.current_image,
+            image_bytes=self.current_image_bytes,
+            preprocessed=self.current_preprocessed,
+            is_large=self.current_is_large,
+            image_phash=self.current_phash,
+            image_hash=self.current_image_hash
+        )
+        
+        # Queueing the same image twice is almost always a double click
         self.analyze_button.config(state="disabled")
-        self.status_var.set("Analyzing image...")
-        
-        # Use a thread to avoid freezing the UI
-        def analysis_task():
-            try:
-                # Preprocess the image
-                preprocessed = preprocess_image(self.current_image_path)
-                
-                # Run computer vision analysis
-                cv_results = self.classifier.detect_anomalies(preprocessed)
-                
-                # Run GenAI analysis
-                genai_results = self.genai.analyze_medical_image(
-                    self.current_image_path,
-                    cv_results
-                )
-                
-                # Generate report
-                report = generate_report(
-                    self.current_image_path,
-                    cv_results,
-                    genai_results
-                )
-                
-                # Store results
-                self.current_results = {
-                    "cv_results": cv_results,
-                    "genai_results": genai_results,
-                    "report": report
-                }
-                
-                # Update UI with results
-                self.display_results(preprocessed, cv_results, report)
+        self.add_job(job)
+        self.show_job(job)
+    
+    def queue_images(self):
+        """Queue several images from disk; they are loaded by the workers."""
+        file_paths = filedialog.askopenfilenames(
+            title="Select Medical Images",
+            filetypes=[
+                ("Image files", "*.jpg *.jpeg *.png *.bmp *.tif *.tiff *.dcm")
+            ]
+        )
+        
+        for file_path in file_paths:
+            self.add_job(DesktopJob(file_path))
+        if file_paths:
+            self.status_var.set(f"Queued {len(file_paths)} images")
+    
+    def add_job(self, job):
+        """List a job in the queue panel and hand it to the workers."""
+        self.job_list.append(job)
+        self.job_listbox.insert(tk.END, job.label())
+        self.jobs.submit(job)
+    
+    def cancel_job(self):
+        """Cancel the selected job, or the one on screen."""
+        selection = self.job_listbox.curselection()
+        job = self.job_list[selection[0]] if selection else self.shown_job
+        if job is not None and not job.finished:
+            self.jobs.cancel(job)
+    
+    def poll_events(self):
+        """Apply updates posted by the workers, then check again shortly."""
+        self.jobs.drain()
+        self.master.after(DESKTOP_POLL_MS, self.poll_events)
+    
+    def select_job(self, event=None):
+        """Show the job selected in the queue panel."""
+        selection = self.job_listbox.curselection()
+        if selection:
+            self.show_job(self.job_list[selection[0]])
+    
+    def show_job(self, job):
+        """Show a job's image and whatever of its report has arrived so far."""
+        self.shown_job = job
+        if job.displayed is not None:
+            self.begin_results(*job.displayed)
+            self.append_results("".join(job.report_parts))
+        else:
+            if job.image is not None:
+                self.display_image(job.image, job.image_hash)
+            self.results_text.delete(1.0, tk.END)
+        
+        self.current_results = job.results
+        self.save_button.config(state="normal" if job.results else "disabled")
+        self.status_var.set(f"{job.name}: {job.stage}")
+    
+    def update_job(self, job, state):
+        """
+        Refresh a job's line in the queue panel; runs on the UI thread.
+        
+        state is the job's (status, stage, progress) when the update was
+        posted. The job may have finished since, so only the update that
+        carries DONE handles the finished result.
+        """
+        status, stage, progress = state
+        index = self.job_list.index(job)
+        selected = index in self.job_listbox.curselection()
+        self.job_listbox.delete(index)
+        self.job_listbox.insert(index, job.label(state))
+        if selected:
+            self.job_listbox.selection_set(index)
+        
+        shown = job is self.shown_job
+        if status == DONE:
+            self.remember_result(job)
+        if status in FINISHED and job.path == self.current_image_path:
+            self.analyze_button.config(state="normal")
+        
+        if not shown:
+            return
+        if status == DONE:
+            self.current_results = job.results
+            self.finish_results(job.results["cv_results"])
+        elif status == FAILED:
+            self.status_var.set("Analysis failed")
+            messagebox.showerror("Analysis Error", f"Error during analysis: {job.error}")
+        elif status == CANCELLED:
+            self.status_var.set(f"Cancelled: {job.name}")
+        else:
+            self.status_var.set(f"{job.name}: {stage} ({progress:.0%})")
+    
+    def job_detected(self, job, image, cv_results, image_hash):
+        """Record a job's CV results and show them if it is on screen."""
+        job.displayed = (image, cv_results, image_hash)
+        if job is self.shown_job:
+            self.begin_results(image, cv_results, image_hash)
+    
+    def job_report(self, job, text):
+        """Record a piece of a job's report and show it if the job is on screen."""
+        job.report_parts.append(text)
+        if job is self.shown_job:
+            self.append_results(text)
+    
+    def run_job(self, job):
+        """Analyze one queued image; runs on a worker thread."""
+        start = time.perf_counter()
+        try:
+            if job.image is None:
+                self.prepare_job(job)
             
-            except Exception as e:
-                # Show error in UI
-                self.master.after(0, lambda: messagebox.showerror(
-                    "Analysis Error",
-                    f"Error during analysis: {str(e)}"
-                ))
-                self.status_var.set("Analysis failed")
+            if self.client is not None:
+                cv_results, genai_results, report = self.run_remote_analysis(job)
+            else:
+                cv_results, genai_results, report = self.run_local_analysis(job)
             
-            finally:
-                # Re-enable analyze button
-                self.master.after(0, lambda: self.analyze_button.config(state="normal"))
+            # Store results
+            job.results = {
+                "cv_results": cv_results,
+                "genai_results": genai_results,
+                "report": report
+            }
+            metrics.observe("stage_seconds", "analysis", time.perf_counter() - start)
+        finally:
+            metrics.flush()
+    
+    def prepare_job(self, job):
+        """Load and preprocess an image queued straight from disk."""
+        self.jobs.set_stage(job, "loading", 0.05)
+        job.is_large = is_large_image(job.path)
+        if job.is_large:
+            job.image = build_overview(open_tiled(job.path))
+            job.image_hash = hash_image(job.image)
+        else:
+            with open(job.path, "rb") as f:
+                job.image_bytes = f.read()
+            job.image = load_image(job.image_bytes)
+            job.image_hash = hash_image(job.image_bytes)
+            
+            self.jobs.set_stage(job, "preprocessing", 0.15)
+            job.preprocessed = preprocess_image(job.image)
         
-        # Start analysis thread
-        threading.Thread(target=analysis_task).start()
+        if DUPLICATE_DETECTION_ENABLED:
+            job.phash = phash(job.image if job.is_large else job.preprocessed)
     
-    def display_results(self, image, cv_results, report):
+    def run_local_analysis(self, job):
+        """Analyze a job with in-process models; runs on a worker thread."""
+        self.jobs.set_stage(job, "detecting", 0.3)
+        if job.is_large:
+            # Enhance and classify tile by tile within the memory budget
+            tiled = process_tiled(job.path, self.classifier)
+            preprocessed = tiled["overview"]
+            cv_results = tiled["cv_results"]
+            display_cv_results = scale_regions(cv_results, tiled["scale"])
+            genai_image = preprocessed
+        else:
+            preprocessed = job.preprocessed
+            
+            # Run computer vision analysis; concurrent jobs share forward passes
+            cv_results = registry.get_batcher().submit(preprocessed).result()
+            display_cv_results = cv_results
+            genai_image = job.image_bytes
+        
+        # Show the CV results right away, then stream the AI section in
+        # Hashed here on the worker, once, for the preview lookups that follow
+        self.jobs.post(self.job_detected, job, preprocessed, display_cv_results, hash_image(preprocessed))
+        self.jobs.set_stage(job, "analyzing", 0.5)
+        
+        genai_stream = self.genai.stream_medical_image_analysis(
+            genai_image,
+            cv_results
+        )
+        
+        pieces = []
+        for piece in generate_report_stream(
+            job.path,
+            cv_results,
+            genai_stream
+        ):
+            job.check_cancelled()
+            pieces.append(piece)
+            self.jobs.post(self.job_report, job, piece)
+        return cv_results, genai_stream.result, "".join(pieces)
+    
+    def run_remote_analysis(self, job):
+        """Analyze a job on the analysis server; runs on a worker thread."""
+        image_bytes = job.image_bytes
+        if image_bytes is None:
+            # Very large scans are sent as their overview
+            image_bytes = cv2.imencode(".png", job.image)[1].tobytes()
+        job_id = self.client.submit(image_bytes, image_name=job.name)
+        
+        # The server reports regions on its preprocessed copy, whose longest
+        # side is capped at 1024 px; map them back onto the loaded image
+        longest = max(job.image.shape[:2])
+        scale = longest / min(longest, 1024)
+        shown = []
+        
+        def on_status(status):
+            if job.cancelled:
+                try:
+                    self.client.cancel(job_id)
+                except ServerError:
+                    # Already running on the server; just stop following it
+                    pass
+                raise JobCancelled()
+            if status["cv_results"] is not None and not shown:
+                shown.append(True)
+                self.jobs.post(self.job_detected, job, job.image, scale_regions(status["cv_results"], scale),
+                               job.image_hash)
+                self.jobs.set_stage(job, "analyzing", 0.5)
+            elif status["stage"] != job.stage and not shown:
+                self.jobs.set_stage(job, status["stage"], 0.2)
+        
+        stream = self.client.stream(job_id, on_status)
+        for piece in stream:
+            self.jobs.post(self.job_report, job, piece)
+        status = stream.result
+        return status["cv_results"], status["genai_results"], status["report"]
+    
+    def display_results(self, image, cv_results, report, image_hash=None):
         """Display analysis results in the UI."""
-        # Draw anomalies on image
-        result_image = draw_anomalies(image, cv_results)
+        self.begin_results(image, cv_results, image_hash)
+        self.append_results(report)
+        self.finish_results(cv_results)
+    
+    def begin_results(self, image, cv_results, image_hash=None):
+        """Show the annotated image and clear the report before streaming."""
+        # Draw anomalies on the display-size preview rather than full resolution
+        preview = get_preview_cache().get(image, "display", image_hash)
+        scale = preview.shape[1] / image.shape[1]
+        result_image = draw_anomalies(preview, scale_regions(cv_results, scale))
         
         # Convert to PIL format for display
         result_pil = Image.fromarray(result_image)
         
-        # Resize for display
-        display_width = 600
-        width, height = result_pil.size
-        ratio = display_width / width
-        new_size = (display_width, int(height * ratio))
-        result_pil = result_pil.resize(new_size, Image.LANCZOS)
-        
         # Update image display
         photo = ImageTk.PhotoImage(result_pil)
         self.image_label.config(image=photo)
         self.image_label.image = photo  # Keep a reference
         
-        # Update results text
+        # Clear results text
         self.results_text.delete(1.0, tk.END)
-        self.results_text.insert(tk.END, report)
-        
+        self.status_var.set("Generating AI analysis...")
+    
+    def append_results(self, text):
+        """Append a piece of the report to the results text."""
+        self.results_text.insert(tk.END, text)
+        self.results_text.see(tk.END)
+    
+    def finish_results(self, cv_results):
+        """Enable saving and show the final status once the report is complete."""
         # Enable save button
         self.save_button.config(state="normal")
         
@@ -219,6 +526,15 @@ class ApplicationUI(tk.Frame):
         anomaly_status = "Anomalies detected" if cv_results.get("has_anomaly", False) else "No anomalies detected"
         self.status_var.set(f"Analysis complete: {anomaly_status}")
     
+    def show_timings(self):
+        """Show rolling per-stage timings and payload sizes in a window."""
+        window = tk.Toplevel(self.master)
+        window.title("Pipeline Timings")
+        text = tk.Text(window, width=90, height=20, font=("Courier", 10))
+        text.pack(fill="both", expand=True, padx=10, pady=10)
+        text.insert(tk.END, metrics.format_table())
+        text.config(state="disabled")
+    
     def save_report(self):
         """Save the analysis report to a file."""
         if not self.current_results:
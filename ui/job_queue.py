@@ -0,0 +1,183 @@
+import itertools
+import os
+import queue
+import threading
+
+from config import DESKTOP_WORKERS
+from models.analysis_service import QUEUED, RUNNING, DONE, FAILED, CANCELLED, FINISHED
+
+_ids = itertools.count(1)
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once it has been cancelled."""
+
+
+class DesktopJob:
+    """
+    One image queued for analysis in the desktop app.
+
+    The image fields are filled in at load time for the image on screen, or
+    by the worker for images queued straight from disk. report_parts and
+    displayed are only changed on the UI thread.
+    """
+
+    def __init__(self, path, image=None, image_bytes=None, preprocessed=None, is_large=False, image_phash=None,
+                 image_hash=None):
+        self.id = next(_ids)
+        self.path = path
+        self.name = os.path.basename(path)
+        self.image = image
+        self.image_bytes = image_bytes
+        self.preprocessed = preprocessed
+        self.is_large = is_large
+        self.phash = image_phash
+        # Content hash of image, for preview cache lookups
+        self.image_hash = image_hash
+
+        self.status = QUEUED
+        self.stage = QUEUED
+        self.progress = 0.0
+        self.displayed = None
+        self.report_parts = []
+        self.results = None
+        self.error = None
+        self._cancel = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def finished(self):
+        return self.status in FINISHED
+
+    def cancel(self):
+        """Ask the job to stop; queued jobs are skipped, running ones stop at the next check."""
+        self._cancel.set()
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def state(self):
+        """Return (status, stage, progress) as they are now."""
+        return self.status, self.stage, self.progress
+
+    def label(self, state=None):
+        """Describe the job for the queue panel, as of state (default: now)."""
+        status, stage, progress = state or self.state()
+        if status == RUNNING:
+            return f"{self.name} - {stage} ({progress:.0%})"
+        if status == FAILED:
+            return f"{self.name} - failed: {self.error}"
+        return f"{self.name} - {status}"
+
+
+class JobQueue:
+    """
+    Bounded pool of worker threads running desktop analysis jobs in order.
+
+    With more than one worker, the next image is decoded, preprocessed and
+    classified while an earlier one is waiting on Gemini. Workers never
+    touch Tk: each update is posted to an event queue that the UI thread
+    drains from an after() loop, so widgets only change on the main loop.
+    Updates carry the job's state as of posting, since the job itself may
+    have moved on by the time the UI thread gets to them.
+    """
+
+    def __init__(self, run_job, on_update, workers=DESKTOP_WORKERS):
+        """
+        Args:
+            run_job: Callable(job) doing the analysis on a worker thread;
+                raises JobCancelled to stop early
+            on_update: Callable(job, state) run on the UI thread whenever
+                a job's status, stage or progress changes; state is the
+                (status, stage, progress) at the time of the change
+            workers: Jobs analysed concurrently
+        """
+        self.run_job = run_job
+        self.on_update = on_update
+        self.events = queue.Queue()
+
+        self._jobs = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"desktop-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, job):
+        """Queue a job and return it."""
+        self._jobs.put(job)
+        self._notify(job)
+        return job
+
+    def post(self, callback, *args):
+        """Run callback(*args) on the UI thread at the next drain; safe from any thread."""
+        self.events.put((callback, args))
+
+    def _notify(self, job):
+        self.post(self.on_update, job, job.state())
+
+    def set_stage(self, job, stage, progress):
+        """Record a job's progress from its worker and tell the UI."""
+        job.check_cancelled()
+        job.stage = stage
+        job.progress = progress
+        self._notify(job)
+
+    def cancel(self, job):
+        """Cancel a job; a queued job is marked cancelled at once."""
+        with self._lock:
+            job.cancel()
+            if job.status != QUEUED:
+                return
+            job.status = job.stage = CANCELLED
+        self._notify(job)
+
+    def drain(self, limit=200):
+        """
+        Run pending UI callbacks; call only from the UI thread.
+
+        At most limit callbacks run per call so a fast stream cannot starve
+        the event loop.
+        """
+        for _ in range(limit):
+            try:
+                callback, args = self.events.get_nowait()
+            except queue.Empty:
+                return
+            callback(*args)
+
+    def stop(self):
+        """Stop the workers once their current jobs finish."""
+        for _ in self._threads:
+            self._jobs.put(None)
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            with self._lock:
+                if job.status != QUEUED:
+                    # Cancelled while waiting
+                    continue
+                job.status = RUNNING
+            try:
+                self.run_job(job)
+                job.status = DONE
+                job.progress = 1.0
+            except JobCancelled:
+                job.status = CANCELLED
+            except Exception as e:
+                job.error = str(e)
+                job.status = FAILED
+            finally:
+                job.stage = job.status
+                # The decoded image stays for display; the file bytes are not needed
+                job.image_bytes = None
+                self._notify(job)
@@ -1,17 +1,21 @@
 import streamlit as st
-import cv2
-import numpy as np
-from PIL import Image
-import os
-from datetime import datetime
-import json
+import time
+from datetime import date, datetime, timedelta
 from pathlib import Path
 
-from models.classifier import ImageClassifier
-from models.genai_helper import GeminiHelper
-from utils.image_processing import preprocess_image, draw_anomalies
-from utils.report_generator import generate_report
-from config import GEMINI_API_KEY
+from models import registry
+from models.analysis_client import get_client
+from utils.history_store import get_history_store
+from utils.metrics import metrics
+from utils.report_generator import generate_report, generate_report_stream
+from config import GEMINI_API_KEY, HISTORY_PAGE_SIZE, DUPLICATE_DETECTION_ENABLED
+
+def show_export_progress(export_job):
+    """Show a running export's progress; reruns the page once it has finished."""
+    st.progress(export_job.fraction)
+    st.caption(f"{export_job.done} / {export_job.total}")
+    if export_job.status != "running":
+        st.rerun()
 
 def main():
     # Set page config
@@ -57,7 +61,20 @@ def main():
                 "patient_history": "Patient History",
                 "no_history": "No previous records found",
                 "new_analysis": "New Analysis",
-                "previous_analyses": "Previous Analyses"
+                "previous_analyses": "Previous Analyses",
+                "search": "Search reports",
+                "priority": "Priority",
+                "all": "All",
+                "page": "Page",
+                "records_found": "records found",
+                "pipeline_timings": "Pipeline timings",
+                "export": "Export reports",
+                "export_format": "Format",
+                "date_from": "From",
+                "date_to": "To",
+                "download": "Download",
+                "duplicate_found": "This image closely matches an earlier analysis:",
+                "show_previous": "Show previous result"
             },
             "hi": {
                 "title": "चिकित्सा दृष्टि नैदानिक उपकरण",
@@ -91,7 +108,20 @@ def main():
                 "patient_history": "रोगी का इतिहास",
                 "no_history": "कोई पिछला रिकॉर्ड नहीं मिला",
                 "new_analysis": "नया विश्लेषण",
-                "previous_analyses": "पिछले विश्लेषण"
+                "previous_analyses": "पिछले विश्लेषण",
+                "search": "रिपोर्ट खोजें",
+                "priority": "प्राथमिकता",
+                "all": "सभी",
+                "page": "पृष्ठ",
+                "records_found": "रिकॉर्ड मिले",
+                "pipeline_timings": "पाइपलाइन समय",
+                "export": "रिपोर्ट निर्यात करें",
+                "export_format": "प्रारूप",
+                "date_from": "से",
+                "date_to": "तक",
+                "download": "डाउनलोड करें",
+                "duplicate_found": "यह छवि पिछले विश्लेषण से काफी मिलती है:",
+                "show_previous": "पिछला परिणाम दिखाएं"
             },
             "ta": {
                 "title": "மருத்துவ பார்வை நோயறிதல் கருவி",
@@ -125,18 +155,38 @@ def main():
             "patient_history": "நோயாளியின் வரலாறு",
             "no_history": "முந்தைய பதிவுகள் கிடைக்கவில்லை",
             "new_analysis": "புதிய பகுப்பாய்வு",
-            "previous_analyses": "முந்தைய பகுப்பாய்வுகள்"
+            "previous_analyses": "முந்தைய பகுப்பாய்வுகள்",
+            "search": "அறிக்கைகளைத் தேடவும்",
+            "priority": "முன்னுரிமை",
+            "all": "அனைத்தும்",
+            "page": "பக்கம்",
+            "records_found": "பதிவுகள் கிடைத்தன",
+            "pipeline_timings": "செயலாக்க நேரங்கள்",
+            "export": "அறிக்கைகளை ஏற்றுமதி செய்",
+            "export_format": "வடிவம்",
+            "date_from": "இருந்து",
+            "date_to": "வரை",
+            "download": "பதிவிறக்கு",
+            "duplicate_found": "இந்தப் படம் முந்தைய பகுப்பாய்வுடன் மிகவும் ஒத்துள்ளது:",
+            "show_previous": "முந்தைய முடிவைக் காட்டு"
             }
         }
         return translations
 
+    # With an analysis server configured this session holds no models at all
+    client = get_client()
+    if client is None:
+        # Build and warm shared models once per process, without blocking the page
+        registry.start_background_warm_up()
+
     # Initialize session state
     if 'language' not in st.session_state:
         st.session_state.language = 'en'
     if 'patient_data' not in st.session_state:
         st.session_state.patient_data = {}
-    if 'analysis_history' not in st.session_state:
-        st.session_state.analysis_history = []
+
+    # Analyses are kept on disk, shared by every session
+    history = get_history_store()
 
     # Load translations
     translations = load_translations()
@@ -154,6 +204,12 @@ def main():
         else:
             st.session_state.language = 'ta'
         t = translations[st.session_state.language]
+        
+        # Debug panel: rolling percentiles for every pipeline stage
+        with st.expander(t["pipeline_timings"]):
+            rows = metrics.rows()
+            if rows:
+                st.table(rows)
 
     # Main content
     st.title(t["title"])
@@ -186,76 +242,226 @@ def main():
         # Image Upload
         st.header(t["upload_text"])
         st.info(t["upload_help"])
-        uploaded_file = st.file_uploader("", type=["jpg", "jpeg", "png", "bmp"], key="image_uploader")
+        uploaded_file = st.file_uploader("", type=["jpg", "jpeg", "png", "bmp", "dcm"], key="image_uploader")
         
         if uploaded_file is not None:
-            # Display uploaded image
-            image = Image.open(uploaded_file)
-            st.image(image, caption="Uploaded Image", use_column_width=True)
+            # OpenCV is only imported once there is an image to work on
+            from utils.analysis_cache import hash_image
+            from utils.image_processing import load_image, preprocess_image
+            from utils.preview_cache import get_preview_cache
+            
+            # Decode the upload once and share the buffer with every stage
+            image_bytes = uploaded_file.getvalue()
+            image = load_image(image_bytes)
+            
+            # Send the browser a display-size JPEG, not the full-resolution pixels
+            upload_hash = hash_image(image_bytes)
+            preview = get_preview_cache().get_jpeg(image, "display", image_hash=upload_hash)
+            st.image(preview, caption="Uploaded Image", use_column_width=True)
+            
+            # Preprocess once per upload rather than on every rerun; the
+            # analysis and the duplicate check both use this output
+            if st.session_state.get("upload_hash") != upload_hash:
+                st.session_state.upload_hash = upload_hash
+                st.session_state.preprocessed = preprocess_image(image)
+                st.session_state.upload_phash = None
+                if DUPLICATE_DETECTION_ENABLED:
+                    from utils.duplicate_index import phash
+                    st.session_state.upload_phash = phash(st.session_state.preprocessed)
+            preprocessed = st.session_state.preprocessed
+            upload_phash = st.session_state.upload_phash
+            
+            # Offer the earlier result when this image was analysed before
+            if upload_phash is not None:
+                from utils.duplicate_index import get_duplicate_index
+                match = get_duplicate_index().find(upload_phash)
+                previous = history.get(match[1]) if match else None
+                if previous is not None:
+                    st.warning(f"{t['duplicate_found']} {previous['created_at'][:16]} {previous['patient_name'] or ''}")
+                    if st.button(t["show_previous"], key="show_previous_button"):
+                        st.markdown(previous["report"])
+                        st.session_state.last_report = previous["report"]
             
             if st.button(t["analyze"], key="analyze_button"):
+                st.session_state.last_analysis = None
                 with st.spinner(t["loading"]):
                     try:
-                        # Save uploaded file temporarily
-                        temp_path = f"temp_{uploaded_file.name}"
-                        with open(temp_path, "wb") as f:
-                            f.write(uploaded_file.getvalue())
-                        
-                        # Initialize models
-                        classifier = ImageClassifier()
-                        genai_helper = GeminiHelper()
-                        
-                        # Process image
-                        preprocessed = preprocess_image(temp_path)
-                        cv_results = classifier.detect_anomalies(preprocessed)
-                        genai_results = genai_helper.analyze_medical_image(temp_path, cv_results, language=st.session_state.language)
-
+                        start = time.perf_counter()
+                        report_placeholder = st.empty()
+                        report = ""
                         
-                        # Generate report
-                        report = generate_report(temp_path, cv_results, genai_results)
+                        if client is not None:
+                            # The analysis server runs the job; poll it for the report
+                            job_id = client.submit(image_bytes, language=st.session_state.language, image_name=uploaded_file.name)
+                            job_stream = client.stream(job_id)
+                            for piece in job_stream:
+                                report += piece
+                                report_placeholder.markdown(report)
+                            cv_results = job_stream.result["cv_results"]
+                            genai_results = job_stream.result["genai_results"]
+                            base_results = job_stream.result.get("base_results")
+                        else:
+                            # Shared models, built once per process
+                            genai_helper = registry.get_genai_helper()
+                            
+                            # Process image
+                            cv_results = registry.get_batcher().submit(preprocessed).result()
+                            genai_stream = genai_helper.stream_medical_image_analysis(image_bytes, cv_results, language=st.session_state.language)
+                            
+                            # Render the report progressively as the AI section streams in
+                            for piece in generate_report_stream(image_bytes, cv_results, genai_stream, image_name=uploaded_file.name):
+                                report += piece
+                                report_placeholder.markdown(report)
+                            genai_results = genai_stream.result
+                            base_results = genai_stream.base_result
+                        metrics.observe("stage_seconds", "analysis", time.perf_counter() - start)
+                        metrics.flush()
                         
                         # Store analysis in history
-                        analysis_record = {
-                            "date": datetime.now().strftime("%Y-%m-%d %H:%M"),
-                            "patient_name": patient_name,
-                            "report": report,
-                            "image_path": temp_path
-                        }
-                        st.session_state.analysis_history.append(analysis_record)
+                        record_id = history.add(
+                            report,
+                            patient={
+                                "patient_name": patient_name,
+                                "age": age,
+                                "gender": gender,
+                                "village": village,
+                                "district": district,
+                                "state": state
+                            },
+                            cv_results=cv_results,
+                            # The untranslated analysis has the priority line as prompted
+                            genai_results=base_results or genai_results,
+                            image=image,
+                            image_name=uploaded_file.name,
+                            language=st.session_state.language,
+                            phash=upload_phash
+                        )
+                        if upload_phash is not None:
+                            get_duplicate_index().add(upload_phash, record_id)
                         
-                        # Display results
                         st.success(t["success"])
-                        st.markdown(report)
                         
-                        # Save report button
-                        if st.button(t["save_report"], key="save_report_button"):
-                            # Create reports directory if it doesn't exist
-                            reports_dir = Path("reports")
-                            reports_dir.mkdir(exist_ok=True)
-                            
-                            # Save report
-                            report_path = reports_dir / f"report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-                            with open(report_path, "w", encoding="utf-8") as f:
-                                f.write(report)
-                            st.success(t["report_saved"])
+                        # Kept across reruns so the save button below still has it
+                        st.session_state.last_report = report
+                        st.session_state.last_analysis = {
+                            "upload_hash": upload_hash,
+                            "cv_results": cv_results,
+                            "base_results": base_results,
+                            "language": st.session_state.language
+                        }
                         
                     except Exception as e:
                         st.error(f"{t['error']}: {str(e)}")
-                    finally:
-                        # Clean up temporary file
-                        if os.path.exists(temp_path):
-                            os.remove(temp_path)
+            
+            elif (st.session_state.get("last_analysis") or {}).get("upload_hash") == upload_hash:
+                # Keep showing the last analysis across reruns. After a language
+                # switch only its text is translated (cached per language);
+                # the image is not analysed or uploaded again
+                last = st.session_state.last_analysis
+                if last["language"] != st.session_state.language and (client is not None or last["base_results"] is not None):
+                    try:
+                        with st.spinner(t["loading"]):
+                            if client is not None:
+                                # The server holds the analysis in its cache, so
+                                # only the translation is requested from Gemini
+                                st.session_state.last_report = client.analyze(
+                                    image_bytes, language=st.session_state.language, image_name=uploaded_file.name
+                                )["report"]
+                            else:
+                                genai_results = registry.get_genai_helper().translate(
+                                    last["base_results"],
+                                    st.session_state.language,
+                                    image_hash=upload_hash,
+                                    detection_results=last["cv_results"]
+                                )
+                                st.session_state.last_report = generate_report(
+                                    image_bytes, last["cv_results"], genai_results, image_name=uploaded_file.name
+                                )
+                        last["language"] = st.session_state.language
+                    except Exception as e:
+                        st.error(f"{t['error']}: {str(e)}")
+                st.markdown(st.session_state.last_report)
+            
+            # Save report button; outside the analyze branch so its click is handled
+            if st.session_state.get("last_report") and st.button(t["save_report"], key="save_report_button"):
+                # Create reports directory if it doesn't exist
+                reports_dir = Path("reports")
+                reports_dir.mkdir(exist_ok=True)
+                
+                # Save report
+                report_path = reports_dir / f"report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+                with open(report_path, "w", encoding="utf-8") as f:
+                    f.write(st.session_state.last_report)
+                st.success(t["report_saved"])
 
     with tab2:
+        # Filters; every query below is served from indexes
+        filter_col1, filter_col2, filter_col3 = st.columns(3)
+        with filter_col1:
+            search = st.text_input(t["search"], key="history_search")
+        with filter_col2:
+            district_filter = st.selectbox(t["district"], [t["all"]] + history.districts(), key="history_district")
+        with filter_col3:
+            priority_filter = st.selectbox(t["priority"], [t["all"], "RED", "ORANGE", "GREEN"], key="history_priority")
+        
+        filters = {
+            "search": search,
+            "district": None if district_filter == t["all"] else district_filter,
+            "priority": None if priority_filter == t["all"] else priority_filter
+        }
+        total = history.count(**filters)
+        
+        # Bulk export of every matching report, written in the background
+        with st.expander(t["export"]):
+            export_col1, export_col2, export_col3 = st.columns(3)
+            with export_col1:
+                date_from = st.date_input(t["date_from"], value=date.today() - timedelta(days=30), key="export_from")
+            with export_col2:
+                date_to = st.date_input(t["date_to"], value=date.today(), key="export_to")
+            with export_col3:
+                export_format = st.selectbox(t["export_format"], ["ZIP", "HTML"], key="export_format")
+            
+            if st.button(t["export"], key="export_button"):
+                from utils.report_export import ExportJob
+                
+                export_path = Path("reports") / "exports" / f"reports_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format.lower()}"
+                st.session_state.export_job = ExportJob(
+                    str(export_path), store=history, date_from=date_from, date_to=date_to, **filters
+                ).start()
+            
+            export_job = st.session_state.get("export_job")
+            if export_job is not None and export_job.status == "running":
+                # Only this fragment reruns while the export thread works, so
+                # the script thread is free and the page stays usable
+                st.fragment(run_every=0.5)(show_export_progress)(export_job)
+            elif export_job is not None:
+                st.progress(export_job.fraction)
+                st.caption(f"{export_job.done} / {export_job.total}")
+                
+                if export_job.status == "done":
+                    st.success(f"{t['report_saved']} {export_job.path}")
+                    with open(export_job.path, "rb") as f:
+                        st.download_button(t["download"], f, file_name=Path(export_job.path).name, key="export_download")
+                elif export_job.status == "failed":
+                    st.error(f"{t['error']}: {export_job.error}")
+        
         # Display analysis history
-        if not st.session_state.analysis_history:
+        if total == 0:
             st.info(t["no_history"])
         else:
-            for record in reversed(st.session_state.analysis_history):
-                with st.expander(f"{record['date']} - {record['patient_name']}"):
+            pages = (total + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE
+            page = st.number_input(t["page"], min_value=1, max_value=pages, value=1, key="history_page")
+            st.caption(f"{total} {t['records_found']}")
+            
+            for record in history.query(page=page, page_size=HISTORY_PAGE_SIZE, with_reports=True, **filters):
+                label = f"{record['created_at'][:16]} - {record['patient_name'] or ''}"
+                if record["priority"]:
+                    label += f" - {record['priority']}"
+                with st.expander(label):
                     st.markdown(record["report"])
-                    if os.path.exists(record["image_path"]):
-                        st.image(record["image_path"], caption="Analyzed Image", use_column_width=True)
+                    thumbnail = history.get_thumbnail(record["id"])
+                    if thumbnail:
+                        st.image(thumbnail, caption="Analyzed Image")
 
     # Footer
     st.markdown("---")
@@ -0,0 +1,507 @@
+"""
+DICOM reading with header-only parsing and memory-mapped pixel data.
+
+Usage:
+    python -m utils.dicom list STUDY_DIR
+    python -m utils.dicom classify FILE_OR_SERIES_DIR [--batch-size 16]
+
+Uncompressed files (implicit/explicit VR little endian, explicit big
+endian) are parsed natively: only the elements up to the pixel data are
+read, and pixels are memory-mapped so a frame is only loaded when it is
+used. Stored values go through the rescale and window/level as one lookup
+table (8/16-bit) or one vectorised affine (32-bit) to the 8-bit BGR input
+preprocess_image expects. Compressed transfer syntaxes need pydicom with a
+pixel data handler, and are decoded in full.
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from config import BATCH_MAX_SIZE
+
+DICOM_EXTENSIONS = (".dcm", ".dicom")
+
+IMPLICIT_VR_LE = "1.2.840.10008.1.2"
+EXPLICIT_VR_LE = "1.2.840.10008.1.2.1"
+EXPLICIT_VR_BE = "1.2.840.10008.1.2.2"
+_NATIVE_SYNTAXES = (IMPLICIT_VR_LE, EXPLICIT_VR_LE, EXPLICIT_VR_BE)
+
+_PIXEL_DATA = 0x7FE00010
+_ITEM_DELIMITER = 0xFFFEE00D
+_SEQUENCE_DELIMITER = 0xFFFEE0DD
+_UNDEFINED_LENGTH = 0xFFFFFFFF
+
+# Explicit VRs with a 4-byte length after two reserved bytes
+_LONG_VRS = {b"OB", b"OD", b"OF", b"OL", b"OV", b"OW", b"SQ", b"SV", b"UC", b"UN", b"UR", b"UT", b"UV"}
+
+_TAGS = {
+    0x00020010: "TransferSyntaxUID",
+    0x00080018: "SOPInstanceUID",
+    0x00080060: "Modality",
+    0x0008103E: "SeriesDescription",
+    0x00100010: "PatientName",
+    0x00100020: "PatientID",
+    0x0020000D: "StudyInstanceUID",
+    0x0020000E: "SeriesInstanceUID",
+    0x00200013: "InstanceNumber",
+    0x00280002: "SamplesPerPixel",
+    0x00280004: "PhotometricInterpretation",
+    0x00280006: "PlanarConfiguration",
+    0x00280008: "NumberOfFrames",
+    0x00280010: "Rows",
+    0x00280011: "Columns",
+    0x00280100: "BitsAllocated",
+    0x00280101: "BitsStored",
+    0x00280103: "PixelRepresentation",
+    0x00281050: "WindowCenter",
+    0x00281051: "WindowWidth",
+    0x00281052: "RescaleIntercept",
+    0x00281053: "RescaleSlope",
+}
+_US_TAGS = {0x00280002, 0x00280006, 0x00280010, 0x00280011, 0x00280100, 0x00280101, 0x00280103}
+_NUMBER_TAGS = {0x00200013, 0x00280008, 0x00281050, 0x00281051, 0x00281052, 0x00281053}
+
+# Pixels sampled per axis when no window is stored in the header
+_RANGE_SAMPLES = 256
+
+
+def is_dicom(source):
+    """Return True for a DICOM path (by extension) or DICOM bytes (by magic)."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source[128:132]) == b"DICM"
+    return isinstance(source, str) and source.lower().endswith(DICOM_EXTENSIONS)
+
+
+def _read_element(buf, pos, explicit, endian):
+    group, element = struct.unpack_from(endian + "HH", buf, pos)
+    tag = group << 16 | element
+    if group == 0xFFFE:
+        # Item and delimiter tags never carry a VR
+        return tag, None, pos + 8, struct.unpack_from(endian + "I", buf, pos + 4)[0]
+    if not explicit:
+        return tag, None, pos + 8, struct.unpack_from(endian + "I", buf, pos + 4)[0]
+    vr = bytes(buf[pos + 4:pos + 6])
+    if vr in _LONG_VRS:
+        return tag, vr, pos + 12, struct.unpack_from(endian + "I", buf, pos + 8)[0]
+    return tag, vr, pos + 8, struct.unpack_from(endian + "H", buf, pos + 6)[0]
+
+
+def _skip_undefined(buf, pos, explicit, endian):
+    # Walk a sequence or item of undefined length to just past its delimiter
+    while True:
+        tag, _, value_pos, length = _read_element(buf, pos, explicit, endian)
+        if tag in (_ITEM_DELIMITER, _SEQUENCE_DELIMITER):
+            return value_pos
+        if length == _UNDEFINED_LENGTH:
+            pos = _skip_undefined(buf, value_pos, explicit, endian)
+        else:
+            pos = value_pos + length
+
+
+def _parse_value(tag, raw, endian):
+    if tag in _US_TAGS:
+        return struct.unpack_from(endian + "H", raw)[0]
+    text = bytes(raw).decode("latin-1").strip("\x00 ")
+    if tag in _NUMBER_TAGS:
+        # Multi-valued numbers are backslash separated; the first one applies
+        first = text.split("\\")[0].strip()
+        return float(first) if first else None
+    return text
+
+
+def _parse_header(buf):
+    """
+    Parse the elements before the pixel data.
+
+    Returns:
+        tuple: (values by keyword, pixel data offset or None, pixel data length)
+    """
+    values = {}
+    pos = 0
+    if len(buf) >= 132 and bytes(buf[128:132]) == b"DICM":
+        # File meta information is always explicit VR little endian
+        pos = 132
+        while pos + 8 <= len(buf) and struct.unpack_from("<H", buf, pos)[0] == 0x0002:
+            tag, _, value_pos, length = _read_element(buf, pos, True, "<")
+            if tag in _TAGS:
+                values[_TAGS[tag]] = _parse_value(tag, buf[value_pos:value_pos + length], "<")
+            pos = value_pos + length
+    else:
+        # Bare datasets without a preamble are implicit VR little endian
+        if len(buf) < 8 or struct.unpack_from("<H", buf, 0)[0] not in (0x0002, 0x0008):
+            raise ValueError("Not a DICOM file")
+        values["TransferSyntaxUID"] = IMPLICIT_VR_LE
+
+    syntax = values.get("TransferSyntaxUID", IMPLICIT_VR_LE)
+    explicit = syntax != IMPLICIT_VR_LE
+    endian = ">" if syntax == EXPLICIT_VR_BE else "<"
+    if syntax not in _NATIVE_SYNTAXES and syntax.endswith(".99"):
+        # Deflated datasets cannot be walked without inflating them
+        return values, None, 0
+
+    while pos + 8 <= len(buf):
+        tag, _, value_pos, length = _read_element(buf, pos, explicit, endian)
+        if tag == _PIXEL_DATA:
+            return values, value_pos, length
+        if tag in _TAGS and length != _UNDEFINED_LENGTH:
+            values[_TAGS[tag]] = _parse_value(tag, buf[value_pos:value_pos + length], endian)
+        if length == _UNDEFINED_LENGTH:
+            pos = _skip_undefined(buf, value_pos, explicit, endian)
+        else:
+            pos = value_pos + length
+    return values, None, 0
+
+
+def window_lut(dtype, center, width, slope=1.0, intercept=0.0, invert=False):
+    """
+    Build a lookup table mapping every stored value of an 8/16-bit dtype to 0-255.
+
+    Index with stored values (signed types offset so the minimum is 0, as
+    done by apply_window).
+    """
+    info = np.iinfo(dtype)
+    stored = np.arange(info.min, info.max + 1, dtype=np.float32)
+    low = center - width / 2.0
+    table = (stored * slope + intercept - low) * (255.0 / max(width, 1e-6))
+    np.clip(table, 0, 255, out=table)
+    if invert:
+        table = 255 - table
+    return table.astype(np.uint8)
+
+
+def apply_window(pixels, center, width, slope=1.0, intercept=0.0, invert=False, lut=None):
+    """
+    Rescale stored values and apply a window/level, returning uint8.
+
+    Args:
+        pixels: Integer array of stored values, any shape
+        center, width: Window in rescaled (e.g. Hounsfield) units
+        slope, intercept: Rescale from stored to real-world values
+        invert: True for MONOCHROME1 data, where low values are bright
+        lut: Optional window_lut for the same parameters, reused across frames
+
+    Returns:
+        numpy.ndarray: uint8 array of the same shape
+    """
+    pixels = np.asarray(pixels)
+    if pixels.dtype.itemsize <= 2 and pixels.dtype.kind in "iu":
+        if lut is None:
+            lut = window_lut(pixels.dtype, center, width, slope, intercept, invert)
+        if pixels.dtype.kind == "i":
+            # Flipping the sign bit maps min..max onto 0..2^n - 1 in order
+            unsigned = np.dtype(pixels.dtype.str.replace("i", "u"))
+            pixels = pixels.view(unsigned) ^ unsigned.type(1 << (8 * unsigned.itemsize - 1))
+        return lut[pixels]
+
+    scale = slope * 255.0 / max(width, 1e-6)
+    values = pixels.astype(np.float32) * scale
+    values += (intercept - (center - width / 2.0)) * 255.0 / max(width, 1e-6)
+    np.clip(values, 0, 255, out=values)
+    if invert:
+        np.subtract(255, values, out=values)
+    return values.astype(np.uint8)
+
+
+class DicomFile:
+    """
+    One DICOM file: header values, plus lazy access to its frames.
+
+    Opening a file reads only the elements before the pixel data. Pixel
+    data is memory-mapped (or viewed in place for bytes) when first used.
+
+    Attributes:
+        values: Header values by DICOM keyword, for the tags in _TAGS
+        rows, columns, frames, samples: Pixel data geometry
+        compressed: True when the pixel data needs pydicom to decode
+    """
+
+    def __init__(self, source):
+        """
+        Args:
+            source: File path or the file contents as bytes
+        """
+        self.path = source if isinstance(source, str) else None
+        self._data = None if self.path else source
+        if self.path:
+            with open(self.path, "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    raise ValueError("Not a DICOM file")
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                    try:
+                        self.values, self._pixel_offset, self._pixel_length = _parse_header(buf)
+                    except struct.error:
+                        raise ValueError("Not a DICOM file")
+        else:
+            try:
+                self.values, self._pixel_offset, self._pixel_length = _parse_header(memoryview(source))
+            except struct.error:
+                raise ValueError("Not a DICOM file")
+
+        values = self.values
+        self.transfer_syntax = values.get("TransferSyntaxUID", IMPLICIT_VR_LE)
+        self.rows = values.get("Rows")
+        self.columns = values.get("Columns")
+        self.frames = int(values.get("NumberOfFrames") or 1)
+        self.samples = values.get("SamplesPerPixel", 1)
+        self.photometric = values.get("PhotometricInterpretation", "MONOCHROME2")
+        self.slope = values.get("RescaleSlope") or 1.0
+        self.intercept = values.get("RescaleIntercept") or 0.0
+        self.compressed = (self.transfer_syntax not in _NATIVE_SYNTAXES
+                           or self._pixel_length == _UNDEFINED_LENGTH)
+        if self.rows is None or self.columns is None:
+            raise ValueError("DICOM file has no image")
+
+        self._pixels = None
+        self._window = None
+        self._lut = None
+
+    @property
+    def series_uid(self):
+        return self.values.get("SeriesInstanceUID", "")
+
+    @property
+    def instance_number(self):
+        return self.values.get("InstanceNumber") or 0
+
+    def _dtype(self):
+        bits = self.values.get("BitsAllocated", 8)
+        if bits not in (8, 16, 32):
+            raise ValueError(f"Unsupported BitsAllocated: {bits}")
+        kind = "i" if self.values.get("PixelRepresentation") == 1 else "u"
+        endian = ">" if self.transfer_syntax == EXPLICIT_VR_BE else "<"
+        return np.dtype(f"{endian}{kind}{bits // 8}")
+
+    @property
+    def pixels(self):
+        """
+        Stored pixel values, shaped (frames, rows, columns[, samples]).
+
+        Memory-mapped for native transfer syntaxes; decoded in full through
+        pydicom for compressed ones.
+        """
+        if self._pixels is None:
+            self._pixels = self._load_pixels()
+        return self._pixels
+
+    def _load_pixels(self):
+        if self.compressed or self._pixel_offset is None:
+            return self._decode_with_pydicom()
+
+        dtype = self._dtype()
+        planar = self.samples > 1 and self.values.get("PlanarConfiguration") == 1
+        shape = (self.frames, self.samples, self.rows, self.columns) if planar \
+            else (self.frames, self.rows, self.columns, self.samples)
+        count = int(np.prod(shape))
+        if self.path:
+            pixels = np.memmap(self.path, dtype=dtype, mode="r", offset=self._pixel_offset, shape=(count,))
+        else:
+            pixels = np.frombuffer(self._data, dtype=dtype, count=count, offset=self._pixel_offset)
+        pixels = pixels.reshape(shape)
+        if planar:
+            pixels = pixels.transpose(0, 2, 3, 1)
+        return pixels[..., 0] if self.samples == 1 else pixels
+
+    def _decode_with_pydicom(self):
+        try:
+            import pydicom
+        except ImportError:
+            raise ValueError(f"Decoding DICOM transfer syntax {self.transfer_syntax} needs pydicom installed")
+        import io
+
+        dataset = pydicom.dcmread(self.path or io.BytesIO(bytes(self._data)))
+        pixels = dataset.pixel_array
+        if "YBR" in self.photometric:
+            from pydicom.pixel_data_handlers.util import convert_color_space
+            pixels = convert_color_space(pixels, self.photometric, "RGB")
+            self.photometric = "RGB"
+        if self.frames == 1:
+            pixels = pixels[np.newaxis]
+        return pixels
+
+    def window(self):
+        """
+        Return the (center, width) used for display.
+
+        The first window stored in the header, otherwise the range of a
+        strided sample of the rescaled pixel values.
+        """
+        if self._window is None:
+            center, width = self.values.get("WindowCenter"), self.values.get("WindowWidth")
+            if center is None or not width:
+                pixels = self.pixels
+                step_y = max(1, self.rows // _RANGE_SAMPLES)
+                step_x = max(1, self.columns // _RANGE_SAMPLES)
+                step_f = max(1, self.frames // 8)
+                sample = np.asarray(pixels[::step_f, ::step_y, ::step_x])
+                low = float(sample.min()) * self.slope + self.intercept
+                high = float(sample.max()) * self.slope + self.intercept
+                center, width = (low + high) / 2.0, max(high - low, 1.0)
+            self._window = (center, width)
+        return self._window
+
+    def frame(self, index=0, window=None):
+        """
+        Return one frame as the 8-bit BGR image preprocess_image expects.
+
+        Args:
+            index: Frame number
+            window: Optional (center, width) overriding the header window
+
+        Returns:
+            numpy.ndarray: uint8 BGR array
+        """
+        pixels = self.pixels[index]
+        if pixels.dtype == np.uint8 and self.samples > 1:
+            image = np.ascontiguousarray(pixels)
+        else:
+            center, width = window or self.window()
+            invert = self.photometric == "MONOCHROME1"
+            lut = None
+            if pixels.dtype.itemsize <= 2:
+                # One table serves every frame of the file
+                if window is not None:
+                    lut = window_lut(pixels.dtype, center, width, self.slope, self.intercept, invert)
+                else:
+                    if self._lut is None:
+                        self._lut = window_lut(pixels.dtype, center, width, self.slope, self.intercept, invert)
+                    lut = self._lut
+            image = apply_window(pixels, center, width, self.slope, self.intercept, invert, lut=lut)
+
+        if self.samples == 1:
+            return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        if self.photometric.startswith("YBR"):
+            # OpenCV orders the chroma planes Cr, Cb
+            return cv2.cvtColor(image[..., [0, 2, 1]], cv2.COLOR_YCrCb2BGR)
+        return cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+
+    def representative_frame(self):
+        """Return the middle frame, used where a single image is needed."""
+        return self.frame(self.frames // 2)
+
+    def iter_frames(self, window=None):
+        """Yield (index, 8-bit BGR frame) one frame at a time."""
+        for index in range(self.frames):
+            yield index, self.frame(index, window)
+
+
+def read_dicom(source):
+    """Decode a DICOM path or bytes to one 8-bit BGR image (the middle frame)."""
+    return DicomFile(source).representative_frame()
+
+
+def scan_directory(directory):
+    """
+    Read the headers of every DICOM file under a directory.
+
+    Only the header of each file is parsed, so large studies list quickly.
+    Files that are not DICOM are skipped whatever their extension.
+
+    Returns:
+        list: DicomFile objects
+    """
+    files = []
+    for root, _, names in os.walk(directory):
+        for name in sorted(names):
+            try:
+                files.append(DicomFile(os.path.join(root, name)))
+            except (ValueError, OSError):
+                continue
+    return files
+
+
+def group_series(files):
+    """
+    Group DicomFiles by series, ordered by instance number.
+
+    Returns:
+        dict: SeriesInstanceUID to list of DicomFile
+    """
+    series = {}
+    for dicom_file in files:
+        series.setdefault(dicom_file.series_uid, []).append(dicom_file)
+    for members in series.values():
+        members.sort(key=lambda f: f.instance_number)
+    return series
+
+
+def iter_series_frames(files):
+    """Yield ((path, frame index), 8-bit BGR frame) across files in order."""
+    for dicom_file in files:
+        for index, frame in dicom_file.iter_frames():
+            yield (dicom_file.path, index), frame
+
+
+def classify_frames(frames, classifier=None, batch_size=BATCH_MAX_SIZE):
+    """
+    Stream frames through preprocessing and the classifier in batches.
+
+    Only one batch of frames is held at a time, however long the series.
+
+    Args:
+        frames: Iterable of (key, 8-bit BGR frame), e.g. iter_series_frames
+        classifier: ImageClassifier, defaults to the shared one
+        batch_size: Frames per forward pass
+
+    Yields:
+        tuple: (key, detection result dict)
+    """
+    from utils.image_processing import preprocess_image
+
+    if classifier is None:
+        from models import registry
+        classifier = registry.get_classifier()
+
+    pending = []
+    for key, frame in frames:
+        pending.append((key, preprocess_image(frame)))
+        if len(pending) == batch_size:
+            yield from zip([k for k, _ in pending], classifier.detect_anomalies_batch([p for _, p in pending]))
+            pending = []
+    if pending:
+        yield from zip([k for k, _ in pending], classifier.detect_anomalies_batch([p for _, p in pending]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="List DICOM studies or classify their frames.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = subparsers.add_parser("list", help="List the series in a study folder from headers only")
+    list_parser.add_argument("directory")
+
+    classify_parser = subparsers.add_parser("classify", help="Classify every frame of a file or series folder")
+    classify_parser.add_argument("source")
+    classify_parser.add_argument("--batch-size", type=int, default=BATCH_MAX_SIZE)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        start = time.perf_counter()
+        files = scan_directory(args.directory)
+        elapsed = time.perf_counter() - start
+        for uid, members in group_series(files).items():
+            first = members[0]
+            print(f"{uid or '(no series uid)'}  {first.values.get('Modality', '?'):<4} "
+                  f"{len(members):>5} files {sum(f.frames for f in members):>6} frames  "
+                  f"{first.columns}x{first.rows}  {first.values.get('SeriesDescription', '')}")
+        print(f"Read {len(files)} headers in {elapsed:.2f} s", file=sys.stderr)
+        return
+
+    if os.path.isdir(args.source):
+        files = [f for members in group_series(scan_directory(args.source)).values() for f in members]
+    else:
+        files = [DicomFile(args.source)]
+    for (path, index), result in classify_frames(iter_series_frames(files), batch_size=args.batch_size):
+        result = {key: value for key, value in result.items() if key != "heatmap"}
+        print(json.dumps({"path": path, "frame": index, **result}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import threading
+
+import cv2
+import numpy as np
+
+from config import DUPLICATE_MAX_DISTANCE
+
+def phash(image, hash_size=8, highfreq_factor=4):
+    """
+    Compute the 64-bit perceptual hash of an image.
+
+    The image is reduced to a small grayscale square, transformed with a
+    DCT, and the lowest frequencies are compared with their median. Copies
+    that were rescaled, recompressed or re-photographed straight on hash
+    to values a few bits apart.
+
+    Args:
+        image: BGR or grayscale numpy array, normally preprocess_image output
+
+    Returns:
+        int: Unsigned 64-bit hash
+    """
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    size = hash_size * highfreq_factor
+    small = cv2.resize(gray, (size, size), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:hash_size, :hash_size].ravel()
+    # The DC term only reflects overall brightness
+    bits = low > np.median(low[1:])
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class MultiIndexHash:
+    """
+    Multi-index hashing for Hamming-radius search over 64-bit hashes.
+
+    Each hash is split into radius + 1 disjoint bit ranges, and every range
+    has its own exact-match table. Two hashes within the radius must agree
+    exactly on at least one range (pigeonhole), so a search only compares
+    against the few entries that share a bucket with the query, instead of
+    scanning or walking a tree that degrades to a scan at larger radii.
+    """
+
+    def __init__(self, radius, bits=64):
+        self.radius = radius
+        chunks = radius + 1
+        self._ranges = []
+        shift = 0
+        for i in range(chunks):
+            width = bits // chunks + (1 if i < bits % chunks else 0)
+            self._ranges.append((shift, (1 << width) - 1))
+            shift += width
+        self._tables = [{} for _ in self._ranges]
+        self._entries = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, key, value):
+        position = len(self._entries)
+        self._entries.append((key, value))
+        for table, (shift, mask) in zip(self._tables, self._ranges):
+            table.setdefault((key >> shift) & mask, []).append(position)
+
+    def search(self, key, radius=None):
+        """
+        Return every value within radius of key.
+
+        Args:
+            key: Query hash
+            radius: At most the radius the index was built for
+
+        Returns:
+            list: (distance, value) pairs, closest first
+        """
+        if radius is None or radius > self.radius:
+            radius = self.radius
+        seen = set()
+        matches = []
+        for table, (shift, mask) in zip(self._tables, self._ranges):
+            for position in table.get((key >> shift) & mask, ()):
+                if position in seen:
+                    continue
+                seen.add(position)
+                candidate, value = self._entries[position]
+                distance = hamming(key, candidate)
+                if distance <= radius:
+                    matches.append((distance, value))
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+
+class DuplicateIndex:
+    """
+    Near-duplicate lookup for analysed images by perceptual hash.
+
+    Values are whatever identifies the earlier result: a history record id
+    in the web app, the result itself in the desktop app.
+    """
+
+    def __init__(self, max_distance=DUPLICATE_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self._hashes = MultiIndexHash(max_distance)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def add(self, image_hash, value):
+        with self._lock:
+            self._hashes.add(image_hash, value)
+
+    def find(self, image_hash, max_distance=None):
+        """
+        Return the closest earlier image within max_distance bits.
+
+        max_distance cannot exceed the one the index was created with.
+
+        Returns:
+            tuple: (distance, value), or None when nothing is close enough
+        """
+        if max_distance is None:
+            max_distance = self.max_distance
+        with self._lock:
+            matches = self._hashes.search(image_hash, max_distance)
+        return matches[0] if matches else None
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_duplicate_index():
+    """Return the process-wide index, built from the analysis history on first use."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                from utils.history_store import get_history_store
+
+                index = DuplicateIndex()
+                for record_id, image_hash in get_history_store().iter_phashes():
+                    index.add(image_hash, record_id)
+                _index = index
+    return _index
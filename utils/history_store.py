@@ -0,0 +1,335 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+from config import HISTORY_DB_PATH, THUMBNAIL_SIZE
+
+# The priority line the prompt asks for ("1. Hospital Priority: RED - ..."),
+# allowing Markdown emphasis; translations keep the "1." item and the
+# priority word but not the label
+_PRIORITY_PATTERN = re.compile(
+    r"^[\s#>*_]*(?:1[.)][^:\n]*|[*_]*(?i:hospital\s+)?(?i:priority)[^:\n]*)(?::|\s[-\u2013])[\s*_]*(RED|ORANGE|GREEN)\b",
+    re.MULTILINE
+)
+
+_SUMMARY_COLUMNS = "id, created_at, patient_name, age, gender, village, district, state, priority, language, image_name"
+
+
+def extract_priority(analysis):
+    """Return the RED/ORANGE/GREEN priority given on an analysis's priority line, if any."""
+    match = _PRIORITY_PATTERN.search(analysis or "")
+    return match.group(1) if match else None
+
+
+def _to_signed(value):
+    # Perceptual hashes are unsigned 64-bit; SQLite integers are signed
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _to_unsigned(value):
+    return value & ((1 << 64) - 1)
+
+
+def make_thumbnail(image, max_size=THUMBNAIL_SIZE):
+    """
+    Encode a small JPEG thumbnail of a BGR image.
+
+    Returns:
+        bytes: JPEG data whose longest side is at most max_size
+    """
+    # Imported here so opening the history does not load OpenCV
+    import cv2
+
+    height, width = image.shape[:2]
+    scale = min(1.0, max_size / max(height, width))
+    if scale < 1.0:
+        image = cv2.resize(image, (max(1, int(width * scale)), max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+    ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 80])
+    if not ok:
+        raise ValueError("Could not encode thumbnail")
+    return buffer.tobytes()
+
+
+class HistoryStore:
+    """
+    SQLite-backed analysis history with indexed filters and full-text search.
+
+    List queries return summary columns only; reports and thumbnails are
+    loaded per record so a history page stays cheap with many records.
+    """
+
+    def __init__(self, path=HISTORY_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._create_schema()
+
+    def _create_schema(self):
+        conn = self._conn
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS analyses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at TEXT NOT NULL,
+                patient_name TEXT,
+                age INTEGER,
+                gender TEXT,
+                village TEXT,
+                district TEXT,
+                state TEXT,
+                priority TEXT,
+                language TEXT,
+                image_name TEXT,
+                report TEXT NOT NULL,
+                cv_results TEXT,
+                thumbnail BLOB,
+                phash INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS idx_analyses_patient ON analyses (patient_name COLLATE NOCASE);
+            CREATE INDEX IF NOT EXISTS idx_analyses_district ON analyses (district COLLATE NOCASE, created_at);
+            CREATE INDEX IF NOT EXISTS idx_analyses_created ON analyses (created_at);
+            CREATE INDEX IF NOT EXISTS idx_analyses_priority ON analyses (priority, created_at);
+            """
+        )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(analyses)")}
+        if "phash" not in columns:
+            # Databases created before perceptual hashes were stored
+            conn.execute("ALTER TABLE analyses ADD COLUMN phash INTEGER")
+        try:
+            conn.executescript(
+                """
+                CREATE VIRTUAL TABLE IF NOT EXISTS analyses_fts USING fts5(
+                    report, patient_name, content='analyses', content_rowid='id'
+                );
+                CREATE TRIGGER IF NOT EXISTS analyses_ai AFTER INSERT ON analyses BEGIN
+                    INSERT INTO analyses_fts (rowid, report, patient_name)
+                    VALUES (new.id, new.report, new.patient_name);
+                END;
+                CREATE TRIGGER IF NOT EXISTS analyses_ad AFTER DELETE ON analyses BEGIN
+                    INSERT INTO analyses_fts (analyses_fts, rowid, report, patient_name)
+                    VALUES ('delete', old.id, old.report, old.patient_name);
+                END;
+                """
+            )
+            self.has_fts = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5; search falls back to LIKE
+            self.has_fts = False
+        conn.commit()
+
+    def add(self, report, patient=None, cv_results=None, genai_results=None, image=None,
+            image_name=None, language=None, created_at=None, phash=None):
+        """
+        Store one analysis.
+
+        Args:
+            report: Full report text
+            patient: Dict of patient fields (patient_name, age, gender,
+                village, district, state)
+            cv_results: Computer vision results, stored as JSON
+            genai_results: Gemini results, used to extract the priority
+            image: Optional BGR image to keep a thumbnail of
+            image_name: Original file name
+            language: Report language code
+            created_at: datetime, defaults to now
+            phash: Perceptual hash of the preprocessed image, for finding
+                near-duplicate uploads later
+
+        Returns:
+            int: The new record id
+        """
+        patient = patient or {}
+        created_at = (created_at or datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
+        priority = extract_priority((genai_results or {}).get("analysis"))
+        thumbnail = make_thumbnail(image) if image is not None else None
+        if cv_results is not None:
+            # The full heatmap is not needed to browse history
+            cv_results = {k: v for k, v in cv_results.items() if k != "heatmap"}
+
+        with self._lock:
+            cursor = self._conn.execute(
+                """
+                INSERT INTO analyses (created_at, patient_name, age, gender, village, district, state,
+                                      priority, language, image_name, report, cv_results, thumbnail, phash)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    created_at,
+                    patient.get("patient_name"),
+                    patient.get("age"),
+                    patient.get("gender"),
+                    patient.get("village"),
+                    patient.get("district"),
+                    patient.get("state"),
+                    priority,
+                    language,
+                    image_name,
+                    report,
+                    json.dumps(cv_results) if cv_results is not None else None,
+                    thumbnail,
+                    _to_signed(phash) if phash is not None else None,
+                ),
+            )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def _where(self, patient_name=None, district=None, priority=None, date_from=None, date_to=None, search=None):
+        clauses, params = [], []
+        if patient_name:
+            clauses.append("patient_name = ? COLLATE NOCASE")
+            params.append(patient_name)
+        if district:
+            clauses.append("district = ? COLLATE NOCASE")
+            params.append(district)
+        if priority:
+            clauses.append("priority = ?")
+            params.append(priority)
+        if date_from:
+            clauses.append("created_at >= ?")
+            params.append(str(date_from))
+        if date_to:
+            # Dates are inclusive; compare against the start of the next day
+            clauses.append("created_at < date(?, '+1 day')")
+            params.append(str(date_to))
+        if search and search.strip():
+            if self.has_fts:
+                clauses.append("id IN (SELECT rowid FROM analyses_fts WHERE analyses_fts MATCH ?)")
+                params.append(_fts_query(search))
+            else:
+                clauses.append("(report LIKE ? OR patient_name LIKE ?)")
+                params += [f"%{search}%", f"%{search}%"]
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, page=1, page_size=20, with_reports=False, **filters):
+        """
+        Return one page of records, newest first.
+
+        Args:
+            page: 1-based page number
+            page_size: Records per page
+            with_reports: Also return the report text of each record
+            **filters: patient_name, district, priority, date_from,
+                date_to (YYYY-MM-DD) and search (full-text)
+
+        Returns:
+            list: Record dicts
+        """
+        where, params = self._where(**filters)
+        columns = _SUMMARY_COLUMNS + (", report" if with_reports else "")
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {columns} FROM analyses{where} ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
+                params + [page_size, (max(1, page) - 1) * page_size],
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def iter_records(self, with_reports=True, chunk_size=200, **filters):
+        """
+        Yield every matching record, newest first, a chunk at a time.
+
+        Uses keyset pagination so memory stays flat however many records match.
+        """
+        where, params = self._where(**filters)
+        columns = _SUMMARY_COLUMNS + (", report" if with_reports else "")
+        last = None
+        while True:
+            clause, extra = where, []
+            if last is not None:
+                clause += (" AND " if where else " WHERE ") + "(created_at, id) < (?, ?)"
+                extra = list(last)
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT {columns} FROM analyses{clause} ORDER BY created_at DESC, id DESC LIMIT ?",
+                    params + extra + [chunk_size],
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield dict(row)
+            last = (rows[-1]["created_at"], rows[-1]["id"])
+
+    def count(self, **filters):
+        """Return the number of records matching the filters."""
+        where, params = self._where(**filters)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM analyses{where}", params).fetchone()[0]
+
+    def get(self, record_id):
+        """Return one full record including its report and CV results."""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {_SUMMARY_COLUMNS}, report, cv_results FROM analyses WHERE id = ?", (record_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        record = dict(row)
+        record["cv_results"] = json.loads(record["cv_results"]) if record["cv_results"] else None
+        return record
+
+    def get_thumbnail(self, record_id):
+        """Return the JPEG thumbnail of a record, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT thumbnail FROM analyses WHERE id = ?", (record_id,)).fetchone()
+        return row[0] if row else None
+
+    def iter_phashes(self, chunk_size=5000):
+        """Yield (record id, perceptual hash) for every record that has one."""
+        last = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, phash FROM analyses WHERE phash IS NOT NULL AND id > ? ORDER BY id LIMIT ?",
+                    (last, chunk_size),
+                ).fetchall()
+            if not rows:
+                return
+            for record_id, value in rows:
+                yield record_id, _to_unsigned(value)
+            last = rows[-1][0]
+
+    def districts(self):
+        """Return the distinct districts on record, for filter menus."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT district FROM analyses WHERE district IS NOT NULL AND district != '' "
+                "ORDER BY district COLLATE NOCASE"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def delete(self, record_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM analyses WHERE id = ?", (record_id,))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _fts_query(search):
+    # Quote each term so user input is never parsed as FTS syntax
+    terms = [term.replace('"', '""') for term in search.split()]
+    return " ".join(f'"{term}"' for term in terms)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_history_store():
+    """Return the process-wide HistoryStore."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = HistoryStore()
+    return _store
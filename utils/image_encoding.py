@@ -0,0 +1,159 @@
+import io
+import threading
+from collections import OrderedDict
+
+import cv2
+from PIL import Image
+
+from config import (
+    GEMINI_UPLOAD_MAX_BYTES,
+    GEMINI_UPLOAD_MAX_DIMENSION,
+    GEMINI_UPLOAD_FORMAT,
+    PAYLOAD_CACHE_SIZE,
+)
+from utils.analysis_cache import hash_image
+from utils.image_processing import load_image
+
+_FORMATS = {
+    "jpeg": (".jpg", "image/jpeg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", "image/webp", cv2.IMWRITE_WEBP_QUALITY),
+}
+
+_PASSTHROUGH_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG", "image/png"),
+    (b"RIFF", "image/webp"),
+)
+
+
+def _sniff_mime_type(data):
+    header = bytes(data[:12])
+    for signature, mime_type in _PASSTHROUGH_SIGNATURES:
+        if header.startswith(signature):
+            if mime_type == "image/webp" and header[8:12] != b"WEBP":
+                continue
+            return mime_type
+    return None
+
+
+def _header_size(data):
+    # PIL reads only the header until pixels are accessed
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            return image.size
+    except Exception:
+        return None
+
+
+class PayloadEncoder:
+    """
+    Encode images for upload under a target payload size.
+
+    Images are downscaled to max_dimension and encoded at the highest
+    quality that fits max_bytes, shrinking further only if the lowest
+    quality is still too large. Already-compact uploads are sent unchanged.
+    Results are memoized per image content so retries and other languages
+    reuse the same payload.
+    """
+
+    def __init__(self, max_bytes=GEMINI_UPLOAD_MAX_BYTES, max_dimension=GEMINI_UPLOAD_MAX_DIMENSION,
+                 image_format=GEMINI_UPLOAD_FORMAT, min_quality=40, max_quality=90,
+                 cache_size=PAYLOAD_CACHE_SIZE):
+        if image_format not in _FORMATS:
+            raise ValueError(f"Unsupported upload format: {image_format}")
+        self.max_bytes = max_bytes
+        self.max_dimension = max_dimension
+        self.image_format = image_format
+        self.min_quality = min_quality
+        self.max_quality = max_quality
+        self.cache_size = cache_size
+
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def encode(self, image, image_hash=None):
+        """
+        Return an upload payload for an image.
+
+        Args:
+            image: File path, encoded image bytes, or BGR numpy array
+            image_hash: Optional precomputed hash_image(image)
+
+        Returns:
+            tuple: (mime_type, bytes)
+        """
+        if image_hash is None:
+            image_hash = hash_image(image)
+
+        with self._lock:
+            payload = self._cache.get(image_hash)
+            if payload is not None:
+                self._cache.move_to_end(image_hash)
+                return payload
+
+        payload = self._encode(image)
+
+        with self._lock:
+            self._cache[image_hash] = payload
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return payload
+
+    def _encode(self, image):
+        if isinstance(image, str):
+            with open(image, "rb") as f:
+                image = f.read()
+
+        # Small, already-compressed uploads are cheaper to send as they
+        # are; the size check reads the header so they are never decoded
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            mime_type = _sniff_mime_type(image)
+            if mime_type is not None and len(image) <= self.max_bytes:
+                size = _header_size(image)
+                if size is not None and max(size) <= self.max_dimension:
+                    return mime_type, bytes(image)
+
+        decoded = load_image(image)
+        height, width = decoded.shape[:2]
+
+        scale = min(1.0, self.max_dimension / max(height, width))
+        while True:
+            resized = decoded
+            if scale < 1.0:
+                size = (max(1, int(width * scale)), max(1, int(height * scale)))
+                resized = cv2.resize(decoded, size, interpolation=cv2.INTER_AREA)
+
+            payload = self._fit_quality(resized)
+            if payload is not None:
+                return payload
+
+            # Still too large at the lowest quality; shrink and retry
+            if max(resized.shape[:2]) <= 64:
+                return self._encode_at(resized, self.min_quality)
+            scale *= 0.75
+
+    def _fit_quality(self, image):
+        # Most images fit at the top quality, so try that first
+        best = self._encode_at(image, self.max_quality)
+        if len(best[1]) <= self.max_bytes:
+            return best
+
+        # Otherwise binary search for the highest quality under the budget
+        low, high = self.min_quality, self.max_quality - 1
+        best = None
+        while low <= high:
+            quality = (low + high) // 2
+            payload = self._encode_at(image, quality)
+            if len(payload[1]) <= self.max_bytes:
+                best = payload
+                low = quality + 1
+            else:
+                high = quality - 1
+        return best
+
+    def _encode_at(self, image, quality):
+        extension, mime_type, flag = _FORMATS[self.image_format]
+        ok, buffer = cv2.imencode(extension, image, [flag, quality])
+        if not ok:
+            raise ValueError(f"Could not encode image as {self.image_format}")
+        return mime_type, buffer.tobytes()
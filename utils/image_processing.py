@@ -1,49 +1,160 @@
+import threading
+
 import cv2
 import numpy as np
 
-def preprocess_image(image_path):
+from config import ENHANCE_CONTRAST, DENOISE_IMAGES
+from utils.metrics import metrics
+
+def load_image(source):
+    """
+    Decode an image from a path, encoded bytes or an existing array.
+    
+    DICOM files are windowed to 8 bits; multi-frame files give their
+    middle frame (see utils.dicom to work with every frame).
+    
+    Args:
+        source: File path, encoded image bytes, or a BGR numpy array
+        
+    Returns:
+        numpy.ndarray: Decoded BGR image (arrays are returned as is)
+    """
+    if isinstance(source, np.ndarray):
+        return source
+    
+    from utils.dicom import is_dicom, read_dicom
+    
+    if is_dicom(source):
+        with metrics.span("decode"):
+            return read_dicom(source)
+    
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        buffer = np.frombuffer(source, dtype=np.uint8)
+        with metrics.span("decode"):
+            image = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("Could not decode image from bytes")
+        return image
+    
+    with metrics.span("decode"):
+        image = cv2.imread(source)
+        if image is None:
+            # DICOM files often have no extension
+            try:
+                image = read_dicom(source)
+            except (ValueError, OSError):
+                pass
+    if image is None:
+        raise ValueError(f"Could not read image at {source}")
+    return image
+
+class PreprocessingPipeline:
+    """
+    Reusable preprocessing pipeline: downscale, CLAHE on lightness, denoise.
+    
+    Stages are chosen once from config. The CLAHE instance and the LAB
+    scratch buffers are kept per thread and reused for every image of the
+    same size, and the whole chain stays in BGR so no extra colour-space
+    conversions are needed.
+    """
+    
+    def __init__(self, max_dimension=1024, enhance_contrast=ENHANCE_CONTRAST,
+                 denoise=DENOISE_IMAGES, clip_limit=3.0, tile_grid_size=(8, 8)):
+        self.max_dimension = max_dimension
+        self.clip_limit = clip_limit
+        self.tile_grid_size = tile_grid_size
+        
+        # Build the stage list from config
+        self.stages = []
+        if enhance_contrast:
+            self.stages.append(self._enhance_contrast)
+        if denoise:
+            self.stages.append(self._denoise)
+        
+        # CLAHE objects and scratch buffers are not safe to share across threads
+        self._local = threading.local()
+    
+    def __call__(self, image):
+        """
+        Run the pipeline on a decoded BGR image.
+        
+        Args:
+            image: BGR numpy array; never modified
+            
+        Returns:
+            numpy.ndarray: Newly allocated processed BGR image
+        """
+        image = self._resize(image)
+        for stage in self.stages:
+            image = stage(image)
+        return image
+    
+    def _resize(self, image):
+        # Resize image if too large (Gemini has size limits)
+        height, width = image.shape[:2]
+        if max(height, width) > self.max_dimension:
+            scale = self.max_dimension / max(height, width)
+            new_width = int(width * scale)
+            new_height = int(height * scale)
+            return cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_AREA)
+        # Copy so later in-place stages never touch the caller's array
+        return image.copy()
+    
+    def _scratch(self, shape):
+        local = self._local
+        if getattr(local, "shape", None) != shape:
+            local.shape = shape
+            local.lab = np.empty(shape, dtype=np.uint8)
+            local.lightness = np.empty(shape[:2], dtype=np.uint8)
+        if getattr(local, "clahe", None) is None:
+            local.clahe = cv2.createCLAHE(clipLimit=self.clip_limit, tileGridSize=self.tile_grid_size)
+        return local
+    
+    def _enhance_contrast(self, image):
+        # Apply CLAHE (Contrast Limited Adaptive Histogram Equalization)
+        # to the L channel only, converting straight from and back to BGR
+        scratch = self._scratch(image.shape)
+        cv2.cvtColor(image, cv2.COLOR_BGR2LAB, dst=scratch.lab)
+        cv2.extractChannel(scratch.lab, 0, dst=scratch.lightness)
+        scratch.clahe.apply(scratch.lightness, dst=scratch.lightness)
+        cv2.insertChannel(scratch.lightness, scratch.lab, 0)
+        cv2.cvtColor(scratch.lab, cv2.COLOR_LAB2BGR, dst=image)
+        return image
+    
+    def _denoise(self, image):
+        # Apply slight Gaussian blur to reduce noise
+        cv2.GaussianBlur(image, (3, 3), 0, dst=image)
+        return image
+
+_default_pipeline = None
+
+def get_default_pipeline():
+    """Return the shared pipeline built from config settings."""
+    global _default_pipeline
+    if _default_pipeline is None:
+        _default_pipeline = PreprocessingPipeline()
+    return _default_pipeline
+
+def preprocess_image(image_source, pipeline=None):
     """
     Preprocess medical image for analysis.
     
     Args:
-        image_path: Path to the medical image file
+        image_source: Path to the medical image file, encoded image bytes,
+            or an already-decoded BGR numpy array (left unmodified)
+        pipeline: Optional PreprocessingPipeline; defaults to the shared
+            pipeline configured from config.py
         
     Returns:
         numpy.ndarray: Processed image ready for model input
     """
-    # Read image
-    image = cv2.imread(image_path)
+    image = load_image(image_source)
     
-    if image is None:
-        raise ValueError(f"Could not read image at {image_path}")
-    
-    # Convert to RGB (from BGR)
-    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    
-    # Resize image if too large (Gemini has size limits)
-    max_dimension = 1024
-    height, width = image.shape[:2]
-    if max(height, width) > max_dimension:
-        scale = max_dimension / max(height, width)
-        new_width = int(width * scale)
-        new_height = int(height * scale)
-        image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_AREA)
-    
-    # Apply CLAHE (Contrast Limited Adaptive Histogram Equalization)
-    lab = cv2.cvtColor(image, cv2.COLOR_RGB2LAB)
-    l, a, b = cv2.split(lab)
-    clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
-    cl = clahe.apply(l)
-    limg = cv2.merge((cl, a, b))
-    enhanced_image = cv2.cvtColor(limg, cv2.COLOR_LAB2RGB)
-    
-    # Apply slight Gaussian blur to reduce noise
-    enhanced_image = cv2.GaussianBlur(enhanced_image, (3, 3), 0)
-    
-    # Ensure image is in correct format for Gemini
-    enhanced_image = cv2.cvtColor(enhanced_image, cv2.COLOR_RGB2BGR)
-    
-    return enhanced_image
+    if pipeline is None:
+        pipeline = get_default_pipeline()
+    
+    with metrics.span("preprocess"):
+        return pipeline(image)
 
 def draw_anomalies(image, detection_results):
     """
@@ -84,4 +195,16 @@ def draw_anomalies(image, detection_results):
                 2
             )
     
-    return result_image 
\ No newline at end of file
+    return result_image 
+
+
+def scale_regions(cv_results, scale):
+    """Return a copy of detection results with regions scaled for display."""
+    scaled = dict(cv_results)
+    scaled["regions"] = [
+        dict(region,
+             x=int(region["x"] * scale), y=int(region["y"] * scale),
+             width=int(region["width"] * scale), height=int(region["height"] * scale))
+        for region in cv_results.get("regions", [])
+    ]
+    return scaled
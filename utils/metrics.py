@@ -0,0 +1,204 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from config import METRICS_FILE, METRICS_WINDOW, METRICS_FLUSH_SECONDS
+
+# Prometheus metric name prefix
+PREFIX = "medvision"
+
+# Metric name -> label name, for the exported label and the debug panel
+LABELS = {
+    "stage_seconds": "stage",
+    "payload_bytes": "kind",
+    "gemini_tokens": "kind",
+    "stage_errors_total": "stage",
+    "triage_wait_seconds": "priority",
+    "time_to_answer_seconds": "priority",
+    "genai_skipped_total": "priority",
+}
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _quantile(ordered, q):
+    # Nearest-rank quantile of an already sorted list
+    index = min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))
+    return ordered[index]
+
+
+class Series:
+    """Rolling window of observations plus all-time count and sum."""
+
+    def __init__(self, window):
+        self.values = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value):
+        self.values.append(value)
+        self.count += 1
+        self.total += value
+
+    def summary(self):
+        ordered = sorted(self.values)
+        summary = {"count": self.count, "sum": self.total, "last": self.values[-1] if self.values else None}
+        for q in QUANTILES:
+            summary[f"p{int(q * 100)}"] = _quantile(ordered, q) if ordered else None
+        return summary
+
+
+class Metrics:
+    """
+    Lightweight in-process metrics for the analysis pipeline.
+
+    Stage durations, payload sizes and token counts go into rolling windows
+    so percentiles reflect recent work; counts and sums are kept for the
+    whole process lifetime, as Prometheus summaries expect.
+    """
+
+    def __init__(self, window=METRICS_WINDOW, path=METRICS_FILE):
+        self.window = window
+        # Where write() and flush() export to by default
+        self.path = path
+        self._series = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+
+    @contextmanager
+    def span(self, stage):
+        """Time the enclosed block as one observation of a pipeline stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.increment("stage_errors_total", stage)
+            raise
+        finally:
+            self.observe("stage_seconds", stage, time.perf_counter() - start)
+
+    def observe(self, metric, label, value):
+        """Record one observation, e.g. observe("payload_bytes", "gemini_upload", 81920)."""
+        with self._lock:
+            series = self._series.get((metric, label))
+            if series is None:
+                series = self._series[(metric, label)] = Series(self.window)
+            series.add(value)
+
+    def increment(self, counter, label, amount=1):
+        with self._lock:
+            self._counters[(counter, label)] = self._counters.get((counter, label), 0) + amount
+
+    def record_usage(self, response):
+        """Record Gemini token usage from a response, when it reports any."""
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return
+        for kind, field in (("prompt", "prompt_token_count"), ("output", "candidates_token_count")):
+            value = getattr(usage, field, None)
+            if value:
+                self.observe("gemini_tokens", kind, value)
+
+    def snapshot(self):
+        """
+        Return current percentiles and counters.
+
+        Returns:
+            dict: {"series": {metric: {label: summary}}, "counters": {counter: {label: value}}}
+        """
+        with self._lock:
+            series = {key: s.summary() for key, s in self._series.items()}
+            counters = dict(self._counters)
+        result = {"series": {}, "counters": {}}
+        for (metric, label), summary in sorted(series.items()):
+            result["series"].setdefault(metric, {})[label] = summary
+        for (counter, label), value in sorted(counters.items()):
+            result["counters"].setdefault(counter, {})[label] = value
+        return result
+
+    def rows(self):
+        """Return one flat dict per series, for tables in the debug panels."""
+        rows = []
+        for metric, labels in self.snapshot()["series"].items():
+            for label, summary in labels.items():
+                rows.append({"metric": metric, "name": label, "count": summary["count"],
+                             "p50": summary["p50"], "p95": summary["p95"], "p99": summary["p99"]})
+        return rows
+
+    def format_table(self):
+        """Format the rolling percentiles as a plain-text table."""
+        lines = [f"{'metric':<22} {'name':<22} {'count':>6} {'p50':>10} {'p95':>10} {'p99':>10}"]
+        for row in self.rows():
+            if row["metric"].endswith("_seconds"):
+                values = [f"{row[p] * 1000:>8.1f}ms" for p in ("p50", "p95", "p99")]
+            else:
+                values = [f"{row[p]:>10.0f}" for p in ("p50", "p95", "p99")]
+            lines.append(f"{row['metric']:<22} {row['name']:<22} {row['count']:>6} " + " ".join(values))
+        return "\n".join(lines)
+
+    def to_prometheus(self):
+        """Render all metrics in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+        for metric, labels in snapshot["series"].items():
+            name = f"{PREFIX}_{metric}"
+            label_name = LABELS.get(metric, "name")
+            lines.append(f"# TYPE {name} summary")
+            for label, summary in labels.items():
+                for q in QUANTILES:
+                    value = summary[f"p{int(q * 100)}"]
+                    lines.append(f'{name}{{{label_name}="{label}",quantile="{q}"}} {value}')
+                lines.append(f'{name}_sum{{{label_name}="{label}"}} {summary["sum"]}')
+                lines.append(f'{name}_count{{{label_name}="{label}"}} {summary["count"]}')
+        for counter, labels in snapshot["counters"].items():
+            name = f"{PREFIX}_{counter}"
+            lines.append(f"# TYPE {name} counter")
+            label_name = LABELS.get(counter, "name")
+            for label, value in labels.items():
+                lines.append(f'{name}{{{label_name}="{label}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path=None):
+        """
+        Write the metrics file atomically, to path or else self.path.
+
+        Paths ending in .json get the snapshot as JSON; anything else gets
+        Prometheus text, e.g. for a node_exporter textfile collector.
+        """
+        path = path or self.path
+        if path.endswith(".json"):
+            content = json.dumps(self.snapshot(), indent=2)
+        else:
+            content = self.to_prometheus()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def flush(self, path=None, min_interval=METRICS_FLUSH_SECONDS):
+        """Write the metrics file unless it was written within min_interval seconds."""
+        path = self.path if path is None else path
+        if not path:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_flush < min_interval:
+                return
+            self._last_flush = now
+        self.write(path)
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+            self._counters.clear()
+
+
+# Process-wide metrics shared by every pipeline stage
+metrics = Metrics()
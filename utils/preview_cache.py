@@ -0,0 +1,214 @@
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from config import MAX_IMAGE_WIDTH, THUMBNAIL_SIZE, PREVIEW_CACHE_DIR, PREVIEW_CACHE_MAX_MB, PREVIEW_SPILL_MAX_MB
+from utils.analysis_cache import hash_image
+
+LEVELS = ("thumbnail", "display", "full")
+
+
+def _resize_to_width(image, width):
+    height = max(1, int(image.shape[0] * width / image.shape[1]))
+    interpolation = cv2.INTER_AREA if width < image.shape[1] else cv2.INTER_LANCZOS4
+    return cv2.resize(image, (width, height), interpolation=interpolation)
+
+
+class PreviewCache:
+    """
+    Multi-resolution previews of images, cached by content hash.
+
+    Each image gets a thumbnail and a display-width level, generated once.
+    Recently used levels stay in memory up to max_bytes; evicted levels are
+    spilled to spill_dir as JPEG and reloaded from there on the next use.
+    Spilled files are kept up to spill_max_bytes, least recently used
+    deleted first. The full level is the source image itself and is never
+    copied.
+    """
+
+    def __init__(self, max_bytes=PREVIEW_CACHE_MAX_MB * 1024 * 1024, spill_dir=PREVIEW_CACHE_DIR,
+                 display_width=MAX_IMAGE_WIDTH, thumbnail_size=THUMBNAIL_SIZE,
+                 spill_max_bytes=PREVIEW_SPILL_MAX_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.spill_max_bytes = spill_max_bytes
+        self.display_width = display_width
+        self.thumbnail_size = thumbnail_size
+
+        self._entries = OrderedDict()
+        self._size = 0
+        self._spilled = OrderedDict()
+        self._spilled_size = 0
+        self._lock = threading.Lock()
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+            self._index_spilled()
+
+    def get(self, image, level="display", image_hash=None):
+        """
+        Return one level of an image's preview pyramid.
+
+        Args:
+            image: BGR numpy array
+            level: "thumbnail", "display" or "full"
+            image_hash: Optional precomputed hash_image(image)
+
+        Returns:
+            numpy.ndarray: BGR image at the requested level
+        """
+        if level not in LEVELS:
+            raise ValueError(f"Unknown preview level: {level}")
+        if level == "full":
+            return image
+        if image_hash is None:
+            image_hash = hash_image(image)
+
+        key = (image_hash, level, "array")
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+
+        encoded = self._load_spilled(image_hash, level)
+        if encoded is not None:
+            preview = cv2.imdecode(np.frombuffer(encoded, dtype=np.uint8), cv2.IMREAD_COLOR)
+        else:
+            preview = self._render(image, level)
+        self._store(key, preview, preview.nbytes)
+        return preview
+
+    def get_jpeg(self, image, level="display", image_hash=None):
+        """
+        Return one preview level as JPEG bytes, e.g. to send to a browser.
+
+        Args:
+            image: BGR numpy array
+            level: "thumbnail" or "display"
+            image_hash: Optional precomputed hash_image(image)
+
+        Returns:
+            bytes: JPEG data
+        """
+        if image_hash is None:
+            image_hash = hash_image(image)
+
+        key = (image_hash, level, "jpeg")
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+
+        encoded = self._load_spilled(image_hash, level)
+        if encoded is None:
+            encoded = self._encode(self.get(image, level, image_hash))
+        self._store(key, encoded, len(encoded))
+        return encoded
+
+    def pyramid(self, image, image_hash=None):
+        """Return every level of an image's preview pyramid as a dict."""
+        if image_hash is None:
+            image_hash = hash_image(image)
+        return {level: self.get(image, level, image_hash) for level in LEVELS}
+
+    def _render(self, image, level):
+        if level == "thumbnail":
+            height, width = image.shape[:2]
+            scale = min(1.0, self.thumbnail_size / max(height, width))
+            return _resize_to_width(image, max(1, int(width * scale)))
+        return _resize_to_width(image, self.display_width)
+
+    def _encode(self, image):
+        ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        if not ok:
+            raise ValueError("Could not encode preview")
+        return buffer.tobytes()
+
+    def _spill_path(self, image_hash, level):
+        return os.path.join(self.spill_dir, f"{image_hash}_{level}.jpg")
+
+    def _index_spilled(self):
+        # Files left by earlier runs, oldest used first
+        entries = []
+        for entry in os.scandir(self.spill_dir):
+            if entry.is_file() and entry.name.endswith(".jpg"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.path, stat.st_size))
+        for _, path, size in sorted(entries):
+            self._spilled[path] = size
+            self._spilled_size += size
+        self._trim_spilled()
+
+    def _trim_spilled(self):
+        # Called with the lock held or before the cache is shared
+        while self._spilled_size > self.spill_max_bytes and self._spilled:
+            path, size = self._spilled.popitem(last=False)
+            self._spilled_size -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _load_spilled(self, image_hash, level):
+        if not self.spill_dir:
+            return None
+        path = self._spill_path(image_hash, level)
+        with self._lock:
+            if path not in self._spilled:
+                return None
+            self._spilled.move_to_end(path)
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def _store(self, key, value, size):
+        evicted = []
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (value, size)
+                self._size += size
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                old_key, (old_value, old_size) = self._entries.popitem(last=False)
+                self._size -= old_size
+                evicted.append((old_key, old_value))
+
+        # Write evicted levels to disk outside the lock
+        for (image_hash, level, kind), old_value in evicted:
+            if not self.spill_dir:
+                continue
+            path = self._spill_path(image_hash, level)
+            with self._lock:
+                if path in self._spilled:
+                    continue
+            data = old_value if kind == "jpeg" else self._encode(old_value)
+            with open(path, "wb") as f:
+                f.write(data)
+            with self._lock:
+                if path not in self._spilled:
+                    self._spilled[path] = len(data)
+                    self._spilled_size += len(data)
+                self._trim_spilled()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_preview_cache():
+    """Return the process-wide PreviewCache."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PreviewCache()
+    return _cache
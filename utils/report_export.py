@@ -0,0 +1,241 @@
+"""
+Bulk export of stored reports from the analysis history.
+
+Usage:
+    python -m utils.report_export OUTPUT.zip [--district X] [--priority RED]
+        [--date-from 2026-01-01] [--date-to 2026-01-31]
+    python -m utils.report_export OUTPUT.html ...
+
+Records are streamed from the history a chunk at a time and written out
+as they arrive, so memory stays flat however many reports are exported.
+A ZIP holds one Markdown file per report plus an index.csv; an HTML bundle
+is a single printable page per report (use the browser's Print to PDF for
+a PDF bundle).
+"""
+
+import argparse
+import csv
+import html
+import io
+import os
+import re
+import sys
+import threading
+import zipfile
+
+from utils.history_store import get_history_store
+
+FORMATS = ("zip", "html")
+
+_HTML_HEAD = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; max-width: 50em; margin: 2em auto; color: #222; }}
+section {{ page-break-after: always; border-bottom: 1px solid #ccc; padding-bottom: 2em; margin-bottom: 2em; }}
+.meta {{ color: #555; font-size: 0.9em; }}
+.RED {{ color: #c00; }} .ORANGE {{ color: #d70; }} .GREEN {{ color: #080; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+"""
+
+_HTML_RECORD = """<section id="report-{id}">
+<p class="meta">#{id} &middot; {created_at} &middot; {patient_name} &middot; {village}, {district}, {state}
+&middot; <strong class="{priority}">{priority}</strong></p>
+"""
+
+_HTML_TAIL = "</body>\n</html>\n"
+
+_INDEX_COLUMNS = ("id", "created_at", "patient_name", "age", "gender", "village", "district", "state",
+                  "priority", "language", "image_name", "file")
+
+
+def _slug(text):
+    return re.sub(r"[^A-Za-z0-9]+", "_", text or "").strip("_")[:40] or "unknown"
+
+
+def report_filename(record):
+    """Return the file name a record is stored under inside a ZIP export."""
+    return f"{record['created_at'][:10]}_{record['id']:06d}_{_slug(record['patient_name'])}.md"
+
+
+def report_to_html(report):
+    """
+    Convert the Markdown subset used in reports to HTML.
+
+    Handles headings, bullet lists and paragraphs; everything else is
+    escaped text, so no Markdown library is needed.
+    """
+    lines, in_list = [], False
+    for raw in report.splitlines():
+        line = raw.strip()
+        is_item = line.startswith(("- ", "* "))
+        if in_list and not is_item:
+            lines.append("</ul>")
+            in_list = False
+        if not line:
+            continue
+        if line.startswith("#"):
+            level = min(6, len(line) - len(line.lstrip("#")) + 1)
+            lines.append(f"<h{level}>{html.escape(line.lstrip('#').strip())}</h{level}>")
+        elif is_item:
+            if not in_list:
+                lines.append("<ul>")
+                in_list = True
+            lines.append(f"<li>{html.escape(line[2:])}</li>")
+        else:
+            lines.append(f"<p>{html.escape(line)}</p>")
+    if in_list:
+        lines.append("</ul>")
+    return "\n".join(lines) + "\n"
+
+
+def _record_fields(record):
+    # HTML-escaped, with missing values left blank
+    return {key: "" if value is None else html.escape(str(value)) for key, value in record.items()}
+
+
+def export_reports(path, fmt=None, store=None, progress=None, cancel_event=None, title="Medical Image Analysis Reports",
+                   **filters):
+    """
+    Stream every matching report from the history into one export file.
+
+    Args:
+        path: Output file; written to a temporary name and renamed when done
+        fmt: "zip" or "html"; defaults to the file extension
+        store: HistoryStore, defaults to the shared one
+        progress: Optional callable(done, total) called after each record
+        cancel_event: Optional threading.Event; when set the export stops
+            and no output file is left behind
+        title: Heading of an HTML bundle
+        **filters: district, priority, date_from, date_to, patient_name
+            and search, as accepted by HistoryStore.query
+
+    Returns:
+        int: Number of reports exported
+    """
+    fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    store = store or get_history_store()
+    total = store.count(**filters)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.part"
+    done = 0
+    try:
+        if fmt == "zip":
+            index = io.StringIO()
+            writer = csv.DictWriter(index, _INDEX_COLUMNS, extrasaction="ignore")
+            writer.writeheader()
+            with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+                for record in store.iter_records(with_reports=True, **filters):
+                    if cancel_event is not None and cancel_event.is_set():
+                        break
+                    name = report_filename(record)
+                    archive.writestr(name, record["report"])
+                    writer.writerow(dict(record, file=name))
+                    done += 1
+                    if progress:
+                        progress(done, total)
+                archive.writestr("index.csv", index.getvalue())
+        else:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(_HTML_HEAD.format(title=html.escape(title)))
+                for record in store.iter_records(with_reports=True, **filters):
+                    if cancel_event is not None and cancel_event.is_set():
+                        break
+                    f.write(_HTML_RECORD.format(**_record_fields(record)))
+                    f.write(report_to_html(record["report"]))
+                    f.write("</section>\n")
+                    done += 1
+                    if progress:
+                        progress(done, total)
+                f.write(_HTML_TAIL)
+
+        if cancel_event is not None and cancel_event.is_set():
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return done
+
+
+class ExportJob:
+    """
+    Run export_reports on a background thread and track its progress.
+
+    Attributes:
+        done, total: Reports written so far and reports matching the filters
+        status: "running", "done", "failed" or "cancelled"
+        error: Error message when the export failed
+    """
+
+    def __init__(self, path, fmt=None, store=None, **filters):
+        self.path = path
+        self.fmt = fmt
+        self.store = store
+        self.filters = filters
+        self.done = 0
+        self.total = 0
+        self.status = "running"
+        self.error = None
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="report-export", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _progress(self, done, total):
+        self.done, self.total = done, total
+
+    def _run(self):
+        try:
+            export_reports(self.path, self.fmt, self.store, self._progress, self._cancel, **self.filters)
+            self.status = "cancelled" if self._cancel.is_set() else "done"
+        except Exception as e:
+            self.error = str(e)
+            self.status = "failed"
+
+    @property
+    def fraction(self):
+        return self.done / self.total if self.total else (1.0 if self.status == "done" else 0.0)
+
+    def cancel(self):
+        self._cancel.set()
+
+    def wait(self, timeout=None):
+        self._thread.join(timeout)
+        return self.status
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export stored reports as a ZIP or an HTML bundle.")
+    parser.add_argument("output", help="Output .zip or .html file")
+    parser.add_argument("--district")
+    parser.add_argument("--priority", choices=("RED", "ORANGE", "GREEN"))
+    parser.add_argument("--date-from", help="First day included, YYYY-MM-DD")
+    parser.add_argument("--date-to", help="Last day included, YYYY-MM-DD")
+    args = parser.parse_args(argv)
+
+    def progress(done, total):
+        if done % 100 == 0 or done == total:
+            print(f"\r{done}/{total} reports", end="", file=sys.stderr, flush=True)
+
+    count = export_reports(args.output, progress=progress, district=args.district, priority=args.priority,
+                           date_from=args.date_from, date_to=args.date_to)
+    print(f"\nExported {count} reports to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,10 @@
-def generate_report(image_path, cv_results, genai_results):
-    """
-    Generate a comprehensive medical report combining CV and GenAI results.
-    
-    Args:
-        image_path: Path to the analyzed image
-        cv_results: Results from computer vision model
-        genai_results: Results from Gemini analysis
-        
-    Returns:
-        str: Formatted report
-    """
-    # Get current date
-    from datetime import datetime
-    current_date = datetime.now().strftime("%Y-%m-%d")
-    
-    # Check for errors in GenAI results
-    genai_error = genai_results.get("error", None)
-    genai_analysis = genai_results.get("analysis", "No AI analysis available.")
-    
-    # Format the report
-    report = """
+import os
+from datetime import datetime
+
+from utils.metrics import metrics
+
+# Report sections before and after the AI analysis text
+REPORT_HEAD = """
     # Medical Image Analysis Report
     
     ## Image Information
@@ -32,23 +17,93 @@ def generate_report(image_path, cv_results, genai_results):
     - Number of Regions: {4}
     
     ## AI Diagnostic Assistance
-    {5}
+    """
+
+REPORT_TAIL = """
     
     ## Recommendations
     - This is an automated analysis and should be reviewed by a healthcare professional
     - Store this report with the image for future reference
     - If anomalies were detected, prompt medical follow-up is recommended
-    """.format(
-        image_path.split('/')[-1],
+    """
+
+REPORT_ERROR = "\n\n## Error Information\n- Error Type: {0}\n- Please ensure the image is appropriate for medical analysis and try again."
+
+# Bound once at import; str.format does the parsing in C
+_HEAD_TEMPLATE = REPORT_HEAD.format
+_ERROR_TEMPLATE = REPORT_ERROR.format
+
+def _report_head(image_source, cv_results, image_name):
+    if image_name is None:
+        image_name = os.path.basename(image_source) if isinstance(image_source, str) else "Uploaded image"
+
+    # Get current date
+    current_date = datetime.now().strftime("%Y-%m-%d")
+
+    return _HEAD_TEMPLATE(
+        image_name,
         current_date,
         "Yes" if cv_results.get("has_anomaly", False) else "No",
         cv_results.get("confidence", 0) * 100,
-        len(cv_results.get("regions", [])),
-        genai_analysis
+        len(cv_results.get("regions", []))
     )
-    
-    # Add error information if present
-    if genai_error:
-        report += f"\n\n## Error Information\n- Error Type: {genai_error}\n- Please ensure the image is appropriate for medical analysis and try again."
-    
-    return report 
\ No newline at end of file
+
+def generate_report(image_source, cv_results, genai_results, image_name=None):
+    """
+    Generate a comprehensive medical report combining CV and GenAI results.
+
+    Args:
+        image_source: Path to the analyzed image, or its bytes / array
+        cv_results: Results from computer vision model
+        genai_results: Results from Gemini analysis
+        image_name: Name shown in the report; defaults to the file name
+            when image_source is a path
+
+    Returns:
+        str: Formatted report
+    """
+    # Check for errors in GenAI results
+    genai_error = genai_results.get("error", None)
+    genai_analysis = genai_results.get("analysis", "No AI analysis available.")
+
+    with metrics.span("report"):
+        # Format the report
+        report = _report_head(image_source, cv_results, image_name) + genai_analysis + REPORT_TAIL
+
+        # Add error information if present
+        if genai_error:
+            report += _ERROR_TEMPLATE(genai_error)
+
+    return report
+
+def generate_report_stream(image_source, cv_results, genai_stream, image_name=None):
+    """
+    Generate the report incrementally while the AI analysis streams in.
+
+    The computer vision section is yielded immediately, followed by each AI
+    text chunk as it arrives and then the closing sections. Joining every
+    yielded piece gives the same text as generate_report.
+
+    Args:
+        image_source: Path to the analyzed image, or its bytes / array
+        cv_results: Results from computer vision model
+        genai_stream: Iterable of AI text chunks, e.g. the AnalysisStream
+            from GeminiHelper.stream_medical_image_analysis
+        image_name: Name shown in the report
+
+    Yields:
+        str: Consecutive pieces of the report
+    """
+    with metrics.span("report"):
+        head = _report_head(image_source, cv_results, image_name)
+    yield head
+
+    for chunk in genai_stream:
+        yield chunk
+
+    yield REPORT_TAIL
+
+    # Streams expose their final result once exhausted
+    genai_results = getattr(genai_stream, "result", None) or {}
+    if genai_results.get("error"):
+        yield _ERROR_TEMPLATE(genai_results["error"])
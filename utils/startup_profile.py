@@ -0,0 +1,128 @@
+"""
+Startup-time report for the application entry points.
+
+Usage:
+    python -m utils.startup_profile [--module ui.streamlit_app] [--init] [--json]
+
+Imports the entry module in a fresh interpreter with -X importtime and
+breaks the cost down by top-level package. With --init it also builds and
+warms the shared models and reports how long each step took.
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def parse_importtime(output):
+    """
+    Parse `python -X importtime` output.
+
+    Args:
+        output: The interpreter's stderr text
+
+    Returns:
+        list: (module, self_seconds, cumulative_seconds, depth) tuples
+    """
+    entries = []
+    for line in output.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            entries.append((module, int(self_us) / 1e6, int(cumulative_us) / 1e6, (len(indent) - 1) // 2))
+    return entries
+
+
+def profile_imports(module):
+    """
+    Measure the import cost of a module in a fresh interpreter.
+
+    Args:
+        module: Dotted module name, e.g. "ui.streamlit_app"
+
+    Returns:
+        dict: Total wall time, and seconds spent per top-level package
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=root, capture_output=True, text=True
+    )
+    wall = time.perf_counter() - start
+    if completed.returncode != 0:
+        # importtime lines come first; the traceback is at the end
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+
+    by_package = {}
+    for name, self_seconds, _, _ in parse_importtime(completed.stderr):
+        package = name.split(".")[0]
+        by_package[package] = by_package.get(package, 0.0) + self_seconds
+
+    return {
+        "module": module,
+        "wall_seconds": wall,
+        "import_seconds": sum(by_package.values()),
+        "packages": dict(sorted(by_package.items(), key=lambda item: item[1], reverse=True)),
+    }
+
+
+def profile_init():
+    """
+    Build and warm the shared models in this process.
+
+    Returns:
+        dict: Seconds per initialisation step as recorded by the registry
+    """
+    from models import registry
+
+    start = time.perf_counter()
+    registry.warm_up()
+    result = dict(registry.timings)
+    result["total"] = time.perf_counter() - start
+    return result
+
+
+def format_report(imports, init=None, top=15):
+    """Format the profiles as a plain-text table."""
+    lines = [
+        f"Startup profile for {imports['module']}",
+        f"  interpreter + imports: {imports['wall_seconds']:.2f}s "
+        f"(imports {imports['import_seconds']:.2f}s)",
+        "",
+        f"  {'package':<30} {'seconds':>8}",
+    ]
+    for package, seconds in list(imports["packages"].items())[:top]:
+        lines.append(f"  {package:<30} {seconds:>8.3f}")
+    if init is not None:
+        lines += ["", f"  {'initialisation step':<30} {'seconds':>8}"]
+        for step, seconds in init.items():
+            lines.append(f"  {step:<30} {seconds:>8.3f}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report import and initialisation cost at startup.")
+    parser.add_argument("--module", default="ui.streamlit_app", help="Entry module to import")
+    parser.add_argument("--init", action="store_true", help="Also build and warm the shared models")
+    parser.add_argument("--top", type=int, default=15, help="Packages to list")
+    parser.add_argument("--json", action="store_true", help="Print JSON instead of a table")
+    args = parser.parse_args(argv)
+
+    imports = profile_imports(args.module)
+    init = profile_init() if args.init else None
+
+    if args.json:
+        print(json.dumps({"imports": imports, "init": init}, indent=2))
+    else:
+        print(format_report(imports, init, args.top))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,436 @@
+"""
+Tiled, memory-bounded processing for very large images.
+
+Large TIFFs are read through a memory map (or a chunked zarr view for
+compressed/tiled files, which needs tifffile and zarr) so only one tile is
+decoded at a time. Contrast enhancement uses CLAHE statistics gathered
+over the whole image in a first pass, so tiles join without seams. A small
+copy of each tile goes through the classifier in batches, and the per-tile
+heatmaps are stitched into one image-wide heatmap from which regions are
+extracted.
+"""
+
+import threading
+
+import cv2
+import numpy as np
+
+from config import (
+    TILE_MEMORY_BUDGET_MB,
+    TILE_SIZE,
+    TILE_OVERLAP,
+    LARGE_IMAGE_PIXELS,
+    BATCH_MAX_SIZE,
+    ENHANCE_CONTRAST,
+)
+from utils.dicom import DicomFile, is_dicom
+from utils.image_processing import load_image, PreprocessingPipeline
+
+# Rough bytes per pixel held while enhancing one tile: source, BGR copy,
+# LAB planes and the float32 buffers of the CLAHE interpolation
+_BYTES_PER_TILE_PIXEL = 32
+
+# Bytes per pixel of a fully decoded BGR image
+_BYTES_PER_DECODED_PIXEL = 3
+
+# Resolution the stitched heatmap is kept at, and returned at
+_HEATMAP_SIZE = 256
+_RESULT_HEATMAP_SIZE = 32
+
+# Pixels sampled per axis when estimating the intensity range of deep images
+_RANGE_SAMPLES = 512
+
+
+class ArrayReader:
+    """
+    Tile reader over an array that is in memory, memory-mapped or chunked.
+
+    Arrays from TIFF files are in RGB sample order and may be grayscale or
+    deeper than 8 bits; set bgr=True for arrays already in OpenCV layout.
+    """
+
+    def __init__(self, array, bgr=False):
+        self.array = array
+        self.bgr = bgr
+        self.height, self.width = array.shape[:2]
+        self.low, self.high = None, None
+        if array.dtype != np.uint8:
+            self.low, self.high = _intensity_range(array)
+
+    def read(self, y0, y1, x0, x1):
+        """Return the region [y0:y1, x0:x1] as an 8-bit BGR array."""
+        tile = np.asarray(self.array[y0:y1, x0:x1])
+        if self.bgr:
+            return tile
+        return _to_bgr8(tile, self.low, self.high)
+
+
+def _intensity_range(array):
+    # Strided sample keeps this bounded regardless of image size
+    step_y = max(1, array.shape[0] // _RANGE_SAMPLES)
+    step_x = max(1, array.shape[1] // _RANGE_SAMPLES)
+    sample = np.asarray(array[::step_y, ::step_x])
+    return float(sample.min()), float(sample.max())
+
+
+def _to_bgr8(tile, low=None, high=None):
+    if tile.dtype != np.uint8:
+        scale = 255.0 / (high - low) if high > low else 1.0
+        tile = cv2.convertScaleAbs(tile.astype(np.float32, copy=False), alpha=scale, beta=-low * scale)
+    if tile.ndim == 2:
+        return cv2.cvtColor(tile, cv2.COLOR_GRAY2BGR)
+    if tile.shape[2] == 4:
+        return cv2.cvtColor(tile, cv2.COLOR_RGBA2BGR)
+    # TIFF samples are stored in RGB order
+    return cv2.cvtColor(tile, cv2.COLOR_RGB2BGR)
+
+
+def open_tiled(path, memory_budget_mb=TILE_MEMORY_BUDGET_MB):
+    """
+    Open an image for tile-by-tile reading.
+
+    Uncompressed TIFFs are memory-mapped, compressed or tiled TIFFs are read
+    chunk by chunk through zarr. Other images cannot be read in parts, so
+    they are decoded in full, but only when that fits memory_budget_mb.
+
+    Args:
+        path: Image file path
+        memory_budget_mb: Largest full decode allowed for formats that
+            cannot be read tile by tile
+
+    Returns:
+        ArrayReader: Reader exposing width, height and read(y0, y1, x0, x1)
+
+    Raises:
+        MemoryError: If the image can only be decoded whole and that would
+            exceed memory_budget_mb
+    """
+    missing = None
+    if path.lower().endswith((".tif", ".tiff")):
+        try:
+            import tifffile
+        except ImportError:
+            tifffile = None
+            missing = "tifffile"
+
+        if tifffile is not None:
+            try:
+                return ArrayReader(tifffile.memmap(path, mode="r"))
+            except ValueError:
+                # Compressed or non-contiguous data cannot be memory-mapped
+                pass
+            try:
+                import zarr
+                store = tifffile.imread(path, aszarr=True)
+                return ArrayReader(zarr.open(store, mode="r"))
+            except ImportError:
+                missing = "zarr"
+
+    width, height = image_size(path)
+    needed_mb = width * height * _BYTES_PER_DECODED_PIXEL / (1024 * 1024)
+    if needed_mb > memory_budget_mb:
+        hint = f"install {missing} to read it in tiles" if missing else "convert it to TIFF to read it in tiles"
+        raise MemoryError(
+            f"{path} ({width}x{height}) needs {needed_mb:.0f} MB to decode whole, over the "
+            f"{memory_budget_mb} MB budget; {hint}"
+        )
+    # cv2.imread already returns BGR
+    return ArrayReader(load_image(path), bgr=True)
+
+
+def image_size(path):
+    """
+    Return (width, height) of an image without decoding its pixels.
+
+    Args:
+        path: Image file path
+
+    Returns:
+        tuple: (width, height)
+    """
+    if is_dicom(path):
+        header = DicomFile(path)
+        return header.columns, header.rows
+
+    if path.lower().endswith((".tif", ".tiff")):
+        try:
+            import tifffile
+            with tifffile.TiffFile(path) as tif:
+                shape = tif.series[0].shape
+                if len(shape) == 3 and shape[0] in (3, 4) and shape[2] not in (3, 4):
+                    return shape[2], shape[1]
+                return shape[1], shape[0]
+        except ImportError:
+            pass
+
+    from PIL import Image
+
+    # Image.open only parses the header until pixels are accessed. Its
+    # decompression-bomb check would reject exactly the images this module
+    # is for, so it is lifted for the probe
+    with _pil_limit_lock:
+        max_pixels = Image.MAX_IMAGE_PIXELS
+        Image.MAX_IMAGE_PIXELS = None
+        try:
+            with Image.open(path) as img:
+                return img.size
+        finally:
+            Image.MAX_IMAGE_PIXELS = max_pixels
+
+
+_pil_limit_lock = threading.Lock()
+
+
+def is_large_image(path, max_pixels=LARGE_IMAGE_PIXELS):
+    """Return True if an image should go through the tiled path."""
+    width, height = image_size(path)
+    return width * height > max_pixels
+
+
+def plan_tiles(memory_budget_mb=TILE_MEMORY_BUDGET_MB, overlap=TILE_OVERLAP, max_tile_size=TILE_SIZE):
+    """
+    Choose the largest tile size that fits the memory budget.
+
+    Returns:
+        int: Tile side length in pixels, excluding overlap
+    """
+    budget = memory_budget_mb * 1024 * 1024
+    side = int((budget / _BYTES_PER_TILE_PIXEL) ** 0.5) - 2 * overlap
+    return max(256, min(max_tile_size, side))
+
+
+def iter_tiles(width, height, tile_size, overlap):
+    """
+    Yield tile boxes covering an image.
+
+    Yields:
+        tuple: (outer, inner) boxes as (x0, y0, x1, y1); outer includes the
+            overlap margin that is read and processed, inner is the part
+            the tile is responsible for
+    """
+    for y in range(0, height, tile_size):
+        for x in range(0, width, tile_size):
+            inner = (x, y, min(x + tile_size, width), min(y + tile_size, height))
+            outer = (
+                max(0, inner[0] - overlap),
+                max(0, inner[1] - overlap),
+                min(width, inner[2] + overlap),
+                min(height, inner[3] + overlap),
+            )
+            yield outer, inner
+
+
+def build_overview(reader, max_dimension=1024, tile_size=TILE_SIZE):
+    """
+    Downscale a large image tile by tile without loading it whole.
+
+    Returns:
+        numpy.ndarray: BGR overview whose longest side is max_dimension
+    """
+    scale = min(1.0, max_dimension / max(reader.width, reader.height))
+    overview = np.zeros((max(1, round(reader.height * scale)), max(1, round(reader.width * scale)), 3), dtype=np.uint8)
+    for _, (x0, y0, x1, y1) in iter_tiles(reader.width, reader.height, tile_size, 0):
+        _paste_scaled(overview, reader.read(y0, y1, x0, x1), (x0, y0, x1, y1), scale)
+    return overview
+
+
+def _paste_scaled(canvas, tile, box, scale):
+    x0, y0, x1, y1 = box
+    cx0, cy0 = round(x0 * scale), round(y0 * scale)
+    cx1, cy1 = max(cx0 + 1, round(x1 * scale)), max(cy0 + 1, round(y1 * scale))
+    cx1, cy1 = min(cx1, canvas.shape[1]), min(cy1, canvas.shape[0])
+    if cx1 > cx0 and cy1 > cy0:
+        canvas[cy0:cy1, cx0:cx1] = cv2.resize(tile, (cx1 - cx0, cy1 - cy0), interpolation=cv2.INTER_AREA)
+
+
+class GlobalClahe:
+    """
+    CLAHE whose statistics come from the whole image rather than one tile.
+
+    OpenCV's CLAHE lays its own grid over whatever it is given, so running
+    it per tile gives every tile a different grid and visible seams. Here
+    the clipped histograms of one image-wide grid are gathered tile by tile
+    (add), and apply() maps any region by bilinear interpolation between
+    the neighbouring cells' lookup tables, so a tile gets exactly the
+    pixels a whole-image pass would give it.
+    """
+
+    def __init__(self, width, height, clip_limit=3.0, tile_grid_size=(8, 8)):
+        self.width, self.height = width, height
+        self.clip_limit = clip_limit
+        self.grid_x, self.grid_y = tile_grid_size
+        self.luts = None
+        self._hist = np.zeros(self.grid_y * self.grid_x * 256, dtype=np.int64)
+
+    def add(self, tile, box):
+        """Count the lightness histogram of a BGR tile covering box (x0, y0, x1, y1)."""
+        x0, y0, x1, y1 = box
+        lightness = cv2.cvtColor(tile, cv2.COLOR_BGR2LAB)[:, :, 0].astype(np.int32)
+        rows = (np.arange(y0, y1) * self.grid_y // self.height).astype(np.int32)
+        cols = (np.arange(x0, x1) * self.grid_x // self.width).astype(np.int32)
+        cells = rows[:, None] * self.grid_x + cols[None, :]
+        self._hist += np.bincount((cells * 256 + lightness).ravel(), minlength=self._hist.size)
+
+    def finish(self):
+        """Turn the gathered histograms into per-cell lookup tables."""
+        hist = self._hist.reshape(self.grid_y * self.grid_x, 256).astype(np.float64)
+        cell_pixels = np.maximum(hist.sum(axis=1, keepdims=True), 1)
+        # Clip as OpenCV does and spread the excess evenly over all bins
+        clip = np.maximum(self.clip_limit * cell_pixels / 256, 1)
+        excess = np.maximum(hist - clip, 0).sum(axis=1, keepdims=True)
+        hist = np.minimum(hist, clip) + excess / 256
+        luts = np.rint(np.cumsum(hist, axis=1) * 255 / cell_pixels)
+        self.luts = np.clip(luts, 0, 255).astype(np.float32).reshape(self.grid_y, self.grid_x, 256)
+        return self
+
+    def apply(self, tile, box):
+        """Return a BGR tile covering box with its lightness equalized."""
+        x0, y0, x1, y1 = box
+        lab = cv2.cvtColor(tile, cv2.COLOR_BGR2LAB)
+        lightness = lab[:, :, 0]
+        top, bottom, y_weight = self._neighbours(y0, y1, self.height, self.grid_y)
+        left, right, x_weight = self._neighbours(x0, x1, self.width, self.grid_x)
+        top, bottom, y_weight = top[:, None], bottom[:, None], y_weight[:, None]
+
+        upper = self.luts[top, left, lightness] * (1 - x_weight) + self.luts[top, right, lightness] * x_weight
+        lower = self.luts[bottom, left, lightness] * (1 - x_weight) + self.luts[bottom, right, lightness] * x_weight
+        lab[:, :, 0] = np.rint(upper * (1 - y_weight) + lower * y_weight)
+        return cv2.cvtColor(lab, cv2.COLOR_LAB2BGR)
+
+    @staticmethod
+    def _neighbours(start, stop, size, cells):
+        # Cells whose centres bracket each pixel, and the weight of the second
+        position = (np.arange(start, stop, dtype=np.float32) + 0.5) * cells / size - 0.5
+        first = np.floor(position)
+        weight = position - first
+        first = first.astype(np.intp)
+        return np.clip(first, 0, cells - 1), np.clip(first + 1, 0, cells - 1), weight
+
+
+def process_tiled(source, classifier=None, memory_budget_mb=TILE_MEMORY_BUDGET_MB, overlap=TILE_OVERLAP,
+                  overview_size=1024, batch_size=BATCH_MAX_SIZE, output_path=None):
+    """
+    Enhance and analyse a very large image one tile at a time.
+
+    Args:
+        source: Image file path, or an ArrayReader
+        classifier: Optional ImageClassifier; without it only enhancement runs
+        memory_budget_mb: Upper bound on memory used for tile processing
+        overlap: Pixels read around each tile and discarded after enhancement
+        overview_size: Longest side of the returned overview image
+        batch_size: Tiles per classifier forward pass
+        output_path: Optional .npy path to write the full-resolution
+            enhanced image to, as a memory-mapped array
+
+    Returns:
+        dict: "overview" (enhanced BGR image at overview_size), "scale"
+            (overview pixels per source pixel), "size" (source width,
+            height) and, with a classifier, "cv_results" with regions in
+            source coordinates
+    """
+    from models.localization import heatmap_to_regions
+
+    reader = open_tiled(source) if isinstance(source, str) else source
+    width, height = reader.width, reader.height
+    tile_size = plan_tiles(memory_budget_mb, overlap)
+
+    # No downscaling inside the pipeline; tiles are enhanced at full
+    # resolution, with CLAHE done image-wide instead of per tile
+    pipeline = PreprocessingPipeline(max_dimension=tile_size + 2 * overlap, enhance_contrast=False)
+    clahe = None
+    if ENHANCE_CONTRAST:
+        clahe = GlobalClahe(width, height, pipeline.clip_limit, pipeline.tile_grid_size)
+        for _, box in iter_tiles(width, height, tile_size, 0):
+            x0, y0, x1, y1 = box
+            clahe.add(reader.read(y0, y1, x0, x1), box)
+        clahe.finish()
+
+    scale = min(1.0, overview_size / max(width, height))
+    overview = np.zeros((max(1, round(height * scale)), max(1, round(width * scale)), 3), dtype=np.uint8)
+
+    output = None
+    if output_path is not None:
+        output = np.lib.format.open_memmap(output_path, mode="w+", dtype=np.uint8, shape=(height, width, 3))
+
+    heat_scale = _HEATMAP_SIZE / max(width, height)
+    heatmap = np.zeros((max(1, round(height * heat_scale)), max(1, round(width * heat_scale))), dtype=np.float32)
+    best = {"has_anomaly": False, "confidence": 0.0, "class_index": None, "normal_confidence": None}
+    tile_count = 0
+    pending = []
+
+    def classify(pending):
+        results = classifier.detect_anomalies_batch([small for small, _, _ in pending])
+        for (_, outer, inner), result in zip(pending, results):
+            # An anomalous tile outranks any other; the image is only as
+            # normal as its least normal tile
+            if (result["has_anomaly"], result["confidence"]) > (best["has_anomaly"], best["confidence"]):
+                best.update(has_anomaly=result["has_anomaly"], confidence=result["confidence"],
+                            class_index=result.get("class_index"))
+            if "normal_confidence" in result and (best["normal_confidence"] is None
+                                                  or result["normal_confidence"] < best["normal_confidence"]):
+                best["normal_confidence"] = result["normal_confidence"]
+            if result.get("heatmap") is not None:
+                _stitch_heatmap(heatmap, np.asarray(result["heatmap"], dtype=np.float32) * result["confidence"],
+                                outer, inner, heat_scale)
+
+    for outer, inner in iter_tiles(width, height, tile_size, overlap):
+        ox0, oy0, ox1, oy1 = outer
+        tile = reader.read(oy0, oy1, ox0, ox1)
+        if clahe is not None:
+            tile = clahe.apply(tile, outer)
+        enhanced = pipeline(tile)
+
+        # Keep only the part this tile owns; the overlap gives the blur
+        # and the classifier context across the tile edge
+        x0, y0, x1, y1 = inner
+        core = enhanced[y0 - oy0:y1 - oy0, x0 - ox0:x1 - ox0]
+        _paste_scaled(overview, core, inner, scale)
+        if output is not None:
+            output[y0:y1, x0:x1] = core
+
+        if classifier is not None:
+            pending.append((cv2.resize(enhanced, (224, 224), interpolation=cv2.INTER_AREA), outer, inner))
+            if len(pending) >= batch_size:
+                classify(pending)
+                pending = []
+        tile_count += 1
+
+    if classifier is not None and pending:
+        classify(pending)
+    if output is not None:
+        output.flush()
+        del output
+
+    result = {"overview": overview, "scale": scale, "size": (width, height), "tiles": tile_count}
+    if classifier is not None:
+        peak = heatmap.max()
+        if peak > 0:
+            heatmap /= peak
+        small_scale = _RESULT_HEATMAP_SIZE / max(heatmap.shape)
+        small_heatmap = cv2.resize(
+            heatmap,
+            (max(1, round(heatmap.shape[1] * small_scale)), max(1, round(heatmap.shape[0] * small_scale))),
+            interpolation=cv2.INTER_AREA
+        )
+        result["cv_results"] = {
+            "has_anomaly": best["has_anomaly"],
+            "confidence": best["confidence"],
+            "class_index": best["class_index"],
+            "regions": heatmap_to_regions(heatmap, (width, height)) if peak > 0 else [],
+            "heatmap": np.round(small_heatmap, 4).tolist()
+        }
+        if best["normal_confidence"] is not None:
+            result["cv_results"]["normal_confidence"] = best["normal_confidence"]
+    return result
+
+
+def _stitch_heatmap(heatmap, tile_heatmap, outer, inner, heat_scale):
+    # Resize the tile's map to its full footprint, then keep the owned part
+    ox0, oy0, ox1, oy1 = [round(v * heat_scale) for v in outer]
+    ix0, iy0, ix1, iy1 = [round(v * heat_scale) for v in inner]
+    ix1, iy1 = min(max(ix1, ix0 + 1), heatmap.shape[1]), min(max(iy1, iy0 + 1), heatmap.shape[0])
+    ox1, oy1 = max(ox1, ix1), max(oy1, iy1)
+    footprint = cv2.resize(tile_heatmap, (ox1 - ox0, oy1 - oy0), interpolation=cv2.INTER_LINEAR)
+    core = footprint[iy0 - oy0:iy1 - oy0, ix0 - ox0:ix1 - ox0]
+    target = heatmap[iy0:iy1, ix0:ix1]
+    np.maximum(target, core[:target.shape[0], :target.shape[1]], out=target)